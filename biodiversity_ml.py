@@ -8,15 +8,33 @@ from sklearn.metrics import classification_report
 import requests
 import json
 import os
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import folium
 from folium.plugins import MarkerCluster, HeatMap
 import branca.colormap as cm
+from utils.data_manager import DataManager
+from utils.region_registry import get_region_registry
+from utils.coordinate_quality import clean_mask
 
 warnings.filterwarnings('ignore')
 
 
 class BiodiversityML:
+    # Группы признаков по классам: подстрока названия класса (без учета регистра) -> группа;
+    # классы, не попавшие ни в одну группу, и записи без класса - "other"
+    CLASS_FEATURE_GROUPS = (
+        ('mammalia', 'mammal'),
+        ('aves', 'bird'),
+        ('reptilia', 'reptile'),
+        ('amphibia', 'amphibian'),
+        ('actinopterygii', 'fish'),
+        ('chondrichthyes', 'fish'),
+        ('insecta', 'insect'),
+    )
+    FEATURE_GROUPS = ('mammal', 'bird', 'reptile', 'amphibian', 'fish', 'insect', 'other')
+
     def __init__(self):
         self.base_path = "data"
         self.regions_path = os.path.join(self.base_path, "regions")
@@ -25,6 +43,10 @@ class BiodiversityML:
         self.features = None
         self.target = None
         self.model = None
+        self.data_manager = None
+        self.region_registry = get_region_registry()
+        self.region_timings = {}
+        self.region_errors = {}
 
     def load_regions_from_config(self):
         """Загружает список регионов из конфигурационных файлов"""
@@ -35,14 +57,16 @@ class BiodiversityML:
 
         regions = {}
 
-        # Загружаем regions_keys.json
+        # Загружаем regions_keys.json (ключи приводим к английскому названию из справочника - без дублей)
         try:
             with open(regions_keys_path, 'r', encoding='utf-8') as f:
                 regions_data = json.load(f)
-                for region_en, region_info in regions_data.get('regions', {}).items():
+                for region_key, region_info in regions_data.get('regions', {}).items():
+                    region = self.region_registry.get(region_key)
+                    region_en = region['name_en'] if region else region_key
                     regions[region_en] = {
-                        'name_ru': region_info.get('name_ru', region_en),
-                        'data_file': region_info.get('data_file'),
+                        'name_ru': region['name_ru'] if region else region_info.get('name_ru', region_key),
+                        'data_file': region['data_file'] if region else region_info.get('data_file'),
                         'last_updated': region_info.get('last_updated')
                     }
             print(f"Загружено {len(regions)} регионов из regions_keys.json")
@@ -57,16 +81,14 @@ class BiodiversityML:
                 coordinates_cache = coords_data.get('coordinates_cache', {})
 
                 for coord_key, coord_info in coordinates_cache.items():
-                    region_name_ru = coord_info.get('region_name_ru')
-                    # Находим регион по русскому названию
-                    for region_en, region_data in regions.items():
-                        if region_data['name_ru'] == region_name_ru:
-                            # Извлекаем координаты из ключа
-                            lat_lon = coord_key.split('_')
-                            if len(lat_lon) == 2:
-                                regions[region_en]['latitude'] = float(lat_lon[0])
-                                regions[region_en]['longitude'] = float(lat_lon[1])
-                            break
+                    # Находим регион по русскому названию через справочник
+                    region_en = self.region_registry.name_en(coord_info.get('region_name_ru'))
+                    if region_en in regions:
+                        # Извлекаем координаты из ключа
+                        lat_lon = coord_key.split('_')
+                        if len(lat_lon) == 2:
+                            regions[region_en]['latitude'] = float(lat_lon[0])
+                            regions[region_en]['longitude'] = float(lat_lon[1])
             print("Координаты регионов загружены")
         except Exception as e:
             print(f"Ошибка загрузки координат: {e}")
@@ -91,14 +113,14 @@ class BiodiversityML:
 
             print(f"Загружено {len(animals_data)} животных из {data_file}")
 
-            # Извлекаем координаты из данных животных (берем средние координаты)
+            # Извлекаем координаты из данных животных (берем средние координаты только чистых точек:
+            # без пустых, (0, 0), вне России и региона, с большой погрешностью)
             latitudes = []
             longitudes = []
 
-            for animal in animals_data:
-                if 'decimalLatitude' in animal and animal['decimalLatitude'] is not None:
+            for animal, clean in zip(animals_data, clean_mask(animals_data)):
+                if clean:
                     latitudes.append(animal['decimalLatitude'])
-                if 'decimalLongitude' in animal and animal['decimalLongitude'] is not None:
                     longitudes.append(animal['decimalLongitude'])
 
             # Вычисляем средние координаты региона
@@ -116,34 +138,49 @@ class BiodiversityML:
         if not animals_data:
             return {}
 
-        df_animals = pd.DataFrame(animals_data)
-
-        # Реальное распределение классов из данных
-        class_distribution = df_animals['class'].value_counts()
         total_animals = len(animals_data)
-
-        # Основные классы животных (используем фактические данные)
-        mammal_species = len(
-            df_animals[df_animals['class'].str.contains('Mammalia', na=False, case=False)]['scientific_name'].unique())
-        bird_species = len(
-            df_animals[df_animals['class'].str.contains('Aves', na=False, case=False)]['scientific_name'].unique())
-        reptile_species = len(
-            df_animals[df_animals['class'].str.contains('Reptilia', na=False, case=False)]['scientific_name'].unique())
-        amphibian_species = len(
-            df_animals[df_animals['class'].str.contains('Amphibia', na=False, case=False)]['scientific_name'].unique())
-        fish_species = len(
-            df_animals[df_animals['class'].str.contains('Actinopterygii|Chondrichthyes', na=False, case=False)][
-                'scientific_name'].unique())
-        insect_species = len(
-            df_animals[df_animals['class'].str.contains('Insecta', na=False, case=False)]['scientific_name'].unique())
-
-        # Другие классы
-        other_species = len(df_animals[~df_animals['class'].str.contains(
-            'Mammalia|Aves|Reptilia|Amphibia|Actinopterygii|Chondrichthyes|Insecta', na=False, case=False)][
-                                'scientific_name'].unique())
-
-        # Общее количество уникальных видов
-        total_unique_species = df_animals['scientific_name'].nunique()
+        groups = self.FEATURE_GROUPS
+        other = groups.index('other')
+
+        # Классы - категориальный столбец (порядок категорий - порядок первого появления, как в value_counts),
+        # названия видов - коды, пустое название - отдельный код (как раньше в unique())
+        class_codes, class_names = pd.factorize(pd.Series([animal.get('class') for animal in animals_data],
+                                                          dtype=object))
+        classes = pd.Categorical.from_codes(class_codes, categories=class_names)
+        species_codes, species_names = pd.factorize(
+            pd.Series([animal.get('scientific_name') for animal in animals_data], dtype=object),
+            use_na_sentinel=False)
+        species_is_na = pd.isna(species_names)
+        n_classes, n_species = len(classes.categories), max(len(species_names), 1)
+
+        # Таблица класс -> группы признаков: подстрока без учета регистра проверяется один раз на категорию;
+        # последняя строка - записи без класса (попадают в "другие")
+        membership = np.zeros((n_classes + 1, len(groups)), dtype=bool)
+        for row, class_name in enumerate(classes.categories):
+            class_name = str(class_name).lower()
+            for pattern, group in self.CLASS_FEATURE_GROUPS:
+                if pattern in class_name:
+                    membership[row, groups.index(group)] = True
+        membership[:, other] = ~membership.any(axis=1)
+
+        # Одна группировка: уникальные пары класс-вид -> уникальные пары группа-вид -> число видов в группе
+        pairs = np.unique(np.where(classes.codes < 0, n_classes, classes.codes).astype(np.int64) * n_species +
+                          species_codes)
+        pair_classes, pair_species = np.divmod(pairs, n_species)
+        pair_index, group_index = np.nonzero(membership[pair_classes])
+        group_pairs = np.unique(group_index * n_species + pair_species[pair_index])
+        group_species = np.bincount(group_pairs // n_species, minlength=len(groups))
+        mammal_species, bird_species, reptile_species, amphibian_species, fish_species, insect_species, \
+            other_species = group_species.tolist()
+
+        # Реальное распределение классов (по убыванию, при равенстве - по порядку появления)
+        class_counts = np.bincount(classes.codes[classes.codes >= 0], minlength=n_classes)
+        order = np.argsort(-class_counts, kind='stable')
+        class_distribution = pd.Series(class_counts[order], index=classes.categories[order], dtype=np.int64)
+
+        # Число находок каждого вида (без пустых названий) и общее количество уникальных видов
+        species_counts = np.bincount(species_codes, minlength=len(species_names))[~species_is_na]
+        total_unique_species = len(species_counts)
 
         # Анализ временного распределения из statistics
         records_by_year = statistics.get('records_by_year', {})
@@ -178,8 +215,7 @@ class BiodiversityML:
             stats['dominant_class_ratio'] = 0
 
         # Доля редких видов (встречаются 1 раз)
-        species_counts = df_animals['scientific_name'].value_counts()
-        rare_species = len(species_counts[species_counts == 1])
+        rare_species = int(np.count_nonzero(species_counts == 1))
         stats['rare_species_ratio'] = rare_species / len(species_counts) if len(species_counts) > 0 else 0
 
         # Процентное распределение по основным классам
@@ -235,70 +271,39 @@ class BiodiversityML:
         proportions = distribution / distribution.sum()
         return -np.sum(proportions * np.log(proportions + 1e-10))
 
-    def collect_regional_data(self, use_api=False):
-        """Собирает данные по всем регионам для ML анализа"""
+    def collect_regional_data(self, use_api=False, workers=1):
+        """Собирает данные по всем регионам для ML анализа.
+
+        workers > 1 - файлы регионов обрабатываются в пуле процессов (None - по числу ядер); результат тот же.
+        Время обработки каждого региона - в self.region_timings, ошибки - в self.region_errors.
+        """
         print("Сбор данных по регионам")
 
-        all_regions_data = []
         regions = self.load_regions_from_config()
-        processed_regions = set()  # Для отслеживания уже обработанных регионов
 
         if not regions:
             print("Не удалось загрузить список регионов")
             return pd.DataFrame()
 
-        for region_en, region_info in regions.items():
-            # Пропускаем дубликаты
-            if region_en in processed_regions:
-                print(f"Пропускаем дубликат региона: {region_info.get('name_ru', region_en)}")
-                continue
-
-            print(f"Обрабатываем регион: {region_info.get('name_ru', region_en)}")
-            processed_regions.add(region_en)
-
-            animals_data = []
-            statistics = {}
-            metadata = {}
-            region_lat = region_info.get('latitude')
-            region_lon = region_info.get('longitude')
-
-            if use_api:
-                # Используем API для получения данных
-                animals_data = self.fetch_region_data_from_api(region_en, region_info['name_ru'])
-            else:
-                # Используем локальные файлы с латинскими названиями
-                data_file = region_info.get('data_file')
-                if data_file and os.path.exists(os.path.join(self.regions_path, data_file)):
-                    animals_data, statistics, metadata, file_lat, file_lon = self.get_real_region_data(region_en,
-                                                                                                       data_file)
-
-                    # Используем координаты из файла, если они есть
-                    if file_lat is not None and file_lon is not None:
-                        region_lat = file_lat
-                        region_lon = file_lon
-                        print(f"  Координаты из файла: {region_lat:.4f}, {region_lon:.4f}")
-                    else:
-                        print(f"  Координаты не найдены в файле, используем из конфига")
-                else:
-                    print(f"Файл {data_file} не найден для региона {region_en}")
-
-            if not animals_data:
-                print(f"Нет данных для региона {region_en}")
-                continue
-
-            # Анализируем биоразнообразие региона на основе реальных данных
-            biodiversity_stats = self._analyze_region_biodiversity(animals_data, statistics, metadata)
-
-            # Добавляем информацию о регионе
-            region_record = {
-                'region_name': region_en,
-                'region_name_ru': region_info.get('name_ru', region_en),
-                'latitude': region_lat,
-                'longitude': region_lon,
-                **biodiversity_stats
-            }
+        # Регионы уже без дублей: ключи - английские названия из справочника
+        tasks = list(regions.items())
+        workers = workers or os.cpu_count() or 1
+        # Запросы к API выполняются последовательно - у GBIF свой лимит запросов
+        if use_api or workers <= 1 or len(tasks) < 2:
+            results = [self._process_region_timed(region_en, region_info, use_api) for region_en, region_info in tasks]
+        else:
+            results = self._process_regions_parallel(tasks, min(workers, len(tasks)))
 
-            all_regions_data.append(region_record)
+        all_regions_data = []
+        self.region_timings = {}
+        self.region_errors = {}
+        for (region_en, _), (region_record, elapsed, error) in zip(tasks, results):
+            self.region_timings[region_en] = elapsed
+            if error:
+                self.region_errors[region_en] = error
+                print(f"❌ Ошибка обработки региона {region_en}: {error}")
+            elif region_record is not None:
+                all_regions_data.append(region_record)
 
         self.df = pd.DataFrame(all_regions_data)
 
@@ -307,9 +312,94 @@ class BiodiversityML:
             return pd.DataFrame()
         else:
             print(f"Собраны реальные данные по {len(self.df)} регионам")
+            slowest = sorted(self.region_timings.items(), key=lambda item: -item[1])[:3]
+            print(f"⏱️ Время обработки: всего {sum(self.region_timings.values()):.2f} с, дольше всего: "
+                  f"{', '.join(f'{region_en} {elapsed:.2f} с' for region_en, elapsed in slowest)}")
 
         return self.df
 
+    def _worker_settings(self):
+        """Пути, с которыми анализатор в процессе пула должен читать данные (как у текущего)"""
+        return {
+            'base_path': self.base_path,
+            'regions_path': self.regions_path,
+            'config_path': self.config_path
+        }
+
+    def _process_regions_parallel(self, tasks, workers):
+        """Обрабатывает регионы в пуле процессов; результаты - в порядке tasks"""
+        print(f"⚙️ Обработка {len(tasks)} регионов в {workers} процессах")
+        results = [None] * len(tasks)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            settings = self._worker_settings()
+            futures = {executor.submit(_process_region_worker, region_en, region_info, settings): position
+                       for position, (region_en, region_info) in enumerate(tasks)}
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    results[position] = future.result()
+                except Exception as e:
+                    # Процесс обработчика упал целиком - остальные регионы не теряем
+                    results[position] = (None, 0.0, f"{type(e).__name__}: {e}")
+        return results
+
+    def _process_region_timed(self, region_en, region_info, use_api=False):
+        """Обрабатывает один регион: (запись региона или None, время в секундах, текст ошибки или None)"""
+        started = time.perf_counter()
+        try:
+            region_record = self._process_region(region_en, region_info, use_api)
+            error = None
+        except Exception as e:
+            # Ошибка в одном файле не прерывает сбор по остальным регионам
+            region_record, error = None, f"{type(e).__name__}: {e}"
+        return region_record, time.perf_counter() - started, error
+
+    def _process_region(self, region_en, region_info, use_api=False):
+        """Загружает данные региона и считает признаки биоразнообразия (None - нет данных)"""
+        print(f"Обрабатываем регион: {region_info.get('name_ru', region_en)}")
+
+        animals_data = []
+        statistics = {}
+        metadata = {}
+        region_lat = region_info.get('latitude')
+        region_lon = region_info.get('longitude')
+
+        if use_api:
+            # Используем API для получения данных
+            animals_data = self.fetch_region_data_from_api(region_en, region_info['name_ru'])
+        else:
+            # Используем локальные файлы с латинскими названиями
+            data_file = region_info.get('data_file')
+            if data_file and os.path.exists(os.path.join(self.regions_path, data_file)):
+                animals_data, statistics, metadata, file_lat, file_lon = self.get_real_region_data(region_en,
+                                                                                                   data_file)
+
+                # Используем координаты из файла, если они есть
+                if file_lat is not None and file_lon is not None:
+                    region_lat = file_lat
+                    region_lon = file_lon
+                    print(f"  Координаты из файла: {region_lat:.4f}, {region_lon:.4f}")
+                else:
+                    print(f"  Координаты не найдены в файле, используем из конфига")
+            else:
+                print(f"Файл {data_file} не найден для региона {region_en}")
+
+        if not animals_data:
+            print(f"Нет данных для региона {region_en}")
+            return None
+
+        # Анализируем биоразнообразие региона на основе реальных данных
+        biodiversity_stats = self._analyze_region_biodiversity(animals_data, statistics, metadata)
+
+        # Добавляем информацию о регионе
+        return {
+            'region_name': region_en,
+            'region_name_ru': region_info.get('name_ru', region_en),
+            'latitude': region_lat,
+            'longitude': region_lon,
+            **biodiversity_stats
+        }
+
     def _add_default_coordinates(self):
         """Добавляет координаты по умолчанию для регионов без координат"""
         if self.df is None or len(self.df) == 0:
@@ -317,26 +407,14 @@ class BiodiversityML:
 
         df_clean = self.df.copy()
 
-        # Координаты по умолчанию для основных регионов России
-        default_coords = {
-            'Amur': (53.0, 127.0),
-            'Krasnodar': (45.0355, 38.9755),
-            'Altai': (50.0, 86.0),
-            'Altai Krai': (52.0, 83.0),
-            'Buryatia': (52.0, 107.0),
-            'Khabarovsk': (48.5, 135.0),
-            'Primorsky': (43.0, 132.0),
-            'Sakhalin': (50.0, 143.0),
-            'Kamchatka': (56.0, 159.0),
-            'Magadan': (60.0, 151.0)
-        }
-
         for idx, row in df_clean.iterrows():
             if pd.isna(row['latitude']) or pd.isna(row['longitude']):
                 region_name = row['region_name']
-                if region_name in default_coords:
-                    df_clean.at[idx, 'latitude'] = default_coords[region_name][0]
-                    df_clean.at[idx, 'longitude'] = default_coords[region_name][1]
+                region = self.region_registry.get(region_name)
+                if region and region['centroid']:
+                    # Координаты по умолчанию - центр региона из справочника
+                    df_clean.at[idx, 'latitude'] = region['centroid'][0]
+                    df_clean.at[idx, 'longitude'] = region['centroid'][1]
                     print(f"  Добавлены координаты по умолчанию для {region_name}")
                 else:
                     # Удаляем регионы без координат
@@ -632,8 +710,107 @@ class BiodiversityML:
         for _, row in top_factors.iterrows():
             print(f"   • {row['feature']}: {row['importance']:.3f}")
 
-    def create_biodiversity_map(self, save_path="biodiversity_map.html"):
-        """Создает интерактивную карту биоразнообразия регионов"""
+    def get_grid_cells(self, min_lat=-90, min_lon=-180, max_lat=90, max_lon=190, zoom=5, resolution=None):
+        """Ячейки сетки биоразнообразия по сохраненным находкам (записи, виды, индекс Шеннона, классы)"""
+        if self.data_manager is None:
+            self.data_manager = DataManager(self.base_path, use_nominatim=False)
+        cells = self.data_manager.get_grid_cells(min_lat, min_lon, max_lat, max_lon, zoom=zoom,
+                                                 resolution=resolution)
+        return pd.DataFrame(cells)
+
+    def get_species_ranges(self, species_keys, method='convex', alpha_km=None):
+        """Сравнение ареалов видов по сохраненным находкам (площадь, крайние точки, регионы)"""
+        if self.data_manager is None:
+            self.data_manager = DataManager(self.base_path, use_nominatim=False)
+        return pd.DataFrame(self.data_manager.compare_species_ranges(species_keys, method, alpha_km))
+
+    def _add_range_layer(self, biodiversity_map, species_keys, method='convex', alpha_km=None):
+        """Добавляет на карту ареалы видов - по слою на вид"""
+        if self.data_manager is None:
+            self.data_manager = DataManager(self.base_path, use_nominatim=False)
+
+        colors = ['#e41a1c', '#377eb8', '#4daf4a', '#984ea3', '#ff7f00', '#a65628']
+        added = 0
+        for number, species_key in enumerate(species_keys):
+            species_range = self.data_manager.get_species_range(species_key, method, alpha_km)
+            if species_range is None:
+                print(f"⚠️ Нет находок вида {species_key} для построения ареала")
+                continue
+
+            color = colors[number % len(colors)]
+            popup_text = f"""
+            <b>{species_range['canonical_name']}</b><br>
+            Площадь ареала: {species_range['area_km2']:,.0f} км²<br>
+            Находок: {species_range['count']}<br>
+            Регионов: {len(species_range['regions'])}
+            """
+            layer = folium.FeatureGroup(name=f"Ареал: {species_range['canonical_name']}")
+            for polygon in species_range['polygons']:
+                # Многоугольник из одной-двух точек рисуем маркером - оболочка вырождена
+                if len(polygon[0]) < 3:
+                    folium.CircleMarker(location=polygon[0][0], radius=6, color=color, fill=True,
+                                        popup=folium.Popup(popup_text, max_width=250)).add_to(layer)
+                    continue
+                folium.Polygon(
+                    locations=polygon,
+                    popup=folium.Popup(popup_text, max_width=250),
+                    color=color,
+                    weight=2,
+                    fill=True,
+                    fillColor=color,
+                    fillOpacity=0.2,
+                    tooltip=species_range['canonical_name']
+                ).add_to(layer)
+            layer.add_to(biodiversity_map)
+            added += 1
+
+        if added:
+            print(f"✅ Добавлено ареалов: {added}")
+
+    def _add_grid_layer(self, biodiversity_map, zoom=5):
+        """Добавляет на карту слой ячеек сетки, окрашенных по числу видов"""
+        cells = self.get_grid_cells(zoom=zoom)
+        if len(cells) == 0:
+            print("⚠️ Нет данных для сетки биоразнообразия")
+            return
+
+        grid = self.data_manager.get_species_grid(sync=False)
+        resolution = cells['resolution'].iloc[0]
+        grid_colormap = cm.LinearColormap(
+            colors=['#edf8e9', '#bae4b3', '#74c476', '#31a354', '#006d2c'],
+            vmin=cells['species'].min(),
+            vmax=cells['species'].max(),
+            caption=f'Видов в ячейке ({resolution}°)'
+        )
+
+        layer = folium.FeatureGroup(name=f"Сетка видов ({resolution}°)")
+        for _, cell in cells.iterrows():
+            top_classes = sorted(cell['classes'].items(), key=lambda item: -item[1])[:3]
+            popup_text = f"""
+            <b>Ячейка {cell['lat']:.2f}, {cell['lon']:.2f}</b><br>
+            Записей: {cell['records']}<br>
+            Видов: {cell['species']}<br>
+            Индекс Шеннона: {cell['shannon']:.2f}<br>
+            {'<br>'.join(f'{class_name}: {count}' for class_name, count in top_classes)}
+            """
+            folium.Polygon(
+                locations=grid.cell_polygon(cell['cell'], resolution),
+                popup=folium.Popup(popup_text, max_width=250),
+                color=grid_colormap(cell['species']),
+                weight=1,
+                fill=True,
+                fillColor=grid_colormap(cell['species']),
+                fillOpacity=0.6,
+                tooltip=f"{cell['species']} видов"
+            ).add_to(layer)
+
+        layer.add_to(biodiversity_map)
+        grid_colormap.add_to(biodiversity_map)
+        print(f"✅ Добавлено {len(cells)} ячеек сетки ({resolution}°)")
+
+    def create_biodiversity_map(self, save_path="biodiversity_map.html", grid_zoom=5, range_species=None,
+                                range_method='convex'):
+        """Создает интерактивную карту биоразнообразия регионов (range_species - ключи видов для слоя ареалов)"""
         print("🗺️ Создание карты биоразнообразия...")
 
         if self.df is None or len(self.df) == 0:
@@ -756,6 +933,19 @@ class BiodiversityML:
         except Exception as e:
             print(f"⚠️ Не удалось создать тепловую карту: {e}")
 
+        # Слой сетки: биоразнообразие внутри регионов, а не одна точка на регион
+        try:
+            self._add_grid_layer(biodiversity_map, zoom=grid_zoom)
+        except Exception as e:
+            print(f"⚠️ Не удалось построить сетку биоразнообразия: {e}")
+
+        if range_species:
+            try:
+                self._add_range_layer(biodiversity_map, range_species, method=range_method)
+            except Exception as e:
+                print(f"⚠️ Не удалось построить ареалы видов: {e}")
+        folium.LayerControl().add_to(biodiversity_map)
+
         # Сохраняем карту
         biodiversity_map.save(save_path)
         print(f"✅ Карта сохранена как: {save_path}")
@@ -815,6 +1005,22 @@ class BiodiversityML:
             print("✅ Карта активности исследований сохранена")
 
 
+# Анализатор в процессе-обработчике пула (создается один раз на процесс)
+_worker_analyzer = None
+_worker_analyzer_settings = None
+
+
+def _process_region_worker(region_en, region_info, settings):
+    """Обработка одного региона в процессе пула (функция модуля - передается в процесс по имени)"""
+    global _worker_analyzer, _worker_analyzer_settings
+    if _worker_analyzer is None or _worker_analyzer_settings != settings:
+        _worker_analyzer = BiodiversityML()
+        for name, value in settings.items():
+            setattr(_worker_analyzer, name, value)
+        _worker_analyzer_settings = dict(settings)
+    return _worker_analyzer._process_region_timed(region_en, region_info)
+
+
 def main():
     """Основная функция с созданием карт"""
     print("ЗАПУСК АНАЛИЗА БИОРАЗНООБРАЗИЯ С КАРТАМИ")
@@ -824,7 +1030,7 @@ def main():
 
     try:
         # 1. Сбор реальных данных из файлов
-        df = ml_analyzer.collect_regional_data(use_api=False)
+        df = ml_analyzer.collect_regional_data(use_api=False, workers=None)
 
         if len(df) == 0:
             print("Не удалось собрать данные. Пробуем использовать API...")
@@ -1,19 +1,31 @@
+import os
 import requests
 import pandas as pd
 from utils.data_manager import DataManager
 from utils.taxonomy_translator import TaxonomyTranslator
 import time
-from utils.russian_animals_db import RussianAnimalsDB
+from utils.name_lookup import get_name_lookup
+from utils.taxonomy_filter import TaxonomyFilter
+from utils.scientific_names import add_name_keys, scientific_name_key
+from utils.metrics import resolution_metrics
 import sys
 import time
 from tqdm import tqdm
 
 class AnimalFinder:
-    def __init__(self):
+    BACKBONE_PATH = os.path.join("data", "backbone", "backbone.sqlite")
+
+    def __init__(self, offline=None):
         self.data_manager = DataManager()
-        self.translator = TaxonomyTranslator()
-        self.animals_db = RussianAnimalsDB()
-        self.common_name_cache = {}
+        # Офлайн-перевод названий только по явному запросу (--offline / ANIMAL_FINDER_OFFLINE=1);
+        # импортированный GBIF Backbone используется и в онлайн-режиме - до обращения к API
+        if offline is None:
+            offline = os.environ.get('ANIMAL_FINDER_OFFLINE', '') not in ('', '0')
+        self.translator = TaxonomyTranslator(backbone_path=self.BACKBONE_PATH, offline=offline)
+        if offline:
+            print("📴 Перевод названий без обращений к API (офлайн-режим)")
+        self.names = get_name_lookup()
+        self.taxonomy_filter = TaxonomyFilter()
 
     def show_all_regions_list(self):
         """Показывает полный список всех регионов России"""
@@ -59,7 +71,7 @@ class AnimalFinder:
             if region_data:
                 region_name_ru = region_info.get('name_ru', region_en)
                 record_count = len(region_data)
-                species_count = len(set([a['scientific_name'] for a in region_data]))
+                species_count = len(self.data_manager.get_species_index(region_en))
 
                 print(f"✅ {region_name_ru:<25} - {record_count:4} записей, {species_count:3} видов")
                 available_with_data.append(region_name_ru)
@@ -93,7 +105,7 @@ class AnimalFinder:
                 df = pd.DataFrame(region_data)
                 region_name = region_info.get('name_ru', region_en)
                 total = len(region_data)
-                species = df['scientific_name'].nunique()
+                species = df['name_key'].nunique()
 
                 # Статистика по классам - безопасный подход
                 class_stats = {}
@@ -135,18 +147,6 @@ class AnimalFinder:
             # Возвращаем регионы, которые мы знаем что работают
             return ["Krasnodar", "Moscow", "Tatarstan", "Amur", "Bryansk", "Nizhny Novgorod"]
 
-    def _get_russian_common_name_cached(self, species_key):
-        """Получает русское название вида с кэшированием"""
-        if not species_key:
-            return 'Не указано'
-
-        if species_key in self.common_name_cache:
-            return self.common_name_cache[species_key]
-
-        common_name = self._get_russian_common_name(species_key)
-        self.common_name_cache[species_key] = common_name
-        return common_name
-
     def analyze_region_improved(self, region_name_ru):
         """Улучшенный анализ региона с группировкой по классам и фильтрацией"""
         animals = self.get_animals_by_region(region_name_ru)
@@ -156,7 +156,8 @@ class AnimalFinder:
             return
 
         # ПРИМЕНЯЕМ ФИЛЬТРАЦИЮ ДО АНАЛИЗА
-        filtered_animals = self.filter_animals_data(animals, min_count=2)
+        filtered_animals = self.filter_animals_data(animals, min_count=2,
+                                                    data_version=self._get_region_data_version(region_name_ru))
 
         if not filtered_animals:
             print(f"🎯 После фильтрации не осталось значимых данных для региона {region_name_ru}")
@@ -170,25 +171,28 @@ class AnimalFinder:
 
         print(f"\n📊 ОБЩАЯ СТАТИСТИКА:")
         print(f"Всего находок: {len(filtered_animals)}")
-        print(f"Уникальных видов: {df['scientific_name'].nunique()}")
+        print(f"Уникальных видов: {df['name_key'].nunique()}")
+
+        # Группировка по классам через индекс видов, построенный по отфильтрованным записям:
+        # счетчики согласованы с числом находок, а виды без записи в индексе файла не теряются
+        species_index = self.data_manager.build_species_index(filtered_animals)
 
-        # Группировка по классам с перечислением видов - безопасный подход
         class_groups = {}
-        for animal in filtered_animals:  # ИСПОЛЬЗУЕМ ОТФИЛЬТРОВАННЫЕ ДАННЫЕ
+        for entry in species_index.values():
             # Используем class_ru если есть, иначе обычный class
-            class_name = animal.get('class_ru')
+            class_name = entry.get('class_ru')
             if not class_name or class_name == 'Не указано':
-                class_name = animal.get('class', 'Не указано')
+                class_name = entry.get('class', 'Не указано')
 
             if class_name not in class_groups:
                 class_groups[class_name] = []
-            class_groups[class_name].append(animal)
+            class_groups[class_name].append((entry['canonical_name'], entry))
 
         # Показываем только значимые классы
         significant_classes = 0
-        for class_name, group_animals in class_groups.items():
-            if class_name and class_name != 'Не указано' and len(group_animals) >= 2:  # Минимум 2 животные в классе
-                class_count = len(group_animals)
+        for class_name, group_species in class_groups.items():
+            class_count = sum(entry['count'] for species, entry in group_species)
+            if class_name and class_name != 'Не указано' and class_count >= 2:  # Минимум 2 животные в классе
                 percentage = (class_count / len(filtered_animals)) * 100
 
                 # Пропускаем неинтересные классы
@@ -199,20 +203,12 @@ class AnimalFinder:
                 significant_classes += 1
 
                 # Топ видов в этом классе
-                species_counts = {}
-                for animal in group_animals:
-                    species = animal['scientific_name']
-                    species_counts[species] = species_counts.get(species, 0) + 1
-
-                top_species = sorted(species_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-
-                for i, (species, count) in enumerate(top_species, 1):
-                    # Находим common_name для этого вида
-                    common_name = next(
-                        (a.get('common_name', 'Не указано') for a in group_animals if a['scientific_name'] == species),
-                        'Не указано')
+                top_species = sorted(group_species, key=lambda x: x[1]['count'], reverse=True)[:5]
+
+                for i, (species, entry) in enumerate(top_species, 1):
+                    common_name = entry.get('common_name', 'Не указано')
                     display_name = common_name if common_name != 'Не указано' else species
-                    print(f"   {i}. {display_name} - {count} находок")
+                    print(f"   {i}. {display_name} - {entry['count']} находок")
 
         if significant_classes == 0:
             print("🎯 Нет значимых классов животных для показа")
@@ -272,6 +268,8 @@ class AnimalFinder:
                 print(f"   🌐 Источник: GBIF")
 
             # Дополнительная информация (только если есть)
+            if animal.get('distance_km') is not None:
+                print(f"   📏 Расстояние: {animal['distance_km']:.1f} км")
             if animal.get('locality') and animal['locality'] != 'Не указано':
                 print(f"   📍 Место: {animal['locality']}")
             if animal.get('eventDate') and animal['eventDate'] != 'Не указано':
@@ -453,6 +451,7 @@ class AnimalFinder:
 
         total_records = len(records)
         print(f"🔍 Анализируем {total_records} записей...")
+        self._prefetch_russian_common_names(records)
 
         # Добавляем прогресс-бар
         for i, record in enumerate(tqdm(records, desc="Обработка записей", unit="rec")):
@@ -489,7 +488,7 @@ class AnimalFinder:
             species_key = record.get('speciesKey')
 
             # Используем кэш для русских названий чтобы ускорить процесс
-            common_name_ru = self._get_russian_common_name_cached(species_key)
+            common_name_ru = self._get_russian_common_name(species_key)
 
             animal_info = {
                 'scientific_name': record.get('scientificName', 'Не указано'),
@@ -503,6 +502,7 @@ class AnimalFinder:
                 'species': record.get('species', 'Не указано'),
                 'decimalLatitude': record.get('decimalLatitude'),
                 'decimalLongitude': record.get('decimalLongitude'),
+                'coordinateUncertaintyInMeters': record.get('coordinateUncertaintyInMeters'),
                 'locality': record.get('locality', 'Не указано'),
                 'stateProvince': record.get('stateProvince', 'Не указано'),
                 'country': record.get('country', 'Не указано'),
@@ -511,7 +511,7 @@ class AnimalFinder:
                 'speciesKey': species_key,
                 'record_id': record.get('key')
             }
-            animal_data.append(animal_info)
+            animal_data.append(add_name_keys(animal_info))
 
         # Статистика отсева
         print(f"\n📊 СТАТИСТИКА ФИЛЬТРАЦИИ:")
@@ -527,9 +527,8 @@ class AnimalFinder:
         base_url = "https://api.gbif.org/v1"
 
         params = {
-            'decimalLatitude': latitude,
-            'decimalLongitude': longitude,
-            'coordinateUncertaintyInMeters': radius_km * 1000,
+            # geoDistance - настоящий фильтр по радиусу (coordinateUncertaintyInMeters - это точность координат)
+            'geoDistance': f"{latitude},{longitude},{radius_km}km",
             'class': 'Mammalia,Aves,Reptilia,Amphibia,Insecta',
             'hasCoordinate': 'true',
             'basisOfRecord': 'HUMAN_OBSERVATION,OBSERVATION',
@@ -625,25 +624,38 @@ class AnimalFinder:
         # Получаем правильное название региона для GBIF
         region_name_en = self.get_correct_region_name(region_name_ru)
         print(f"🎯 Используем название региона для GBIF: {region_name_en}")
+        if region_name_ru not in self.data_manager.region_registry:
+            print(f"⚠️ Регион '{region_name_ru}' не найден в справочнике - проверьте название")
 
-        # Нормализуем имя для файла
-        normalized_name = "".join(c for c in region_name_en if c.isalnum()).lower()
+        # Канонический идентификатор - одно имя файла для любого написания названия
+        normalized_name = self.data_manager.get_region_id(region_name_ru)
 
         # Проверяем, есть ли данные в локальном хранилище
         if not force_update and self.data_manager.region_exists(normalized_name):
             print(f"📁 Используем локальные данные для {region_name_ru}")
             region_data = self.data_manager.get_region_data(normalized_name)
             if region_data:
-                # Переводим данные с прогресс-баром
-                print("🔤 Перевод таксономии на русский...")
-                translated_data = []
-
-                with tqdm(total=len(region_data), desc="🔤 Перевод данных", unit="animal",
-                          bar_format='{l_bar}{bar:20}{r_bar}{bar:-20b}') as pbar:
-                    for animal in region_data:
-                        translated_data.append(self.translator.translate_animal_data(animal))
-                        pbar.update(1)
-
+                # Переводы сохранены при загрузке - повторно переводим только при смене таблицы переводов
+                metadata = self.data_manager.get_region_metadata(normalized_name)
+                translation_version = self.translator.translation_version
+                if metadata.get('translation_version') == translation_version:
+                    return region_data
+
+                print("🔤 Таблица переводов изменилась - обновляем переводы таксонов...")
+                translated_data, changed_count, unresolved_count = self.translator.retranslate_changed(region_data)
+                print(f"🔤 Обновлено записей: {changed_count}")
+                self._report_resolution_metrics()
+
+                if unresolved_count:
+                    # Без новой версии следующий запуск (с доступным API) повторит перевод
+                    print(f"⚠️ Не удалось перевести таксонов: {unresolved_count} - версия переводов не обновлена")
+                    translation_version = metadata.get('translation_version')
+                    if not changed_count:
+                        return translated_data
+
+                self.data_manager.save_region_data(self._get_region_name_en(region_name_ru),
+                                                   metadata.get('region_name_ru', region_name_ru),
+                                                   translated_data, translation_version=translation_version)
                 return translated_data
 
         # Получаем все данные через API с пагинацией
@@ -652,19 +664,18 @@ class AnimalFinder:
         animal_data = self._fetch_from_api_large(region_name_en, region_name_ru)
 
         if animal_data:
-            # Переводим данные перед сохранением
+            # Переводим данные перед сохранением: каждый различный таксон - один раз
             print("🔤 Перевод таксономии на русский...")
-            translated_data = []
-
-            # Создаем прогресс-бар с известным общим количеством
-            with tqdm(total=len(animal_data), desc="🔤 Перевод данных", unit="animal",
-                      bar_format='{l_bar}{bar:20}{r_bar}{bar:-20b}') as pbar:
-                for animal in animal_data:
-                    translated_data.append(self.translator.translate_animal_data(animal))
-                    pbar.update(1)
-
-            # Сохраняем данные с нормализованным именем
-            success = self.data_manager.save_region_data(region_name_en, region_name_ru, translated_data)
+            unresolved = set()
+            translated_data = self.translator.translate_dataset(animal_data, unresolved=unresolved)
+            self._report_resolution_metrics()
+
+            # Сохраняем данные с нормализованным именем и версией таблицы переводов
+            # (без версии, если часть таксонов не перевели, - следующая загрузка повторит перевод)
+            translation_version = None if unresolved else self.translator.translation_version
+            success = self.data_manager.save_region_data(self._get_region_name_en(region_name_ru), region_name_ru,
+                                                         translated_data,
+                                                         translation_version=translation_version)
             if success:
                 print(f"💾 Данные сохранены для региона {region_name_ru} (файл: {normalized_name}.json)")
             return translated_data
@@ -672,6 +683,15 @@ class AnimalFinder:
             print(f"❌ Не удалось получить данные для {region_name_ru}")
             return []
 
+    def _report_resolution_metrics(self):
+        """Печатает и сохраняет счетчики разрешения названий по слоям (в конце загрузки региона)"""
+        resolution_metrics.print_report()
+        resolution_metrics.dump()
+
+    def get_resolution_metrics(self):
+        """Снимок счетчиков разрешения названий: попадания, промахи, API, ошибки, задержки по слоям"""
+        return resolution_metrics.snapshot()
+
     def _fetch_from_api_large(self, region_name_en, region_name_ru, batch_size=300):
         """Получает все данные через GBIF API с пагинацией"""
         base_url = "https://api.gbif.org/v1"
@@ -810,6 +830,7 @@ class AnimalFinder:
     def _process_api_response_batch(self, records):
         """Быстрая обработка пачки записей с улучшенной фильтрацией"""
         animal_data = []
+        self._prefetch_russian_common_names(records)
 
         for record in records:
             # Быстрая проверка на животных
@@ -842,7 +863,7 @@ class AnimalFinder:
 
             # Создаем запись животного
             species_key = record.get('speciesKey')
-            common_name_ru = self._get_russian_common_name_cached(species_key)
+            common_name_ru = self._get_russian_common_name(species_key)
 
             animal_info = {
                 'scientific_name': record.get('scientificName', 'Не указано'),
@@ -856,6 +877,7 @@ class AnimalFinder:
                 'species': record.get('species', 'Не указано'),
                 'decimalLatitude': record.get('decimalLatitude'),
                 'decimalLongitude': record.get('decimalLongitude'),
+                'coordinateUncertaintyInMeters': record.get('coordinateUncertaintyInMeters'),
                 'locality': record.get('locality', 'Не указано'),
                 'stateProvince': record.get('stateProvince', 'Не указано'),
                 'country': record.get('country', 'Не указано'),
@@ -864,7 +886,7 @@ class AnimalFinder:
                 'speciesKey': species_key,
                 'record_id': record.get('key')
             }
-            animal_data.append(animal_info)
+            animal_data.append(add_name_keys(animal_info))
 
         return animal_data
 
@@ -929,28 +951,30 @@ class AnimalFinder:
             return []
 
     def get_correct_region_name(self, region_name_ru):
-        """Определяет правильное название региона для GBIF API"""
-        region_mapping = {
-            'Забайкальский край': 'Zabaykalsky Krai',
-            'Забайкальский': 'Zabaykalsky Krai',
-            'Zabaykalsky': 'Zabaykalsky Krai',
-            'Крым': 'Crimea',
-            'Республика Крым': 'Crimea',
-            'Москва': 'Moscow',
-            'Московская': 'Moscow',
-            'Санкт-Петербург': 'Saint Petersburg',
-            'Ленинградская': 'Leningrad',
-            'Краснодарский край': 'Krasnodar Krai',
-            'Краснодарская': 'Krasnodar Krai',
-            'Новосибирская': 'Novosibirsk',
-            'Амурская': 'Amur',
-            'Брянская': 'Bryansk',
-            'Нижегородская': 'Nizhny Novgorod',
-            'Татарстан': 'Tatarstan',
-            'Сахалин': 'Sakhalin'
-        }
-
-        return region_mapping.get(region_name_ru, region_name_ru)
+        """Определяет правильное название региона для GBIF API (только для stateProvince в запросах)"""
+        return self.data_manager.region_registry.gbif_name(region_name_ru) or region_name_ru
+
+    def _get_region_name_en(self, region_name_ru):
+        """Английское название региона из справочника - для сохранения (написание GBIF может быть другим)"""
+        return self.data_manager.region_registry.name_en(region_name_ru) or region_name_ru
+
+    def _get_normalized_region_name(self, region_name_ru):
+        """Возвращает нормализованное имя файла региона"""
+        return self.data_manager.get_region_id(region_name_ru)
+
+    def _get_region_data_version(self, region_name_ru, tag=None):
+        """Возвращает версию локальных данных региона (для кэширования производных результатов)"""
+        version = self.data_manager.get_region_version(self._get_normalized_region_name(region_name_ru))
+        if version is None:
+            return None
+        return f"{version}:{tag}" if tag else version
+
+    def _get_species_index(self, region_name_ru, animals=None):
+        """Получает индекс видов региона; если файла нет - строит его по переданным записям"""
+        species_index = self.data_manager.get_species_index(self._get_normalized_region_name(region_name_ru))
+        if not species_index and animals:
+            species_index = self.data_manager.build_species_index(animals)
+        return species_index
 
     def _process_api_response(self, records):
         """Обрабатывает ответ от API - с детальной отладкой"""
@@ -958,6 +982,7 @@ class AnimalFinder:
         rejected_records = []
 
         print(f"🔍 Анализируем {len(records)} записей...")
+        self._prefetch_russian_common_names(records)
 
         for i, record in enumerate(records):
             # Детальная информация о первых 3 записях для отладки
@@ -1040,6 +1065,7 @@ class AnimalFinder:
                 'species': record.get('species', 'Не указано'),
                 'decimalLatitude': record.get('decimalLatitude'),
                 'decimalLongitude': record.get('decimalLongitude'),
+                'coordinateUncertaintyInMeters': record.get('coordinateUncertaintyInMeters'),
                 'locality': record.get('locality', 'Не указано'),
                 'stateProvince': record.get('stateProvince', 'Не указано'),
                 'country': record.get('country', 'Не указано'),
@@ -1048,7 +1074,7 @@ class AnimalFinder:
                 'speciesKey': species_key,
                 'record_id': record.get('key')
             }
-            animal_data.append(animal_info)
+            animal_data.append(add_name_keys(animal_info))
 
         # Статистика отсева
         print(f"\nСТАТИСТИКА ФИЛЬТРАЦИИ:")
@@ -1089,12 +1115,26 @@ class AnimalFinder:
                 print(f"Прямой поиск нашел {len(animals_direct)} животных")
                 # Сохраняем найденных животных под регионом
                 if region_ru != "Неизвестный регион":
-                    self.data_manager.save_region_data(correct_region_en, region_ru, animals_direct)
+                    self.data_manager.save_region_data(self._get_region_name_en(region_ru), region_ru, animals_direct)
                 return animals_direct
             else:
                 print("Оба метода не дали результатов")
                 return []
 
+    def get_animals_nearby(self, latitude, longitude, radius_km=50, limit=1000, species=None, animal_class=None):
+        """Находки рядом с точкой: сначала локальный пространственный индекс, затем GBIF"""
+        species_keys = {scientific_name_key(species)} if species else None
+        classes = {animal_class} if animal_class else None
+
+        animals = self.data_manager.find_occurrences_in_radius(latitude, longitude, radius_km,
+                                                               species_keys, classes, limit=limit)
+        if animals:
+            print(f"📍 Найдено {len(animals)} сохраненных находок в радиусе {radius_km} км")
+            return animals
+
+        print(f"🌐 В радиусе {radius_km} км нет сохраненных находок - запрашиваем GBIF...")
+        return self.get_animals_by_coordinates_direct(latitude, longitude, radius_km, limit)
+
     def get_animals_by_coordinates_direct(self, latitude, longitude, radius_km=100, limit=1000):
         """Прямой поиск животных по координатам без определения региона"""
         print(f"Прямой поиск по координатам: {latitude}, {longitude}")
@@ -1102,9 +1142,8 @@ class AnimalFinder:
         base_url = "https://api.gbif.org/v1"
 
         params = {
-            'decimalLatitude': latitude,
-            'decimalLongitude': longitude,
-            'coordinateUncertaintyInMeters': radius_km * 1000,
+            # geoDistance - настоящий фильтр по радиусу (coordinateUncertaintyInMeters - это точность координат)
+            'geoDistance': f"{latitude},{longitude},{radius_km}km",
             'kingdom': 'Animalia',
             'hasCoordinate': 'true',
             'limit': limit
@@ -1126,22 +1165,82 @@ class AnimalFinder:
             print(f"Ошибка при прямом поиске: {e}")
             return []
 
+    def _prefetch_russian_common_names(self, records):
+        """Разрешает русские названия всех различных видов страницы одним параллельным набором запросов"""
+        species_keys = set(key for key in map(self.translator.lineage.to_key,
+                                              (record.get('speciesKey') for record in records)) if key is not None)
+        if species_keys:
+            self.translator.lineage.resolve_names(species_keys)
+
     def _get_russian_common_name(self, species_key):
         """Получает русское название вида"""
         if not species_key:
             return 'Не указано'
 
-        try:
-            response = requests.get(f"https://api.gbif.org/v1/species/{species_key}/vernacularNames", timeout=5)
-            if response.status_code == 200:
-                vernacular_data = response.json()
-                for vernacular in vernacular_data.get('results', []):
-                    if vernacular.get('language') == 'rus':
-                        return vernacular.get('vernacularName')
-        except:
-            pass
+        # Название вида кэшируется вместе с родословной (backbone, затем API)
+        return self.translator.lineage.get_russian_name(species_key) or 'Не указано'
 
-        return 'Не указано'
+    def search_animals_by_name(self, query, limit=10):
+        """Ищет животных по русскому или латинскому названию во всех сохраненных регионах"""
+        results = self.data_manager.search_species(query, limit=limit)
+
+        if not results:
+            print(f"❌ По запросу «{query}» ничего не найдено")
+            return []
+
+        print(f"\n🔎 РЕЗУЛЬТАТЫ ПОИСКА: «{query}»")
+        print("=" * 60)
+        for i, result in enumerate(results, 1):
+            russian_name = result['common_name']
+            if not russian_name or russian_name == 'Не указано':
+                russian_name = result['species_ru'] or 'Не указано'
+
+            print(f"{i:2d}. {russian_name} ({result['scientific_name']})")
+            print(f"    Класс: {result['class_ru'] or 'Не указано'} | Находок: {result['total_count']}")
+            regions = ', '.join(f"{name} ({count})" for name, count in result['regions'])
+            print(f"    Регионы: {regions}")
+
+        return results
+
+    def show_species_regions(self, query):
+        """Показывает, в каких регионах встречается вид (латинское или русское название)"""
+        species_key = scientific_name_key(query)
+        regions = self.data_manager.get_species_regions(species_key)
+
+        if not regions:
+            # Не точное латинское имя - берем лучшее совпадение из поиска по названиям
+            matches = self.data_manager.search_species(query, limit=1)
+            if matches:
+                species_key = matches[0]['name_key']
+                regions = self.data_manager.get_species_regions(species_key)
+
+        if not regions:
+            print(f"❌ Вид «{query}» не найден ни в одном сохраненном регионе")
+            return []
+
+        species_name = self.data_manager.get_species_regions_index(sync=False).get_canonical_name(species_key)
+        total_count = sum(region['count'] for region in regions)
+        region_areas = {species_range['normalized_name']: species_range['area_km2']
+                        for species_range in self.data_manager.get_species_region_ranges(species_key)}
+        print(f"\n🗺️ {species_name}: {len(regions)} регионов, {total_count} находок")
+        print("=" * 60)
+        for region in regions:
+            years = f"{region['first_year']}–{region['last_year']}" if region['first_year'] else "годы не указаны"
+            print(f"  {region['region_name_ru']:<30} {region['count']:>5} находок  ({years})")
+            if region['bbox']:
+                min_lat, min_lon, max_lat, max_lon = region['bbox']
+                print(f"      Охват: {min_lat:.2f}…{max_lat:.2f} с.ш., {min_lon:.2f}…{max_lon:.2f} в.д.")
+            if region['normalized_name'] in region_areas:
+                print(f"      Ареал в регионе: {region_areas[region['normalized_name']]:,.0f} км²")
+
+        # Ареал по всем регионам - выпуклая оболочка проверенных координат
+        species_range = self.data_manager.get_species_range(species_key)
+        if species_range:
+            min_lat, min_lon, max_lat, max_lon = species_range['bbox']
+            print(f"\n📐 Ареал (выпуклая оболочка): {species_range['area_km2']:,.0f} км², "
+                  f"{min_lat:.2f}…{max_lat:.2f} с.ш., {min_lon:.2f}…{max_lon:.2f} в.д.")
+
+        return regions
 
     def test_popular_regions(self):
         """Тестирует поиск в популярных регионах"""
@@ -1158,6 +1257,11 @@ class AnimalFinder:
         print("\nТЕСТИРОВАНИЕ ПОПУЛЯРНЫХ РЕГИОНОВ:")
         print("=" * 50)
 
+        # Сначала определяем регионы всех точек разом: запросы к Nominatim идут в фоне, результаты - по готовности
+        points = [(lat, lon) for lat, lon, _ in test_coordinates]
+        for lat, lon, (region_ru, _) in self.data_manager.iter_regions_by_coordinates(points):
+            print(f"📍 ({lat}, {lon}) -> {region_ru}")
+
         for lat, lon, region_name in test_coordinates:
             print(f"\nТестируем {region_name} ({lat}, {lon})")
             animals = self.get_animals_by_coordinates(lat, lon)
@@ -1165,10 +1269,10 @@ class AnimalFinder:
             if animals:
                 print(f"УСПЕХ: найдено {len(animals)} животных")
                 # Покажем топ-3
-                df = pd.DataFrame(animals)
-                top_species = df['scientific_name'].value_counts().head(3)
-                for species, count in top_species.items():
-                    common_name = df[df['scientific_name'] == species]['common_name'].iloc[0]
+                species_index = self.data_manager.build_species_index(animals)
+                top_species = sorted(species_index.items(), key=lambda x: x[1]['count'], reverse=True)[:3]
+                for species_key, info in top_species:
+                    species, common_name, count = info['canonical_name'], info['common_name'], info['count']
                     print(
                         f"   • {species} ({common_name if common_name != 'Не указано' else 'нет названия'}) - {count}")
             else:
@@ -1188,7 +1292,7 @@ class AnimalFinder:
 
         print(f"\nСТАТИСТИКА:")
         print(f"Всего записей: {len(animals)}")
-        print(f"Уникальных видов: {len(set([a['scientific_name'] for a in animals]))}")
+        print(f"Уникальных видов: {len(set(a['name_key'] for a in animals))}")
 
         # Распределение по классам
         class_counts = {}
@@ -1201,22 +1305,17 @@ class AnimalFinder:
             percentage = (count / len(animals)) * 100
             print(f"  {class_name}: {count} ({percentage:.1f}%)")
 
-        # Топ видов
-        species_counts = {}
-        for animal in animals:
-            species_name = animal['scientific_name']
-            common_name = animal.get('common_name', 'Нет русского названия')
-            species_counts[species_name] = species_counts.get(species_name, {'count': 0, 'common_name': common_name})
-            species_counts[species_name]['count'] += 1
-
-        top_species = sorted(species_counts.items(), key=lambda x: x[1]['count'], reverse=True)[:5]
+        # Топ видов из индекса видов региона
+        species_index = self._get_species_index(region_name_ru, animals)
+        top_species = sorted(species_index.items(), key=lambda x: x[1]['count'], reverse=True)[:5]
 
         if top_species:
             print(f"\nТОП-5 ВИДОВ:")
-            for i, (species, info) in enumerate(top_species, 1):
+            for i, (species_key, info) in enumerate(top_species, 1):
+                species = info['canonical_name']
                 common_name = info['common_name']
-                class_name = next(a.get('class_ru', a.get('class', 'Не указано')) for a in animals if
-                                   a['scientific_name'] == species)
+                record = info['record']
+                class_name = record.get('class_ru', record.get('class', 'Не указано'))
                 print(f"{i}. {species}")
                 print(f"{common_name}" if common_name != 'Не указано' else "Нет русского названия")
                 print(f"{class_name}")
@@ -1247,14 +1346,16 @@ class AnimalFinder:
         gbif_animals = self.get_animals_by_region(region_name_ru, force_update)
 
         # 2. Получаем животных из локальной базы данных
-        local_animals = self.animals_db.get_animals_by_region(region_name_ru)
+        local_animals = self.names.animals_db.get_animals_by_region(region_name_ru)
         print(f"Локальная база: {len(local_animals)} животных")
 
         # 3. Объединяем и убираем дубликаты
         all_animals = self._merge_animal_data(gbif_animals, local_animals)
 
         # 4. ПРИМЕНЯЕМ ФИЛЬТРАЦИЮ К ОБЪЕДИНЕННЫМ ДАННЫМ
-        filtered_animals = self.filter_animals_data(all_animals, min_count=1)
+        # Версия учитывает и файл региона, и локальную базу - записи зависят от обоих
+        data_version = self._get_region_data_version(region_name_ru, f'combined:{self.names.db_version}')
+        filtered_animals = self.filter_animals_data(all_animals, min_count=1, data_version=data_version)
 
         print(f"ИТОГО: {len(filtered_animals)} животных ({len(gbif_animals)} из GBIF + {len(local_animals)} из базы)")
         return filtered_animals
@@ -1264,16 +1365,16 @@ class AnimalFinder:
         merged_animals = []
         seen_species = set()
 
-        # Сначала добавляем животных из GBIF
+        # Сначала добавляем животных из GBIF (сравниваем по ключу канонического имени)
         for animal in gbif_animals:
-            species = animal.get('scientific_name')
+            species = animal.get('name_key') or scientific_name_key(animal.get('scientific_name'))
             if species and species not in seen_species:
                 merged_animals.append(animal)
                 seen_species.add(species)
 
         # Затем добавляем животных из локальной базы (только тех, кого нет в GBIF)
         for animal in local_animals:
-            species = animal.get('scientific_name')
+            species = scientific_name_key(animal.get('scientific_name'))
             if species and species not in seen_species:
                 # Добавляем недостающие поля для животных из базы данных
                 enhanced_animal = {
@@ -1287,7 +1388,7 @@ class AnimalFinder:
                     'source': 'local_db',
                     'region': animal.get('region', 'Не указано')
                 }
-                merged_animals.append(enhanced_animal)
+                merged_animals.append(add_name_keys(enhanced_animal))
                 seen_species.add(species)
 
         return merged_animals
@@ -1301,7 +1402,8 @@ class AnimalFinder:
             return
 
         # ФИЛЬТРУЕМ ДАННЫЕ - убираем редкие и неинформативные записи
-        filtered_animals = self.filter_animals_data(animals, min_count=2)
+        data_version = self._get_region_data_version(region_name_ru, f'combined_filtered:{self.names.db_version}')
+        filtered_animals = self.filter_animals_data(animals, min_count=2, data_version=data_version)
 
         # Разделяем животных по источникам (после фильтрации)
         gbif_animals = [a for a in filtered_animals if a.get('source') != 'local_db']
@@ -1343,52 +1445,11 @@ class AnimalFinder:
             for animal in local_animals[:8]:
                 print(f"  • {animal['common_name']} ({animal['scientific_name']})")
 
-    def filter_animals_data(self, animals, min_count=1, exclude_classes=None):
+    def filter_animals_data(self, animals, min_count=1, exclude_classes=None, data_version=None):
         """Фильтрует данные о животных - убираем неинтересные классы, но оставляем млекопитающих, птиц и т.д."""
-        if exclude_classes is None:
-            # Только самые неинтересные классы
-            exclude_classes = [
-                'Clitellata', 'Кольчатые черви', 'Олигохеты',
-                'Паукообразные', 'Arachnida',
-                'Насекомые', 'Insecta',
-                'Диплоподы', 'Многоножки',
-                'Губки', 'Porifera',
-                'Брюхоногие', 'Gastropoda',
-                'Двустворчатые', 'Bivalvia',
-                'Коллемболы', 'Collembola',
-                'Ракообразные', 'Crustacea',
-                'Нематоды', 'Nematoda',
-                'Плоские черви', 'Platyhelminthes',
-                'Коловратки', 'Rotifera',
-                'Тихоходки', 'Tardigrada',
-                'Мшанки', 'Bryozoa',
-                'Жаброногие', 'Branchiopoda'
-            ]
-
-        # Сначала группируем по видам и считаем количество
-        species_counts = {}
-        for animal in animals:
-            species = animal.get('scientific_name')
-            if species and species != 'Не указано':
-                species_counts[species] = species_counts.get(species, 0) + 1
-
-        # Фильтруем животных
-        filtered_animals = []
-        for animal in animals:
-            species = animal.get('scientific_name')
-            animal_class = animal.get('class_ru', animal.get('class', 'Не указано'))
-
-            # Проверяем критерии исключения
-            should_include = (
-                    species and
-                    species != 'Не указано' and
-                    species_counts.get(species, 0) >= min_count and
-                    animal_class not in exclude_classes and
-                    self._is_informative_animal_record(animal)  # Используем улучшенную проверку
-            )
-
-            if should_include:
-                filtered_animals.append(animal)
+        # Правила скомпилированы один раз в TaxonomyFilter (config/taxonomy_filters.json),
+        # маска считается векторно и кэшируется по версии данных региона
+        filtered_animals = self.taxonomy_filter.filter_records(animals, min_count, exclude_classes, data_version)
 
         removed_count = len(animals) - len(filtered_animals)
         if removed_count > 0:
@@ -1398,55 +1459,11 @@ class AnimalFinder:
 
     def _is_worm_or_insect(self, animal):
         """Дополнительная проверка на червей, насекомых и другие неинтересные группы"""
-        scientific_name = animal.get('scientific_name', '').lower()
-        common_name = animal.get('common_name', '').lower()
-        phylum = animal.get('phylum', '').lower()
-        animal_class = animal.get('class', '').lower()
-
-        # Признаки червей
-        worm_indicators = [
-            'clitellata', 'oligochaeta', 'enchytraeidae', 'annelida',
-            'nematoda', 'platyhelminthes', 'rotifera', 'tardigrada',
-            'червь', 'worm', 'нематод', 'коловратк'
-        ]
-
-        # Признаки насекомых и пауков
-        insect_indicators = [
-            'insecta', 'arachnida', 'diplopoda', 'crustacea',
-            'gastropoda', 'bivalvia', 'collembola', 'bryozoa',
-            'насеком', 'паук', 'моллюск', 'ракообразн'
-        ]
-
-        # Проверяем по разным полям
-        for field in [scientific_name, common_name, phylum, animal_class]:
-            if any(indicator in field for indicator in worm_indicators + insect_indicators):
-                return True
-
-        return False
+        return self.taxonomy_filter.is_worm_or_insect(animal)
 
     def _is_uninformative_animal(self, animal):
         """Проверяет, является ли животное неинформативным"""
-        scientific_name = animal.get('scientific_name', '').lower()
-        common_name = animal.get('common_name', '').lower()
-
-        # Признаки неинформативных записей
-        uninformative_indicators = [
-            # Слишком общие таксоны
-            'idae', 'inae', 'iformes', 'acea', 'oidea',
-            # Неопределенные названия
-            'sp.', 'spp.', 'unknown', 'unidentified', 'indet.',
-            # Лабораторные/домашние виды
-            'mus musculus', 'rattus norvegicus', 'drosophila',
-            # Ископаемые виды (часто имеют странные названия)
-            'ites', 'ensis', 'oides'
-        ]
-
-        # Проверяем классы, которые всегда исключаем
-        animal_class = animal.get('class_ru', '').lower()
-        if any(unwanted in animal_class for unwanted in ['насекомые', 'паукообразные', 'черви', 'моллюски']):
-            return True
-
-        return any(indicator in scientific_name for indicator in uninformative_indicators)
+        return self.taxonomy_filter.is_uninformative(animal)
 
     def show_animals_by_class(self, region_name_ru, class_name):
         """Показывает всех животных определенного класса в регионе"""
@@ -1474,20 +1491,14 @@ class AnimalFinder:
             print(f"В регионе {region_name_ru} не найдены животные класса '{class_name}'")
             return []
 
-        # Убираем дубликаты по научному названию и считаем количество находок
-        species_counts = {}
+        # Убираем дубликаты по ключу вида, количество находок берем из индекса видов
+        species_index = self._get_species_index(region_name_ru)
+        unique_animals = {}
         for animal in class_animals:
-            sci_name = animal['scientific_name']
-            if sci_name not in species_counts:
-                species_counts[sci_name] = {
-                    'animal': animal,
-                    'count': 1
-                }
-            else:
-                species_counts[sci_name]['count'] += 1
+            unique_animals.setdefault(animal['name_key'], animal)
 
-        unique_list = [data['animal'] for data in species_counts.values()]
-        count_data = {sci_name: data['count'] for sci_name, data in species_counts.items()}
+        unique_list = list(unique_animals.values())
+        count_data = {key: species_index[key]['count'] if key in species_index else 1 for key in unique_animals}
 
         print(f"\n{'=' * 60}")
         print(f"{class_name.upper()} В {region_name_ru.upper()} ОБЛАСТИ")
@@ -1501,7 +1512,7 @@ class AnimalFinder:
         for i, animal in enumerate(sorted_animals, 1):
             common_name = animal.get('common_name', 'Не указано')
             scientific_name = animal['scientific_name']
-            count = count_data.get(scientific_name, 1)
+            count = count_data.get(animal['name_key'], 1)
 
             # Пропускаем записи, которые являются названиями классов, а не видов
             if scientific_name.lower() in ['mammalia', 'aves', 'reptilia', 'amphibia']:
@@ -1556,27 +1567,18 @@ class AnimalFinder:
 
     def _is_informative_animal_record(self, animal):
         """Проверяет, является ли запись информативной (конкретным видом, а не классом)"""
-        scientific_name = animal.get('scientific_name', '').lower()
-
-        # Исключаем названия классов и слишком общие таксоны
-        excluded_names = [
-            'mammalia', 'aves', 'reptilia', 'amphibia', 'actinopterygii',
-            'animalia', 'chordata', 'vertebrata', 'metazoa'
-        ]
-
-        # Исключаем записи без видового названия
-        if not scientific_name or scientific_name in excluded_names:
-            return False
-
-        # Проверяем, что это вероятно видовое название (содержит пробел или специфические окончания)
-        if ' ' in scientific_name or any(scientific_name.endswith(ending) for ending in ['us', 'a', 'is', 'ensis']):
-            return True
-
-        return False
+        return self.taxonomy_filter.is_informative_record(animal)
 
 # Основная программа
 def main():
-    finder = AnimalFinder()
+    if '--migrate-regions' in sys.argv:
+        # Разовая миграция файлов регионов: без --apply только показывает план
+        DataManager().migrate_region_files(apply='--apply' in sys.argv)
+        return
+
+    # --offline / --online переопределяют ANIMAL_FINDER_OFFLINE (по умолчанию - онлайн)
+    offline = True if '--offline' in sys.argv else False if '--online' in sys.argv else None
+    finder = AnimalFinder(offline=offline)
 
     print("🐾 СИСТЕМА ПОИСКА ЖИВОТНЫХ ПО КООРДИНАТАМ")
     print("=" * 50)
@@ -1599,9 +1601,11 @@ def main():
         print("4. 📋 Показать ВСЕ регионы России")
         print("5. 📊 Показать регионы с данными в системе")
         print("6. Обновить статистику регионов")
-        print("7. Выход")
+        print("7. 🔎 Поиск животного по названию")
+        print("8. 🗺️ В каких регионах встречается вид")
+        print("9. Выход")
 
-        choice = input("\nВаш выбор (1-7): ").strip()
+        choice = input("\nВаш выбор (1-9): ").strip()
 
         if choice == '1':
             # Режим поиска по координатам
@@ -1611,6 +1615,14 @@ def main():
 
                 lat = float(lat_input)
                 lon = float(lon_input)
+                radius_input = input("Радиус поиска в км (Enter - 50): ").strip().replace(',', '.')
+                radius_km = float(radius_input) if radius_input else 50
+
+                # Сначала находки рядом с точкой из локального индекса
+                animals = finder.get_animals_nearby(lat, lon, radius_km=radius_km)
+                if animals:
+                    finder.show_detailed_animal_info_improved(animals)
+                    continue
 
                 animals = finder.get_animals_by_coordinates(lat, lon)
                 if animals:
@@ -1682,6 +1694,18 @@ def main():
             available_regions = finder.get_available_regions_list()  # Обновляем список
 
         elif choice == '7':
+            # Поиск по названию во всех регионах
+            query = input("Введите название животного (русское или латинское): ").strip()
+            if query:
+                finder.search_animals_by_name(query)
+
+        elif choice == '8':
+            # Где встречается вид - по обратному индексу, без загрузки файлов регионов
+            query = input("Введите название вида (например, Lynx lynx или рысь): ").strip()
+            if query:
+                finder.show_species_regions(query)
+
+        elif choice == '9':
             print("👋 До свидания!")
             break
 
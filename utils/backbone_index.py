@@ -0,0 +1,185 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+from utils.scientific_names import canonical_name
+
+
+class BackboneIndex:
+    """Локальный индекс таксономии GBIF Backbone и русских названий (SQLite)"""
+
+    # Колонки Taxon.tsv из дампа backbone, которые сохраняются в индекс
+    TAXON_COLUMNS = ['taxonID', 'acceptedNameUsageID', 'parentNameUsageID', 'scientificName', 'canonicalName',
+                     'taxonRank', 'taxonomicStatus', 'kingdom', 'phylum', 'class', 'order', 'family', 'genus']
+
+    RUSSIAN_LANGUAGES = ('ru', 'rus')
+
+    def __init__(self, db_path="data/backbone/backbone.sqlite"):
+        self.db_path = db_path
+        self._connection = None
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    @property
+    def available(self):
+        """Есть ли импортированный индекс"""
+        return os.path.exists(self.db_path)
+
+    def _connect(self):
+        """Открывает соединение с базой (лениво, одно на процесс)"""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._connection
+
+    def import_dump(self, taxon_tsv, vernacular_tsv=None, kingdoms=('Animalia',), batch_size=50000):
+        """Импортирует Taxon.tsv и VernacularName.tsv из дампа GBIF Backbone в индекс"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        tmp_path = self.db_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        csv.field_size_limit(sys.maxsize)
+        connection = sqlite3.connect(tmp_path)
+        connection.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE taxa (
+                id INTEGER PRIMARY KEY, accepted_id INTEGER, parent_id INTEGER,
+                scientific_name TEXT, canonical TEXT, canonical_lower TEXT, rank TEXT, status TEXT,
+                kingdom TEXT, phylum TEXT, class TEXT, "order" TEXT, family TEXT, genus TEXT
+            );
+            CREATE TABLE vernacular (taxon_id INTEGER, name TEXT);
+        """)
+
+        taxa_count = 0
+        with open(taxon_tsv, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+            batch = []
+            for row in reader:
+                if kingdoms and row.get('kingdom') not in kingdoms:
+                    continue
+
+                canonical = row.get('canonicalName') or canonical_name(row.get('scientificName'))
+                batch.append((
+                    int(row['taxonID']), self._to_int(row.get('acceptedNameUsageID')),
+                    self._to_int(row.get('parentNameUsageID')), row.get('scientificName'),
+                    canonical, canonical.lower(), (row.get('taxonRank') or '').lower(),
+                    (row.get('taxonomicStatus') or '').lower(), row.get('kingdom'), row.get('phylum'),
+                    row.get('class'), row.get('order'), row.get('family'), row.get('genus')
+                ))
+                if len(batch) >= batch_size:
+                    connection.executemany("INSERT OR REPLACE INTO taxa VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", batch)
+                    taxa_count += len(batch)
+                    batch = []
+            connection.executemany("INSERT OR REPLACE INTO taxa VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", batch)
+            taxa_count += len(batch)
+
+        vernacular_count = 0
+        if vernacular_tsv:
+            with open(vernacular_tsv, 'r', encoding='utf-8') as f:
+                reader = csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+                batch = []
+                for row in reader:
+                    if (row.get('language') or '').lower() not in self.RUSSIAN_LANGUAGES or not row.get('vernacularName'):
+                        continue
+                    batch.append((int(row['taxonID']), row['vernacularName']))
+                    if len(batch) >= batch_size:
+                        connection.executemany("INSERT INTO vernacular VALUES (?,?)", batch)
+                        vernacular_count += len(batch)
+                        batch = []
+                connection.executemany("INSERT INTO vernacular VALUES (?,?)", batch)
+                vernacular_count += len(batch)
+
+        # Индексы строим после загрузки - так быстрее
+        connection.executescript("""
+            CREATE INDEX idx_taxa_canonical ON taxa (canonical_lower, rank);
+            CREATE INDEX idx_vernacular_taxon ON vernacular (taxon_id);
+        """)
+        connection.commit()
+        connection.close()
+
+        # Подменяем индекс атомарно
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            os.replace(tmp_path, self.db_path)
+            self._cache = {}
+
+        print(f"✅ Импортировано таксонов: {taxa_count}, русских названий: {vernacular_count}")
+        return taxa_count, vernacular_count
+
+    @staticmethod
+    def _to_int(value):
+        """Преобразует идентификатор из TSV в число (пустое значение - None)"""
+        try:
+            return int(value) if value else None
+        except ValueError:
+            return None
+
+    def find_taxon(self, taxon_name, taxon_rank=None):
+        """Ищет таксон по каноническому имени (принятые имена и животные - в приоритете)"""
+        if not self.available or not taxon_name:
+            return None
+
+        canonical = canonical_name(taxon_name).lower()
+        cache_key = ('taxon', canonical, taxon_rank)
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+
+        query = "SELECT * FROM taxa WHERE canonical_lower = ?"
+        params = [canonical]
+        if taxon_rank:
+            query += " AND rank = ?"
+            params.append(taxon_rank.lower())
+        query += " ORDER BY status = 'accepted' DESC, kingdom = 'Animalia' DESC LIMIT 1"
+
+        with self._lock:
+            cursor = self._connect().execute(query, params)
+            row = cursor.fetchone()
+            taxon = dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+        self._cache[cache_key] = taxon
+        return taxon
+
+    def get_russian_name_by_key(self, taxon_key):
+        """Русское название таксона по ключу GBIF (для синонимов - по принятому имени)"""
+        if not self.available or not taxon_key:
+            return None
+
+        cache_key = ('vernacular', taxon_key)
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT v.name FROM vernacular v WHERE v.taxon_id = ? "
+                "UNION ALL SELECT v.name FROM taxa t JOIN vernacular v ON v.taxon_id = t.accepted_id "
+                "WHERE t.id = ? LIMIT 1", (int(taxon_key), int(taxon_key))).fetchone()
+
+        name = row[0] if row else None
+        self._cache[cache_key] = name
+        return name
+
+    def translate(self, taxon_name, taxon_rank=None):
+        """Русское название таксона по научному названию (None - если в индексе нет)"""
+        taxon = self.find_taxon(taxon_name, taxon_rank)
+        if not taxon:
+            return None
+        return self.get_russian_name_by_key(taxon['id'])
+
+
+def main():
+    """Импорт дампа GBIF Backbone: python -m utils.backbone_index Taxon.tsv [VernacularName.tsv]"""
+    if len(sys.argv) < 2:
+        print("Использование: python -m utils.backbone_index Taxon.tsv [VernacularName.tsv]")
+        return
+
+    index = BackboneIndex()
+    index.import_dump(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+
+
+if __name__ == "__main__":
+    main()
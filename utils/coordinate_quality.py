@@ -0,0 +1,95 @@
+import numpy as np
+
+# Флаги качества координат (битовая маска в поле coord_quality; 0 - координаты чистые)
+COORD_MISSING = 1  # Нет координат или они вне допустимого диапазона
+COORD_ZERO = 2  # Точка (0, 0) - типичная ошибка заполнения
+COORD_OUTSIDE_RUSSIA = 4  # Вне прямоугольника России
+COORD_OUTSIDE_REGION = 8  # Вне полигона региона, под которым запись сохранена
+COORD_UNCERTAIN = 16  # Слишком большая погрешность coordinateUncertaintyInMeters
+
+FLAG_NAMES = {
+    COORD_MISSING: 'нет координат',
+    COORD_ZERO: 'точка (0, 0)',
+    COORD_OUTSIDE_RUSSIA: 'вне России',
+    COORD_OUTSIDE_REGION: 'вне региона',
+    COORD_UNCERTAIN: 'большая погрешность',
+}
+
+# Прямоугольник России (мин. широта, мин. долгота, макс. широта, макс. долгота);
+# восток Чукотки лежит за 180-м меридианом - до -168.9
+RUSSIA_BBOX = (41.1, 19.6, 81.9, 180.0)
+RUSSIA_EAST_OF_ANTIMERIDIAN = -168.9
+
+# Порог погрешности координат по умолчанию (м)
+MAX_UNCERTAINTY_M = 10000
+
+
+def coordinate_arrays(animals, column):
+    """Числовой столбец записей как массив float (None и нечисловые значения - NaN)"""
+    values = np.full(len(animals), np.nan)
+    for position, animal in enumerate(animals):
+        value = animal.get(column)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[position] = value
+    return values
+
+
+def quality_flags(latitudes, longitudes, uncertainties=None, outside_region=None,
+                  max_uncertainty_m=MAX_UNCERTAINTY_M):
+    """Битовые маски качества координат для массивов точек (за один векторный проход).
+
+    outside_region - булев массив "точка вне полигона своего региона" (None - проверка не выполнялась).
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    flags = np.zeros(len(latitudes), dtype=np.uint8)
+
+    missing = (np.isnan(latitudes) | np.isnan(longitudes) | (np.abs(latitudes) > 90) |
+               (np.abs(longitudes) > 180))
+    flags[missing] |= COORD_MISSING
+    flags[~missing & (latitudes == 0) & (longitudes == 0)] |= COORD_ZERO
+
+    min_lat, min_lon, max_lat, max_lon = RUSSIA_BBOX
+    in_russia = (latitudes >= min_lat) & (latitudes <= max_lat) & (
+        ((longitudes >= min_lon) & (longitudes <= max_lon)) | (longitudes <= RUSSIA_EAST_OF_ANTIMERIDIAN))
+    flags[~missing & ~in_russia] |= COORD_OUTSIDE_RUSSIA
+
+    if outside_region is not None:
+        flags[~missing & np.asarray(outside_region, dtype=bool)] |= COORD_OUTSIDE_REGION
+
+    if uncertainties is not None:
+        uncertainties = np.asarray(uncertainties, dtype=float)
+        flags[~missing & (uncertainties > max_uncertainty_m)] |= COORD_UNCERTAIN
+
+    return flags
+
+
+def is_clean(animal):
+    """Координаты записи прошли все проверки (у записей без маски - только есть ли координаты)"""
+    if 'coord_quality' in animal:
+        return animal['coord_quality'] == 0
+    return animal.get('decimalLatitude') is not None and animal.get('decimalLongitude') is not None
+
+
+def describe_flags(mask):
+    """Названия флагов маски"""
+    return [name for flag, name in FLAG_NAMES.items() if mask & flag]
+
+
+def summarize_flags(flags):
+    """Число записей с каждым флагом: {название: количество} (только ненулевые)"""
+    flags = np.asarray(flags, dtype=np.uint8)
+    return {name: int(np.count_nonzero(flags & flag)) for flag, name in FLAG_NAMES.items()
+            if np.count_nonzero(flags & flag)}
+
+
+def clean_mask(animals):
+    """Булев массив "координаты чистые" для списка записей; для записей без маски флаги считаются на лету"""
+    stored = np.array([animal.get('coord_quality', -1) for animal in animals], dtype=np.int64)
+    missing = stored < 0
+    if missing.any():
+        legacy = [animal for animal, has_no_mask in zip(animals, missing) if has_no_mask]
+        stored[missing] = quality_flags(coordinate_arrays(legacy, 'decimalLatitude'),
+                                        coordinate_arrays(legacy, 'decimalLongitude'),
+                                        coordinate_arrays(legacy, 'coordinateUncertaintyInMeters'))
+    return stored == 0
@@ -2,15 +2,30 @@ import json
 import os
 import hashlib
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 import requests
+from urllib.parse import urlparse
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from utils.scientific_names import add_name_keys, NAME_PARSER_VERSION
+from utils.name_search import NameSearchIndex
+from utils.species_regions import SpeciesRegionIndex
+from utils.offline_geocoder import OfflineGeocoder
+from utils.geohash_cache import GeohashRegionCache
+from utils.occurrence_index import OccurrenceSpatialIndex
+from utils.geocoding_queue import GeocodingQueue
+from utils.species_grid import SpeciesGrid
+from utils.species_ranges import SpeciesRangeIndex
+from utils.region_registry import get_region_registry, normalize_region_id
+from utils.coordinate_quality import (MAX_UNCERTAINTY_M, coordinate_arrays, quality_flags, summarize_flags,
+                                      is_clean)
 
 
 class DataManager:
-    def __init__(self, base_path="data"):
+    def __init__(self, base_path="data", use_nominatim=True):
         self.base_path = base_path
+        self.use_nominatim = use_nominatim  # Nominatim - запасной вариант, если офлайн-границы не помогли
         self.regions_path = os.path.join(base_path, "regions")
         self.cache_path = os.path.join(base_path, "cache", "api_cache.json")
         self.keys_path = os.path.join("config", "regions_keys.json")
@@ -24,103 +39,112 @@ class DataManager:
         # Инициализируем файлы если их нет
         self._init_files()
 
-        # Инициализируем геокодер
-        self.geolocator = Nominatim(user_agent="animal_map_app")
-
-        self.russian_to_english = self._get_regions_mapping()
-
-    def _get_regions_mapping(self):
-        """Возвращает словарь соответствия русских и английских названий регионов"""
-        return {
-            'Республика Адыгея': 'Adygea',
-            'Республика Алтай': 'Altai',
-            'Алтайский край': 'Altai Krai',
-            'Амурская область': 'Amur',
-            'Архангельская область': 'Arkhangelsk',
-            'Астраханская область': 'Astrakhan',
-            'Республика Башкортостан': 'Bashkortostan',
-            'Белгородская область': 'Belgorod',
-            'Брянская область': 'Bryansk',
-            'Республика Бурятия': 'Buryatia',
-            'Чеченская Республика': 'Chechnya',
-            'Челябинская область': 'Chelyabinsk',
-            'Чукотский автономный округ': 'Chukotka',
-            'Республика Крым': 'Crimea',
-            'Республика Дагестан': 'Dagestan',
-            'Республика Ингушетия': 'Ingushetia',
-            'Иркутская область': 'Irkutsk',
-            'Ивановская область': 'Ivanovo',
-            'Еврейская автономная область': 'Jewish',
-            'Кабардино-Балкарская Республика': 'Kabardino-Balkaria',
-            'Калининградская область': 'Kaliningrad',
-            'Республика Калмыкия': 'Kalmykia',
-            'Калужская область': 'Kaluga',
-            'Камчатский край': 'Kamchatka',
-            'Карачаево-Черкесская Республика': 'Karachay-Cherkessia',
-            'Республика Карелия': 'Karelia',
-            'Кемеровская область': 'Kemerovo',
-            'Хабаровский край': 'Khabarovsk',
-            'Республика Хакасия': 'Khakassia',
-            'Ханты-Мансийский автономный округ — Югра': 'Khanty-Mansi',
-            'Кировская область': 'Kirov',
-            'Коми Республика': 'Komi',
-            'Костромская область': 'Kostroma',
-            'Краснодарский край': 'Krasnodar',
-            'Красноярский край': 'Krasnoyarsk',
-            'Курганская область': 'Kurgan',
-            'Курская область': 'Kursk',
-            'Ленинградская область': 'Leningrad',
-            'Липецкая область': 'Lipetsk',
-            'Магаданская область': 'Magadan',
-            'Республика Марий Эл': 'Mari El',
-            'Республика Мордовия': 'Mordovia',
-            'Московская область': 'Moscow',
-            'Москва': 'Moscow City',
-            'Мурманская область': 'Murmansk',
-            'Ненецкий автономный округ': 'Nenets',
-            'Нижегородская область': 'Nizhny Novgorod',
-            'Новгородская область': 'Novgorod',
-            'Новосибирская область': 'Novosibirsk',
-            'Омская область': 'Omsk',
-            'Оренбургская область': 'Orenburg',
-            'Орловская область': 'Oryol',
-            'Пензенская область': 'Penza',
-            'Пермский край': 'Perm',
-            'Приморский край': 'Primorsky',
-            'Псковская область': 'Pskov',
-            'Ростовская область': 'Rostov',
-            'Рязанская область': 'Ryazan',
-            'Санкт-Петербург': 'Saint Petersburg',
-            'Республика Саха (Якутия)': 'Sakha',
-            'Сахалинская область': 'Sakhalin',
-            'Самарская область': 'Samara',
-            'Саратовская область': 'Saratov',
-            'Республика Северная Осетия — Алания': 'North Ossetia',
-            'Смоленская область': 'Smolensk',
-            'Ставропольский край': 'Stavropol',
-            'Свердловская область': 'Sverdlovsk',
-            'Тамбовская область': 'Tambov',
-            'Республика Татарстан': 'Tatarstan',
-            'Томская область': 'Tomsk',
-            'Тульская область': 'Tula',
-            'Республика Тыва': 'Tuva',
-            'Тверская область': 'Tver',
-            'Тюменская область': 'Tyumen',
-            'Удмуртская Республика': 'Udmurtia',
-            'Ульяновская область': 'Ulyanovsk',
-            'Владимирская область': 'Vladimir',
-            'Волгоградская область': 'Volgograd',
-            'Вологодская область': 'Vologda',
-            'Воронежская область': 'Voronezh',
-            'Ямало-Ненецкий автономный округ': 'Yamalo-Nenets',
-            'Ярославская область': 'Yaroslavl',
-            'Забайкальский край': 'Zabaykalsky',
-            'Донецкая Народная Республика': 'Donetsk',
-            'Луганская Народная Республика': 'Luhansk',
-            'Херсонская область': 'Kherson',
-            'Запорожская область': 'Zaporozhye',
-            'Севастополь': 'Sevastopol'
-        }
+        # Инициализируем геокодер: публичный Nominatim или совместимый локальный сервер (NOMINATIM_URL)
+        self.nominatim_url = os.environ.get('NOMINATIM_URL')
+        self.geolocator = self._create_geolocator(self.nominatim_url)
+
+        # Справочник регионов: все написания названий -> канонический идентификатор (он же имя файла).
+        # Он и подсистемы ниже создаются при первом обращении - BiodiversityML и CLI платят только за нужные
+        self._region_registry = None
+        self._russian_to_english = None
+        self._region_geometry_loaded = False
+
+        # Офлайн-геокодер по локальным границам регионов (если файл границ есть)
+        self.boundaries_path = os.path.join("config", "regions_boundaries.geojson")
+        self._offline_geocoder = None
+        # Границы районов (муниципальный уровень) - для разбивки внутри региона, если файл есть
+        self.districts_boundaries_path = os.path.join("config", "districts_boundaries.geojson")
+        self._districts_geocoder = None
+
+        # Кэш регионов по геохэшам (заменяет кэш по точным координатам)
+        self.geohash_cache_path = os.path.join(base_path, "cache", "geohash_regions.json")
+        self._geohash_cache = None
+        # Ответы Nominatim кэшируются только по точке; ячейки целиком запоминаются по офлайн-границам.
+        # Проверка углов ячейки (до 4 запросов на точку) - только по явному включению и только для своего сервера
+        # (NOMINATIM_URL): правила публичного Nominatim запрещают систематические запросы
+        self.probe_cells_with_nominatim = False
+        self.nominatim_cell_precision = 6  # ~1.2 x 0.6 км
+
+        # Все запросы к Nominatim идут через одну очередь: общий лимит (публичный сервер - 1 запрос в секунду,
+        # свой сервер - NOMINATIM_MIN_INTERVAL), близкие точки - один запрос, кэш на диск - пачками
+        self.nominatim_min_interval = float(os.environ.get('NOMINATIM_MIN_INTERVAL',
+                                                           0.0 if self.nominatim_url else 1.0))
+        self._geocoding_queue = None
+
+        # Проверка координат при сохранении: флаги пишутся в coord_quality, записи с drop_coordinate_flags
+        # отбрасываются (по умолчанию ничего не отбрасывается - записи без точных координат нужны для списков видов)
+        self.max_coordinate_uncertainty_m = MAX_UNCERTAINTY_M
+        self.drop_coordinate_flags = 0
+
+        # Кэш разобранных файлов регионов: normalized_name -> (mtime_ns, data)
+        self._region_files_cache = {}
+
+        # Индекс поиска по названиям (загружается при первом обращении)
+        self.name_search_path = os.path.join(base_path, "cache", "name_search_index.json")
+        self._name_search = None
+
+        # Обратный индекс вид -> регионы (загружается при первом обращении)
+        self.species_regions_path = os.path.join(base_path, "cache", "species_regions_index.json")
+        self._species_regions = None
+
+        # Пространственный индекс находок (загружается при первом обращении); регионы делятся на тайлы
+        # spatial_tile_size x spatial_tile_size градусов, запросы читают только нужные (None - без тайлов)
+        self.spatial_index_dir = os.path.join(base_path, "cache", "spatial")
+        self.spatial_tile_size = 0.5
+        self._spatial_index = None
+
+        # Сетка биоразнообразия по ячейкам нескольких разрешений (загружается при первом обращении)
+        self.grid_dir = os.path.join(base_path, "cache", "grid")
+        self._species_grid = None
+
+        # Ареалы видов: оболочки по регионам, собираются в ареал по запросу (загружается при первом обращении)
+        self.ranges_dir = os.path.join(base_path, "cache", "ranges")
+        self._species_ranges = None
+
+    @property
+    def region_registry(self):
+        """Справочник регионов (общий на процесс)"""
+        if self._region_registry is None:
+            self._region_registry = get_region_registry()
+        return self._region_registry
+
+    @property
+    def russian_to_english(self):
+        """Словарь русское название -> английское для всех регионов"""
+        if self._russian_to_english is None:
+            self._russian_to_english = self.region_registry.russian_to_english()
+        return self._russian_to_english
+
+    @property
+    def offline_geocoder(self):
+        """Офлайн-геокодер по границам регионов (границы читаются при первом запросе)"""
+        if self._offline_geocoder is None:
+            self._offline_geocoder = OfflineGeocoder(self.boundaries_path, self.russian_to_english)
+        return self._offline_geocoder
+
+    @property
+    def districts_geocoder(self):
+        """Офлайн-геокодер по границам районов"""
+        if self._districts_geocoder is None:
+            self._districts_geocoder = OfflineGeocoder(self.districts_boundaries_path)
+        return self._districts_geocoder
+
+    @property
+    def geohash_cache(self):
+        """Кэш регионов по геохэшам (при первом создании переносит старый кэш координат)"""
+        if self._geohash_cache is None:
+            self._geohash_cache = GeohashRegionCache(self.geohash_cache_path)
+            if not len(self._geohash_cache):
+                self._migrate_coordinates_cache()
+        return self._geohash_cache
+
+    @property
+    def geocoding_queue(self):
+        """Общая очередь запросов к Nominatim"""
+        if self._geocoding_queue is None:
+            self._geocoding_queue = GeocodingQueue(self._reverse_geocode, min_interval=self.nominatim_min_interval,
+                                                   persist=self.geohash_cache.store.flush)
+        return self._geocoding_queue
 
     def get_all_regions_list(self):
         """Возвращает полный список всех регионов России"""
@@ -189,16 +213,66 @@ class DataManager:
 
     def get_region_by_coordinates(self, latitude, longitude):
         """Определяет регион по координатам"""
-        cache_key = f"{latitude:.4f}_{longitude:.4f}"
-        coords_data = self._load_json(self.coordinates_path) or {"coordinates_cache": {}}
+        # Внутренние ячейки геохэша и точки у границ, определенные раньше
+        region = self.geohash_cache.lookup(latitude, longitude, self.offline_geocoder.version)
+        if region:
+            return region
+
+        # Локальные границы регионов - без сети и без лимита запросов
+        region = self.offline_geocoder.locate(latitude, longitude)
+        if region:
+            self.geohash_cache.learn_interior(
+                latitude, longitude, region,
+                lambda bbox: self.offline_geocoder.region_covering(*bbox) == region,
+                source=self.offline_geocoder.version)
+            return region
+        if not self.use_nominatim:
+            return "Неизвестный регион", "unknown"
+
+        region = self.geocoding_queue.geocode(latitude, longitude)
+        if region is None:
+            return "Неизвестный регион", "unknown"
+
+        # Ячейку вокруг точки считаем внутренней, если все ее углы в том же регионе (только свой сервер)
+        if self.probe_cells_with_nominatim and self.nominatim_url:
+            self.geohash_cache.learn_interior(
+                latitude, longitude, region, lambda bbox: self._cell_corners_in_region(bbox, region),
+                source='nominatim', min_precision=self.nominatim_cell_precision,
+                max_precision=self.nominatim_cell_precision)
+
+        return region
+
+    @staticmethod
+    def _create_geolocator(nominatim_url=None):
+        """Клиент Nominatim: публичный сервер или свой по адресу вида http://localhost:8080"""
+        if not nominatim_url:
+            return Nominatim(user_agent="animal_map_app")
+        parsed = urlparse(nominatim_url)
+        return Nominatim(user_agent="animal_map_app", domain=parsed.netloc + parsed.path.rstrip('/'),
+                         scheme=parsed.scheme or 'http')
+
+    def iter_regions_by_coordinates(self, points):
+        """Регионы набора точек потоком: (широта, долгота, (регион ru, регион en)).
+
+        Точки из кэша и офлайн-границ отдаются сразу, остальные - по мере ответов Nominatim из фоновой очереди.
+        """
+        remote = []
+        for latitude, longitude in points:
+            region = (self.geohash_cache.lookup(latitude, longitude, self.offline_geocoder.version) or
+                      self.offline_geocoder.locate(latitude, longitude))
+            if region or not self.use_nominatim:
+                yield latitude, longitude, region or ("Неизвестный регион", "unknown")
+            else:
+                remote.append((latitude, longitude))
 
-        # Проверяем кэш
-        if cache_key in coords_data["coordinates_cache"]:
-            cached = coords_data["coordinates_cache"][cache_key]
-            if datetime.now().timestamp() - cached.get('timestamp', 0) < 30 * 24 * 3600:  # 30 дней
-                return cached['region_name_ru'], cached['region_name_en']
+        if remote:
+            print(f"🌐 Геокодирование {len(remote)} точек через Nominatim (в фоне)...")
+            for latitude, longitude, region in self.geocoding_queue.stream(remote):
+                yield latitude, longitude, region or ("Неизвестный регион", "unknown")
+            self.geohash_cache.store.flush()
 
-        # Определяем регион через геокодинг
+    def _reverse_geocode(self, latitude, longitude):
+        """Определяет регион точки через Nominatim и кэширует точку (вызывается только из очереди геокодирования)"""
         try:
             location = self.geolocator.reverse((latitude, longitude), language='ru')
             if location and location.raw.get('address'):
@@ -215,22 +289,213 @@ class DataManager:
                 # Преобразуем в английское название
                 region_name_en = self._translate_region_to_english(region_name_ru)
 
-                # Сохраняем в кэш
-                coords_data["coordinates_cache"][cache_key] = {
-                    'region_name_ru': region_name_ru,
-                    'region_name_en': region_name_en,
-                    'timestamp': datetime.now().timestamp(),
-                    'address': address
-                }
-                coords_data["last_updated"] = datetime.now().isoformat()
-                self._save_json(self.coordinates_path, coords_data)
-
+                # Сохраняем в кэш (на диск попадет со следующей пачкой)
+                self.geohash_cache.add_point(latitude, longitude, (region_name_ru, region_name_en), address=address)
                 return region_name_ru, region_name_en
 
         except (GeocoderTimedOut, GeocoderServiceError) as e:
             print(f"⚠️ Ошибка геокодинга: {e}")
 
-        return "Неизвестный регион", "unknown"
+        return None
+
+    def _cell_corners_in_region(self, bbox, region):
+        """Все углы ячейки относятся к тому же региону (по кэшу или через Nominatim)"""
+        min_lat, min_lon, max_lat, max_lon = bbox
+        for latitude, longitude in [(min_lat, min_lon), (min_lat, max_lon), (max_lat, min_lon), (max_lat, max_lon)]:
+            corner_region = (self.geohash_cache.lookup(latitude, longitude, self.offline_geocoder.version) or
+                             self.geocoding_queue.geocode(latitude, longitude))
+            if not corner_region or corner_region[0] != region[0]:
+                return False
+        return True
+
+    def _migrate_coordinates_cache(self):
+        """Переносит точки из старого кэша координат (ключи с 4 знаками) в кэш геохэшей"""
+        coords_data = self._load_json(self.coordinates_path) or {}
+        points = []
+        for cache_key, entry in coords_data.get('coordinates_cache', {}).items():
+            try:
+                latitude, longitude = (float(value) for value in cache_key.split('_'))
+            except ValueError:
+                continue
+            points.append((latitude, longitude, entry))
+        if points:
+            self.geohash_cache.import_points(points)
+
+    def get_region_id(self, region_name):
+        """Канонический идентификатор (имя файла) региона по любому написанию названия"""
+        return self.region_registry.resolve(region_name) or normalize_region_id(region_name)
+
+    def add_coordinate_quality(self, animal_data, region_name=None):
+        """Проставляет записям маску качества координат (coord_quality) векторно; возвращает массив масок.
+
+        Точка вне полигона своего региона отмечается, только если есть файл границ и регион в нем найден.
+        """
+        latitudes = coordinate_arrays(animal_data, 'decimalLatitude')
+        longitudes = coordinate_arrays(animal_data, 'decimalLongitude')
+
+        outside_region = None
+        region_id = self.get_region_id(region_name) if region_name else None
+        if region_id and self.offline_geocoder.load():
+            region_ids = np.array([self.get_region_id(name_en) for _, name_en in self.offline_geocoder.regions] + [None],
+                                  dtype=object)
+            if region_id in region_ids:
+                # Индекс -1 (точка вне всех регионов) указывает на последний элемент - None
+                outside_region = region_ids[self.offline_geocoder.locate_many(latitudes, longitudes)] != region_id
+
+        flags = quality_flags(latitudes, longitudes, coordinate_arrays(animal_data, 'coordinateUncertaintyInMeters'),
+                              outside_region=outside_region, max_uncertainty_m=self.max_coordinate_uncertainty_m)
+        for animal, mask in zip(animal_data, flags.tolist()):
+            animal['coord_quality'] = mask
+        return flags
+
+    def get_region_info(self, region_name):
+        """Описание региона из справочника: названия, файл данных, центр и прямоугольник"""
+        if not self._region_geometry_loaded:
+            self._load_region_geometry()
+        return self.region_registry.get(region_name)
+
+    def _load_region_geometry(self):
+        """Прямоугольники регионов: по файлу границ, а без него - по охвату сохраненных находок"""
+        self._region_geometry_loaded = True
+        if self.offline_geocoder.load():
+            bboxes = {}
+            for part in self.offline_geocoder.parts:
+                min_lon, min_lat, max_lon, max_lat = part.bbox
+                _, name_en = self.offline_geocoder.regions[part.region_index]
+                bbox = bboxes.setdefault(name_en, [min_lat, min_lon, max_lat, max_lon])
+                bbox[:] = [min(bbox[0], min_lat), min(bbox[1], min_lon), max(bbox[2], max_lat), max(bbox[3], max_lon)]
+            for name_en, bbox in bboxes.items():
+                self.region_registry.set_geometry(name_en, bbox=bbox)
+
+        for normalized_name, region in self.get_spatial_index().regions.items():
+            info = self.region_registry.get(normalized_name)
+            if info is not None and info['bbox'] is None and region.get('bbox'):
+                self.region_registry.set_geometry(normalized_name, bbox=region['bbox'])
+
+    def migrate_region_files(self, apply=False):
+        """Разовая миграция: файлы регионов и файл ключей под канонические имена.
+
+        По умолчанию только показывает план; изменения вносятся при apply=True. Возвращает список изменений.
+        """
+        changes = []
+        renames = []
+        for filename in sorted(os.listdir(self.regions_path)):
+            if not filename.endswith('.json'):
+                continue
+            region_id = self.get_region_id(filename[:-5])
+            if filename[:-5] == region_id:
+                continue
+            target = os.path.join(self.regions_path, f"{region_id}.json")
+            if os.path.exists(target):
+                # Данные не затираем: дубль нужно объединить вручную
+                changes.append(f"⚠️ {filename}: уже есть {region_id}.json - файл оставлен без изменений")
+                continue
+            renames.append((os.path.join(self.regions_path, filename), target))
+            changes.append(f"📁 {filename} -> {region_id}.json")
+
+        keys_data = self._load_json(self.keys_path) or {"regions": {}, "last_updated": None}
+        regions = {}
+        sources = {}
+        for region_key, region_info in keys_data.get("regions", {}).items():
+            region_id = self.get_region_id(region_key)
+            entry = {
+                **region_info,
+                "name_ru": self.region_registry.name_ru(region_id) or region_info.get("name_ru", region_key),
+                "data_file": f"{region_id}.json"
+            }
+            if region_id in regions:
+                # Из дублей ("Amur" и "amur") остается более свежая запись, вторая попадает в отчет
+                previous_key = sources[region_id]
+                if (regions[region_id].get("last_updated") or '') >= (region_info.get("last_updated") or ''):
+                    changes.append(f"⚠️ {self.keys_path}: запись {region_key} объединена с {previous_key} "
+                                   f"(оставлена более свежая {previous_key})")
+                    continue
+                changes.append(f"⚠️ {self.keys_path}: запись {previous_key} объединена с {region_key} "
+                               f"(оставлена более свежая {region_key})")
+            elif region_key != region_id:
+                changes.append(f"🔑 {self.keys_path}: {region_key} -> {region_id}")
+            regions[region_id] = entry
+            sources[region_id] = region_key
+        keys_changed = regions != keys_data.get("regions", {})
+        if keys_changed and not any(change.startswith(f"🔑 {self.keys_path}") or
+                                    change.startswith(f"⚠️ {self.keys_path}") for change in changes):
+            changes.append(f"🔑 {self.keys_path}: обновлены названия и имена файлов регионов")
+
+        if not changes:
+            print("✅ Файлы регионов уже под каноническими именами")
+            return changes
+
+        print("📋 Миграция файлов регионов:" if apply else "📋 Миграция файлов регионов (только план, без изменений):")
+        for change in changes:
+            print(f"   {change}")
+
+        if apply:
+            for source, target in renames:
+                os.replace(source, target)
+            if keys_changed:
+                keys_data["regions"] = regions
+                self._save_json(self.keys_path, keys_data)
+            print(f"✅ Миграция выполнена: переименовано файлов - {len(renames)}")
+        return changes
+
+    def assign_regions(self, animals, filed_region_en=None, with_districts=False):
+        """Определяет регион (и район) каждой записи по координатам за один векторный проход.
+
+        Возвращает DataFrame с колонками region_id, region_name_ru, [district] и region_mismatch -
+        координаты лежат в другом регионе, чем тот, под которым записи сохранены.
+        """
+        df = animals.copy() if hasattr(animals, 'columns') else pd.DataFrame(animals)
+        if df.empty:
+            return df
+
+        if not self.offline_geocoder.available:
+            print(f"⚠️ Нет файла границ регионов {self.boundaries_path} - регионы по координатам не определить")
+
+        latitudes, longitudes = (
+            pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float) if column in df.columns
+            else np.full(len(df), np.nan) for column in ['decimalLatitude', 'decimalLongitude'])
+
+        region_indexes = self.offline_geocoder.locate_many(latitudes, longitudes)
+        region_ids = np.array([None] + [self.get_region_id(name_en)
+                                        for _, name_en in self.offline_geocoder.regions], dtype=object)
+        region_names = np.array([None] + [name_ru for name_ru, _ in self.offline_geocoder.regions], dtype=object)
+        df['region_id'] = region_ids[region_indexes + 1]
+        df['region_name_ru'] = region_names[region_indexes + 1]
+
+        if with_districts and self.districts_geocoder.available:
+            district_indexes = self.districts_geocoder.locate_many(latitudes, longitudes)
+            district_names = np.array([None] + [name for name, _ in self.districts_geocoder.regions], dtype=object)
+            df['district'] = district_names[district_indexes + 1]
+
+        if filed_region_en:
+            filed_region_id = self.get_region_id(filed_region_en)
+            df['region_mismatch'] = df['region_id'].notna() & (df['region_id'] != filed_region_id)
+
+        return df
+
+    def check_region_assignment(self, normalized_name, with_districts=False):
+        """Проверяет, что координаты записей региона лежат в этом регионе; печатает сводку"""
+        animals = self.get_region_data(normalized_name)
+        if not animals:
+            return None
+
+        metadata = self.get_region_metadata(normalized_name)
+        df = self.assign_regions(animals, metadata.get('region_name_en', normalized_name), with_districts)
+
+        located = df['region_id'].notna()
+        mismatches = df[df['region_mismatch']]
+        print(f"\n📍 ПРОВЕРКА КООРДИНАТ: {metadata.get('region_name_ru', normalized_name)}")
+        print(f"   Записей: {len(df)}, определен регион: {int(located.sum())}, "
+              f"в другом регионе: {len(mismatches)}")
+        for region_name, count in mismatches['region_name_ru'].value_counts().head(5).items():
+            print(f"   • {region_name}: {count}")
+
+        if 'district' in df.columns:
+            print("   Районы:")
+            for district, count in df['district'].value_counts().head(10).items():
+                print(f"   • {district}: {count}")
+
+        return df
 
     def get_regions_statistics(self):
         """Получает статистику по всем сохраненным регионам"""
@@ -253,7 +518,7 @@ class DataManager:
                 regions_stats[region_en] = {
                     'name_ru': region_info.get('name_ru', region_en),
                     'total_animals': len(region_data),
-                    'unique_species': df['scientific_name'].nunique(),
+                    'unique_species': df['name_key'].nunique(),
                     'class_distribution': class_stats,
                     'last_updated': region_info.get('last_updated', 'Неизвестно')
                 }
@@ -262,16 +527,15 @@ class DataManager:
 
     def _translate_region_to_english(self, region_name_ru):
         """Переводит название региона на английский для GBIF"""
-        # Используем публичный словарь
-        for ru_name, en_name in self.russian_to_english.items():
-            if region_name_ru in ru_name or ru_name in region_name_ru:
-                return en_name
+        name_en = self.region_registry.name_en(region_name_ru)
+        if name_en:
+            return name_en
 
         return region_name_ru.replace(' ', '').replace('область', 'Oblast').replace('край', 'Krai')
 
     def _get_region_filename(self, region_name_en):
         """Генерирует имя файла для региона"""
-        return f"{region_name_en.lower()}.json"
+        return f"{self.get_region_id(region_name_en)}.json"
 
     def _get_region_filepath(self, region_name_en):
         """Получает полный путь к файлу региона"""
@@ -309,25 +573,81 @@ class DataManager:
         filepath = self._get_region_filepath(region_name_en)
         return os.path.exists(filepath)
 
-    def get_region_data(self, region_name_en):
-        """Получает данные по региону"""
-        filepath = self._get_region_filepath(region_name_en)
-        data = self._load_json(filepath)
-        if data and 'animals' in data:
-            return data['animals']
-        return []
+    def get_region_version(self, normalized_name):
+        """Возвращает версию данных региона (меняется при каждой перезаписи файла)"""
+        normalized_name = self.get_region_id(normalized_name)
+        filepath = self._get_region_filepath(normalized_name)
+        try:
+            return f"{normalized_name}:{os.stat(filepath).st_mtime_ns}:n{NAME_PARSER_VERSION}"
+        except OSError:
+            return None
 
     def get_region_metadata(self, region_name_en):
         """Получает метаданные региона"""
-        filepath = self._get_region_filepath(region_name_en)
-        data = self._load_json(filepath)
+        data = self._load_region_file(region_name_en)
         return data.get('metadata', {}) if data else {}
 
-    def save_region_data(self, region_name_en, region_name_ru, animal_data):
+    def _load_region_file(self, normalized_name):
+        """Загружает файл региона, повторно используя разобранные данные пока файл не изменился"""
+        normalized_name = self.get_region_id(normalized_name)
+        filepath = self._get_region_filepath(normalized_name)
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except OSError:
+            self._region_files_cache.pop(normalized_name, None)
+            return None
+
+        cached = self._region_files_cache.get(normalized_name)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+        data = self._load_json(filepath)
+        if data is not None:
+            # Старые файлы сохранены без ключей канонических имен и масок координат - добавляем при загрузке
+            keys_before = [animal.get('name_key') for animal in data.get('animals', [])]
+            for animal in data.get('animals', []):
+                add_name_keys(animal)
+            if keys_before != [animal['name_key'] for animal in data.get('animals', [])]:
+                # Ключи пересчитаны новыми правилами разбора - сохраненный индекс видов устарел
+                data.pop('species_index', None)
+            if data.get('animals') and 'coord_quality' not in data['animals'][0]:
+                self.add_coordinate_quality(data['animals'], normalized_name)
+            self._region_files_cache[normalized_name] = (mtime_ns, data)
+        return data
+
+    def get_species_index(self, normalized_name):
+        """Получает индекс видов региона (строится на лету для старых файлов без индекса)"""
+        data = self._load_region_file(normalized_name)
+        if not data:
+            return {}
+
+        species_index = data.get('species_index')
+        if species_index is None or any('canonical_name' not in entry or 'bbox' not in entry
+                                        for entry in species_index.values()):
+            # Нет индекса или он построен старой версией (по сырым научным названиям, без охвата)
+            data['species_index'] = self.build_species_index(data.get('animals', []))
+        return data['species_index']
+
+    def save_region_data(self, region_name_en, region_name_ru, animal_data, translation_version=None):
         """Сохраняет данные о животных региона с нормализованным именем файла"""
-        # Нормализуем имя файла - только латинские символы в нижнем регистре
-        normalized_name = "".join(c for c in region_name_en if c.isalnum()).lower()
+        # Канонический идентификатор региона - одно имя файла для любого написания названия
+        normalized_name = self.get_region_id(region_name_en)
+        region_name_ru = self.region_registry.name_ru(normalized_name) or region_name_ru
+
+        # Проверка координат: маска качества в каждой записи, отбрасываем только записи с drop_coordinate_flags
+        flags = self.add_coordinate_quality(animal_data, normalized_name)
+        flag_counts = summarize_flags(flags)
+        if flag_counts:
+            print(f"📍 Проблемы координат: {flag_counts}")
+        if self.drop_coordinate_flags:
+            animal_data = [animal for animal, mask in zip(animal_data, flags.tolist())
+                           if not mask & self.drop_coordinate_flags]
+
+        # Каноническое имя и ключ вида вычисляются один раз при сохранении
+        for animal in animal_data:
+            add_name_keys(animal)
 
+        species_index = self.build_species_index(animal_data)
         region_data = {
             "metadata": {
                 "region_name_ru": region_name_ru,
@@ -335,10 +655,12 @@ class DataManager:
                 "normalized_name": normalized_name,
                 "last_updated": datetime.now().isoformat(),
                 "total_records": len(animal_data),
-                "unique_species": len(set([animal.get('scientific_name', '') for animal in animal_data]))
+                "unique_species": len(set(animal['name_key'] for animal in animal_data if animal['name_key'])),
+                "translation_version": translation_version
             },
             "animals": animal_data,
-            "statistics": self._calculate_statistics(animal_data)
+            "statistics": self._calculate_statistics(animal_data),
+            "species_index": species_index
         }
 
         filepath = os.path.join(self.regions_path, f"{normalized_name}.json")
@@ -348,25 +670,144 @@ class DataManager:
             # Исправленный вызов - передаем только 2 аргумента
             self._update_region_keys(normalized_name, region_name_ru)
 
-        return success
-
-    def _update_region_keys(self, normalized_name, region_name_ru):
-        """Обновляет файл ключей регионов с нормализованными именами"""
-        keys_data = self._load_json(self.keys_path) or {"regions": {}, "last_updated": None}
+            # Глобальные индексы обновляются только по этому региону
+            version = self.get_region_version(normalized_name)
+            for index in [self.get_name_search_index(sync=False), self.get_species_regions_index(sync=False)]:
+                index.update_region(normalized_name, region_name_ru, species_index, version=version)
+            for index in [self.get_spatial_index(sync=False), self.get_species_grid(sync=False),
+                          self.get_species_ranges_index(sync=False)]:
+                index.update_region(normalized_name, region_name_ru, animal_data, version=version)
 
-        keys_data["regions"][normalized_name] = {
-            "name_ru": region_name_ru,
-            "data_file": f"{normalized_name}.json",
-            "last_updated": datetime.now().isoformat()
-        }
-        keys_data["last_updated"] = datetime.now().isoformat()
+        return success
 
-        self._save_json(self.keys_path, keys_data)
+    def get_name_search_index(self, sync=True):
+        """Индекс поиска по названиям; при sync доиндексирует регионы, измененные с прошлого запуска"""
+        if self._name_search is None:
+            self._name_search = NameSearchIndex(self.name_search_path)
+        if sync:
+            self._sync_region_index(self._name_search)
+        return self._name_search
+
+    def get_species_regions_index(self, sync=True):
+        """Обратный индекс вид -> регионы; при sync доиндексирует измененные регионы"""
+        if self._species_regions is None:
+            self._species_regions = SpeciesRegionIndex(self.species_regions_path)
+        if sync:
+            self._sync_region_index(self._species_regions)
+        return self._species_regions
+
+    def get_spatial_index(self, sync=True):
+        """Пространственный индекс находок; при sync доиндексирует измененные регионы"""
+        if self._spatial_index is None:
+            self._spatial_index = OccurrenceSpatialIndex(self.spatial_index_dir, self.spatial_tile_size)
+        if sync:
+            self._sync_region_index(self._spatial_index, self.get_region_data)
+        return self._spatial_index
+
+    def get_species_grid(self, sync=True):
+        """Сетка биоразнообразия; при sync переагрегирует измененные регионы"""
+        if self._species_grid is None:
+            self._species_grid = SpeciesGrid(self.grid_dir)
+        if sync:
+            self._sync_region_index(self._species_grid, self.get_region_data)
+        return self._species_grid
+
+    def get_grid_cells(self, min_lat, min_lon, max_lat, max_lon, zoom=None, resolution=None):
+        """Ячейки сетки биоразнообразия в прямоугольнике (разрешение - по масштабу карты или явно)"""
+        return self.get_species_grid().query_bbox(min_lat, min_lon, max_lat, max_lon, zoom=zoom,
+                                                  resolution=resolution)
+
+    def get_species_ranges_index(self, sync=True):
+        """Индекс ареалов видов; при sync пересчитывает оболочки измененных регионов"""
+        if self._species_ranges is None:
+            self._species_ranges = SpeciesRangeIndex(self.ranges_dir)
+        if sync:
+            self._sync_region_index(self._species_ranges, self.get_region_data)
+        return self._species_ranges
+
+    def get_species_range(self, species_key, method='convex', alpha_km=None, regions=None):
+        """Ареал вида по сохраненным находкам: выпуклая ('convex') или альфа-оболочка ('alpha')"""
+        if regions is not None:
+            regions = [self.get_region_id(region) for region in regions]
+        return self.get_species_ranges_index().get_range(species_key, method, alpha_km, regions)
+
+    def compare_species_ranges(self, species_keys, method='convex', alpha_km=None):
+        """Сравнение ареалов нескольких видов: площадь, крайние точки, регионы"""
+        return self.get_species_ranges_index().compare_ranges(species_keys, method, alpha_km)
+
+    def get_species_region_ranges(self, species_key, method='convex', alpha_km=None):
+        """Ареал вида по каждому региону отдельно"""
+        return self.get_species_ranges_index().region_ranges(species_key, method, alpha_km)
+
+    def _resolve_occurrences(self, hits):
+        """Записи по результатам пространственного запроса (с расстоянием, если оно есть).
+
+        Индекс хранит только номера записей - сами записи читаются из файлов регионов
+        (разобранный файл кэшируется).
+        """
+        animals = []
+        for normalized_name, position, distance, tile in hits:
+            animal = dict(self.get_region_data(normalized_name)[position])
+            animal['region_id'] = normalized_name
+            if distance is not None:
+                animal['distance_km'] = round(distance, 3)
+            animals.append(animal)
+        return animals
+
+    def find_occurrences_in_radius(self, latitude, longitude, radius_km, species_keys=None, classes=None,
+                                   limit=None):
+        """Сохраненные находки в радиусе от точки (по возрастанию расстояния)"""
+        hits = self.get_spatial_index().query_radius(latitude, longitude, radius_km, species_keys, classes)
+        return self._resolve_occurrences(hits[:limit] if limit else hits)
+
+    def find_nearest_occurrences(self, latitude, longitude, k=10, species_keys=None, classes=None):
+        """k ближайших сохраненных находок"""
+        hits = self.get_spatial_index().query_nearest(latitude, longitude, k, species_keys, classes)
+        return self._resolve_occurrences(hits)
+
+    def find_occurrences_in_bbox(self, min_lat, min_lon, max_lat, max_lon, species_keys=None, classes=None):
+        """Сохраненные находки внутри прямоугольника координат"""
+        hits = self.get_spatial_index().query_bbox(min_lat, min_lon, max_lat, max_lon, species_keys, classes)
+        return self._resolve_occurrences(hits)
+
+    def _sync_region_index(self, index, load_region=None):
+        """Приводит глобальный индекс в соответствие с файлами регионов (по версиям данных).
+
+        load_region(normalized_name) - данные региона для индекса (по умолчанию - индекс видов).
+        """
+        load_region = load_region or self.get_species_index
+        on_disk = set(self.get_region_id(filename[:-5]) for filename in os.listdir(self.regions_path)
+                      if filename.endswith('.json'))
+        changed = False
+
+        for normalized_name in set(index.regions) - on_disk:
+            index.remove_region(normalized_name, save=False)
+            changed = True
+
+        for normalized_name in sorted(on_disk):
+            version = self.get_region_version(normalized_name)
+            if index.region_version(normalized_name) == version:
+                continue
+            region_name_ru = (self.region_registry.name_ru(normalized_name)
+                              or self.get_region_metadata(normalized_name).get('region_name_ru', normalized_name))
+            index.update_region(normalized_name, region_name_ru,
+                                load_region(normalized_name), version=version, save=False)
+            changed = True
+
+        if changed:
+            index.save()
+
+    def get_species_regions(self, species_key):
+        """Регионы, где встречается вид (по ключу канонического имени), со статистикой находок"""
+        return self.get_species_regions_index().get_species_regions(species_key)
+
+    def search_species(self, query, limit=10):
+        """Ищет виды по русскому или латинскому названию во всех сохраненных регионах"""
+        return self.get_name_search_index().search(query, limit=limit)
 
     def get_region_data(self, normalized_name):
         """Получает данные по региону по нормализованному имени"""
-        filepath = os.path.join(self.regions_path, f"{normalized_name}.json")
-        data = self._load_json(filepath)
+        data = self._load_region_file(normalized_name)
         if data and 'animals' in data:
             return data['animals']
         return []
@@ -381,9 +822,9 @@ class DataManager:
 
             stats = {
                 "total_animals": len(animal_data),
-                "unique_species": df['scientific_name'].nunique(),
+                "unique_species": df['name_key'].nunique(),
                 "class_distribution": df['class'].value_counts().to_dict(),
-                "top_species": df['scientific_name'].value_counts().head(10).to_dict(),
+                "top_species": df['canonical_name'].value_counts().head(10).to_dict(),
                 "records_by_year": self._extract_year_stats(animal_data)
             }
 
@@ -396,19 +837,71 @@ class DataManager:
         """Извлекает статистику по годам"""
         year_counts = {}
         for animal in animal_data:
-            event_date = animal.get('eventDate', '')
-            if event_date and len(event_date) >= 4:
-                year = event_date[:4]
-                if year.isdigit():
-                    year_counts[year] = year_counts.get(year, 0) + 1
+            year = self._extract_year(animal.get('eventDate', ''))
+            if year:
+                year_counts[year] = year_counts.get(year, 0) + 1
 
         return dict(sorted(year_counts.items()))
 
+    def _extract_year(self, event_date):
+        """Извлекает год из даты события (или None)"""
+        if event_date and len(event_date) >= 4:
+            year = event_date[:4]
+            if year.isdigit():
+                return year
+        return None
+
+    def build_species_index(self, animal_data):
+        """Строит индекс видов (по ключу канонического имени): количество находок, пример записи,
+        таксономия, годы наблюдений и охват координат"""
+        species_index = {}
+
+        for animal in animal_data:
+            species_key = add_name_keys(animal)['name_key']
+            if not species_key:
+                continue
+
+            entry = species_index.get(species_key)
+            if entry is None:
+                entry = species_index[species_key] = {
+                    'count': 0,
+                    'scientific_name': animal['scientific_name'],
+                    'canonical_name': animal['canonical_name'],
+                    'record': animal,
+                    'common_name': animal.get('common_name', 'Не указано'),
+                    'first_year': None,
+                    'last_year': None,
+                    'bbox': None  # [мин. широта, мин. долгота, макс. широта, макс. долгота]
+                }
+                for field in ['class', 'order', 'family']:
+                    entry[field] = animal.get(field, 'Не указано')
+                    entry[f'{field}_ru'] = animal.get(f'{field}_ru', 'Не указано')
+
+            entry['count'] += 1
+
+            year = self._extract_year(animal.get('eventDate', ''))
+            if year:
+                if entry['first_year'] is None or year < entry['first_year']:
+                    entry['first_year'] = year
+                if entry['last_year'] is None or year > entry['last_year']:
+                    entry['last_year'] = year
+
+            if is_clean(animal):
+                latitude, longitude = animal['decimalLatitude'], animal['decimalLongitude']
+                bbox = entry['bbox']
+                if bbox is None:
+                    entry['bbox'] = [latitude, longitude, latitude, longitude]
+                else:
+                    bbox[0], bbox[1] = min(bbox[0], latitude), min(bbox[1], longitude)
+                    bbox[2], bbox[3] = max(bbox[2], latitude), max(bbox[3], longitude)
+
+        return species_index
+
     def _update_region_keys(self, region_name_en, region_name_ru):
         """Обновляет файл ключей регионов"""
         keys_data = self._load_json(self.keys_path) or {"regions": {}, "last_updated": None}
 
-        keys_data["regions"][region_name_en] = {
+        keys_data["regions"][self.get_region_id(region_name_en)] = {
             "name_ru": region_name_ru,
             "data_file": self._get_region_filename(region_name_en),
             "last_updated": datetime.now().isoformat()
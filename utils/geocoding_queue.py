@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, as_completed
+from utils.geohash import encode
+
+
+class GeocodingQueue:
+    """Очередь обратного геокодирования: один фоновый поток, общий лимит запросов, слияние близких точек.
+
+    reverse(широта, долгота) вызывается только из фонового потока и не чаще раза в min_interval секунд;
+    точки в одной ячейке геохэша точности dedup_precision, пока запрос ячейки в очереди или выполняется,
+    получают один общий запрос. Готовые ответы не хранятся: повторное использование - через кэш геохэшей.
+    """
+
+    def __init__(self, reverse, min_interval=1.0, dedup_precision=7, persist=None, persist_every=20,
+                 idle_timeout=2.0):
+        self.reverse = reverse
+        self.min_interval = min_interval
+        self.dedup_precision = dedup_precision  # 7 - ячейка ~150 x 150 м
+        self.persist = persist  # Сохранение результатов на диск (пачкой, а не после каждого запроса)
+        self.persist_every = persist_every
+        self.idle_timeout = idle_timeout  # Поток завершается, если очередь пуста столько секунд
+
+        self._futures = {}  # геохэш -> Future (только в очереди или выполняется)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._last_call = 0.0
+        self._unsaved = 0
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'requests': 0, 'errors': 0}
+
+    def submit(self, latitude, longitude):
+        """Ставит точку в очередь; возвращает Future с результатом reverse (общий для близких точек)"""
+        key = encode(latitude, longitude, self.dedup_precision)
+        with self._lock:
+            self.stats['submitted'] += 1
+            future = self._futures.get(key)
+            if future is not None:
+                self.stats['deduplicated'] += 1
+                return future
+
+            future = self._futures[key] = Future()
+            self._queue.put((key, latitude, longitude, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="geocoding-queue", daemon=True)
+                self._worker.start()
+        return future
+
+    def geocode(self, latitude, longitude, timeout=None):
+        """Результат для одной точки (ждет своей очереди с учетом общего лимита)"""
+        return self.submit(latitude, longitude).result(timeout)
+
+    def stream(self, points):
+        """Ставит точки в очередь и отдает (широта, долгота, результат) по мере готовности"""
+        waiting = {}
+        for latitude, longitude in points:
+            waiting.setdefault(self.submit(latitude, longitude), []).append((latitude, longitude))
+
+        for future in as_completed(waiting):
+            try:
+                result = future.result()
+            except Exception:
+                result = None
+            for latitude, longitude in waiting[future]:
+                yield latitude, longitude, result
+
+    def _run(self):
+        """Фоновый поток: запросы по одному с общим лимитом, сохранение пачками"""
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._persist()
+                with self._lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+
+            key, latitude, longitude, future = item
+            if not future.set_running_or_notify_cancel():
+                self._forget(key)
+                continue
+
+            wait = self._last_call + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                result = self.reverse(latitude, longitude)
+            except Exception as e:
+                self.stats['errors'] += 1
+                self._forget(key)
+                future.set_exception(e)
+                continue
+            finally:
+                self._last_call = time.monotonic()
+                self.stats['requests'] += 1
+
+            # Ответ ячейки не запоминаем: точка у границы региона должна получить свой ответ,
+            # а сохраненные результаты проверяет кэш геохэшей (внутренние ячейки и точные точки)
+            self._forget(key)
+            future.set_result(result)
+
+            self._unsaved += 1
+            if self._unsaved >= self.persist_every:
+                self._persist()
+
+    def _forget(self, key):
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def _persist(self):
+        if self.persist is not None and self._unsaved:
+            self.persist()
+        self._unsaved = 0
+
+    def pending(self):
+        """Сколько точек ждет в очереди"""
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """Дожидается обработки очереди и сохраняет результаты"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        self._persist()
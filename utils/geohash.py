@@ -0,0 +1,56 @@
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BASE32_INDEX = {char: index for index, char in enumerate(BASE32)}
+
+
+def encode(latitude, longitude, precision=8):
+    """Геохэш точки заданной длины"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    # Долготы вне [-180, 180] (например, 185 для Чукотки) приводим к стандартному диапазону
+    longitude = (longitude + 180.0) % 360.0 - 180.0
+
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value_range, value = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def decode_bbox(geohash):
+    """Прямоугольник ячейки: (мин. широта, мин. долгота, макс. широта, макс. долгота)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        index = BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if (index >> shift) & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def prefixes(geohash, min_precision=1):
+    """Префиксы геохэша от коротких к длинным"""
+    return [geohash[:length] for length in range(min_precision, len(geohash) + 1)]
@@ -0,0 +1,84 @@
+from datetime import datetime
+from utils.geohash import encode, decode_bbox, prefixes
+from utils.write_behind import WriteBehindJSONStore
+
+
+class GeohashRegionCache:
+    """Кэш регионов по геохэшам: ячейки целиком внутри региона и отдельные точки у границ"""
+
+    POINT_PRECISION = 8  # ~38 x 19 м
+    MIN_CELL_PRECISION = 3  # ~156 x 156 км
+    MAX_CELL_PRECISION = 7  # ~153 x 153 м
+
+    # Срок жизни записей, полученных из Nominatim (30 дней, как раньше)
+    CACHE_TTL = 30 * 24 * 3600
+
+    def __init__(self, path="data/cache/geohash_regions.json"):
+        # cell:<геохэш> - внутренняя ячейка, point:<геохэш> - точка, определенная геокодером
+        self.store = WriteBehindJSONStore(path)
+
+    def _is_valid(self, entry, boundaries_version=None):
+        """Запись актуальна: ячейки из файла границ - пока файл не менялся, остальное - по сроку жизни"""
+        source = entry.get('source', '')
+        if source.startswith('boundaries'):
+            return source == boundaries_version
+        return datetime.now().timestamp() - entry.get('timestamp', 0) < self.CACHE_TTL
+
+    def lookup(self, latitude, longitude, boundaries_version=None):
+        """Регион из кэша: сначала по внутренним ячейкам (от крупных к мелким), затем по точке"""
+        geohash = encode(latitude, longitude, self.POINT_PRECISION)
+
+        for prefix in prefixes(geohash[:self.MAX_CELL_PRECISION], self.MIN_CELL_PRECISION):
+            entry = self.store.get(f"cell:{prefix}")
+            if entry and self._is_valid(entry, boundaries_version):
+                return tuple(entry['region'])
+
+        entry = self.store.get(f"point:{geohash}")
+        if entry and self._is_valid(entry, boundaries_version):
+            return tuple(entry['region'])
+        return None
+
+    def add_point(self, latitude, longitude, region, source='nominatim', address=None):
+        """Запоминает регион точки"""
+        entry = {'region': list(region), 'source': source, 'timestamp': datetime.now().timestamp()}
+        if address:
+            entry['address'] = address
+        self.store.set(f"point:{encode(latitude, longitude, self.POINT_PRECISION)}", entry)
+
+    def add_cell(self, geohash, region, source):
+        """Запоминает ячейку, целиком лежащую в регионе"""
+        self.store.set(f"cell:{geohash}", {
+            'region': list(region),
+            'source': source,
+            'timestamp': datetime.now().timestamp()
+        })
+
+    def learn_interior(self, latitude, longitude, region, is_covered, source,
+                       min_precision=None, max_precision=None):
+        """Ищет самую крупную ячейку вокруг точки, лежащую в регионе целиком, и запоминает ее.
+
+        is_covered(bbox) проверяет прямоугольник (мин. широта, мин. долгота, макс. широта, макс. долгота).
+        """
+        min_precision = min_precision or self.MIN_CELL_PRECISION
+        max_precision = max_precision or self.MAX_CELL_PRECISION
+
+        geohash = encode(latitude, longitude, max_precision)
+        for prefix in prefixes(geohash, min_precision):
+            if is_covered(decode_bbox(prefix)):
+                self.add_cell(prefix, region, source)
+                return prefix
+        return None
+
+    def import_points(self, points, source='nominatim'):
+        """Переносит точки из старого кэша координат: [(широта, долгота, запись)]"""
+        for latitude, longitude, entry in points:
+            self.store.set(f"point:{encode(latitude, longitude, self.POINT_PRECISION)}", {
+                'region': [entry['region_name_ru'], entry['region_name_en']],
+                'source': source,
+                'timestamp': entry.get('timestamp', 0),
+                'address': entry.get('address')
+            })
+        self.store.flush()
+
+    def __len__(self):
+        return len(self.store)
@@ -0,0 +1,169 @@
+import os
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from utils.write_behind import WriteBehindJSONStore
+from utils.metrics import resolution_metrics
+
+
+class LineageResolver:
+    """Родословные видов GBIF по speciesKey с русскими названиями всех рангов"""
+
+    RANKS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']
+    RUSSIAN_LANGUAGES = ('rus', 'ru')
+    API_URL = "https://api.gbif.org/v1/species"
+
+    # Срок жизни кэша (30 дней, как у кэша переводов)
+    CACHE_TTL = 30 * 24 * 3600
+
+    def __init__(self, cache_dir="data/cache", backbone=None, offline=False):
+        self.backbone = backbone  # Локальный индекс GBIF Backbone (источник названий без API)
+        self.offline = offline
+        # Таксоны, запрос названия которых не удался: в этой сессии не повторяем (на диск не сохраняется)
+        self._failed = set()
+        os.makedirs(cache_dir, exist_ok=True)
+        # species:<key> - классификация вида, taxon:<key> - русское название таксона
+        self.store = WriteBehindJSONStore(os.path.join(cache_dir, "taxonomy_lineages.json"))
+
+    @staticmethod
+    def to_key(value):
+        """Приводит ключ GBIF к int (None - для пустых значений и NaN)"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _cached(self, cache_key):
+        """Запись кэша, если она не устарела"""
+        entry = self.store.get(cache_key)
+        if entry and datetime.now().timestamp() - entry.get('timestamp', 0) < self.CACHE_TTL:
+            return entry
+        return None
+
+    def _fetch_classification(self, species_key):
+        """Классификация вида по ключу: ключи и названия всех рангов (один запрос)"""
+        try:
+            response = resolution_metrics.api_get('api_classification', f"{self.API_URL}/{species_key}", timeout=10)
+            if response.status_code == 200:
+                usage = response.json()
+                return {rank: {'key': usage.get(f'{rank}Key'), 'name': usage.get(rank)}
+                        for rank in self.RANKS if usage.get(rank)}
+            resolution_metrics.count('api_classification', 'api_errors')
+        except requests.RequestException:
+            pass  # Уже учтено в api_errors
+        except ValueError as e:
+            resolution_metrics.error('api_classification', e)
+        return None
+
+    def _fetch_russian_name(self, taxon_key):
+        """Русское название таксона по ключу ('' - если его нет, None - при ошибке запроса или без API)"""
+        if self.backbone is not None and self.backbone.available:
+            started = time.perf_counter()
+            name = self.backbone.get_russian_name_by_key(taxon_key)
+            resolution_metrics.record_lookup('backbone', started, name)
+            if name:
+                return name
+        if self.offline:
+            # Отсутствие в backbone не значит, что названия нет - ответ неизвестен
+            return None
+
+        try:
+            response = resolution_metrics.api_get('api_vernacular', f"{self.API_URL}/{taxon_key}/vernacularNames",
+                                                  params={'limit': 1000}, timeout=10)
+            if response.status_code == 200:
+                for vernacular in response.json().get('results', []):
+                    if vernacular.get('language') in self.RUSSIAN_LANGUAGES and vernacular.get('vernacularName'):
+                        resolution_metrics.hit('api_vernacular')
+                        return vernacular['vernacularName']
+                resolution_metrics.miss('api_vernacular')
+                return ''
+            resolution_metrics.count('api_vernacular', 'api_errors')
+        except requests.RequestException:
+            pass  # Уже учтено в api_errors
+        except ValueError as e:
+            resolution_metrics.error('api_vernacular', e)
+        return None
+
+    def resolve_names(self, taxon_keys, max_workers=8):
+        """Русские названия набора таксонов: кэш сразу, остальное - параллельно"""
+        return {taxon_key: name for taxon_key, name in self._resolve_names(taxon_keys, max_workers).items() if name}
+
+    def _resolve_names(self, taxon_keys, max_workers=8):
+        """Названия набора таксонов ('' - названия точно нет; таксоны без ответа отсутствуют)"""
+        names = {}
+        missing = []
+        for taxon_key in set(taxon_keys):
+            entry = self._cached(f"taxon:{taxon_key}")
+            resolution_metrics.count('lineage_cache', 'hits' if entry is not None else 'misses')
+            if entry is not None:
+                names[taxon_key] = entry['name_ru']
+            elif taxon_key not in self._failed:
+                missing.append(taxon_key)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                for taxon_key, name in zip(missing, executor.map(self._fetch_russian_name, missing)):
+                    if name is None:
+                        self._failed.add(taxon_key)
+                        continue
+                    names[taxon_key] = name
+                    if not self.offline:
+                        self.store.set(f"taxon:{taxon_key}", {
+                            'name_ru': name,
+                            'timestamp': datetime.now().timestamp()
+                        })
+
+        return names
+
+    def resolve(self, species_keys, max_workers=8):
+        """Родословные набора видов: {speciesKey: {ранг: {'key', 'name', 'name_ru'}}}
+
+        name_ru - '' если русского названия точно нет, None - если его не удалось узнать.
+        """
+        keys = set(key for key in map(self.to_key, species_keys) if key is not None)
+
+        classifications = {}
+        missing = []
+        for species_key in keys:
+            entry = self._cached(f"species:{species_key}")
+            resolution_metrics.count('lineage_cache', 'hits' if entry is not None else 'misses')
+            if entry is not None:
+                classifications[species_key] = entry['lineage']
+            elif not self.offline:
+                missing.append(species_key)
+
+        if missing:
+            print(f"🌐 Запрашиваем классификацию {len(missing)} видов через API...")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for species_key, lineage in zip(missing, executor.map(self._fetch_classification, missing)):
+                    if lineage:
+                        classifications[species_key] = lineage
+                        self.store.set(f"species:{species_key}", {
+                            'lineage': lineage,
+                            'timestamp': datetime.now().timestamp()
+                        })
+
+        # Общие ранги (род, семейство, отряд...) переводятся один раз на все виды
+        taxon_keys = set(entry['key'] for lineage in classifications.values()
+                         for entry in lineage.values() if entry.get('key'))
+        names = self._resolve_names(taxon_keys, max_workers=max_workers)
+        self.store.flush()
+
+        return {species_key: {rank: {**entry, 'name_ru': names.get(entry.get('key'))}
+                              for rank, entry in lineage.items()}
+                for species_key, lineage in classifications.items()}
+
+    def get_lineage(self, species_key):
+        """Родословная одного вида (None - если ее не удалось получить)"""
+        species_key = self.to_key(species_key)
+        if species_key is None:
+            return None
+        return self.resolve([species_key]).get(species_key)
+
+    def get_russian_name(self, taxon_key):
+        """Русское название таксона по ключу GBIF (None - если его нет)"""
+        taxon_key = self.to_key(taxon_key)
+        if taxon_key is None:
+            return None
+        return self.resolve_names([taxon_key]).get(taxon_key)
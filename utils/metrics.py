@@ -0,0 +1,143 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+
+class ResolutionMetrics:
+    """Счетчики и гистограммы задержек по слоям разрешения названий"""
+
+    # Верхние границы корзин гистограммы задержек (мс); последняя корзина - все, что больше
+    LATENCY_BUCKETS_MS = [0.01, 0.1, 1, 10, 100, 1000, 10000]
+
+    COUNTERS = ['hits', 'misses', 'api_calls', 'api_errors', 'bytes']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Обнуляет все счетчики"""
+        with self._lock:
+            self._layers = {}
+            self._started = datetime.now().isoformat()
+
+    def _layer(self, layer):
+        """Счетчики слоя (создаются при первом обращении)"""
+        stats = self._layers.get(layer)
+        if stats is None:
+            stats = self._layers[layer] = {
+                **{counter: 0 for counter in self.COUNTERS},
+                'errors': {},
+                'latency_ms': [0] * (len(self.LATENCY_BUCKETS_MS) + 1),
+                'latency_total_ms': 0.0
+            }
+        return stats
+
+    def count(self, layer, counter, value=1):
+        """Увеличивает счетчик слоя"""
+        with self._lock:
+            self._layer(layer)[counter] += value
+
+    def hit(self, layer):
+        self.count(layer, 'hits')
+
+    def miss(self, layer):
+        self.count(layer, 'misses')
+
+    def error(self, layer, exc):
+        """Учитывает ошибку API (вместо молчаливого except: pass)"""
+        with self._lock:
+            stats = self._layer(layer)
+            stats['api_errors'] += 1
+            name = type(exc).__name__
+            stats['errors'][name] = stats['errors'].get(name, 0) + 1
+
+    def observe(self, layer, seconds):
+        """Добавляет задержку в гистограмму слоя"""
+        milliseconds = seconds * 1000
+        with self._lock:
+            stats = self._layer(layer)
+            stats['latency_ms'][bisect.bisect_left(self.LATENCY_BUCKETS_MS, milliseconds)] += 1
+            stats['latency_total_ms'] += milliseconds
+
+    @contextmanager
+    def timer(self, layer):
+        """Измеряет задержку блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(layer, time.perf_counter() - started)
+
+    def record_lookup(self, layer, started, found):
+        """Учитывает результат поиска в слое: попадание/промах и задержку от started (perf_counter)"""
+        self.observe(layer, time.perf_counter() - started)
+        self.count(layer, 'hits' if found else 'misses')
+
+    def api_get(self, layer, url, **kwargs):
+        """requests.get с учетом вызова, задержки, объема ответа и ошибок слоя"""
+        self.count(layer, 'api_calls')
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, **kwargs)
+        except requests.RequestException as e:
+            self.error(layer, e)
+            raise
+        finally:
+            self.observe(layer, time.perf_counter() - started)
+        self.count(layer, 'bytes', len(response.content))
+        return response
+
+    def snapshot(self):
+        """Копия счетчиков: {слой: {hits, misses, hit_rate, api_calls, api_errors, bytes, latency}}"""
+        with self._lock:
+            layers = {}
+            for layer, stats in self._layers.items():
+                lookups = stats['hits'] + stats['misses']
+                observations = sum(stats['latency_ms'])
+                layers[layer] = {
+                    **{counter: stats[counter] for counter in self.COUNTERS},
+                    'hit_rate': round(stats['hits'] / lookups, 4) if lookups else None,
+                    'errors': dict(stats['errors']),
+                    'latency_avg_ms': round(stats['latency_total_ms'] / observations, 4) if observations else None,
+                    'latency_histogram_ms': {
+                        (f"<={bound}" if i < len(self.LATENCY_BUCKETS_MS) else f">{self.LATENCY_BUCKETS_MS[-1]}"): count
+                        for i, (bound, count) in enumerate(zip(self.LATENCY_BUCKETS_MS + [None], stats['latency_ms']))
+                    }
+                }
+            return {'started': self._started, 'collected': datetime.now().isoformat(), 'layers': layers}
+
+    def print_report(self):
+        """Печатает сводку по слоям"""
+        layers = self.snapshot()['layers']
+        if not layers:
+            return
+
+        print("\n📈 РАЗРЕШЕНИЕ НАЗВАНИЙ ПО СЛОЯМ:")
+        print(f"   {'Слой':<20} {'Попад.':>8} {'Промах':>8} {'Доля':>6} {'API':>6} {'Ошибки':>7} {'КБ':>8} {'Ср. мс':>8}")
+        for layer, stats in sorted(layers.items()):
+            hit_rate = f"{stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else '-'
+            latency = f"{stats['latency_avg_ms']:.2f}" if stats['latency_avg_ms'] is not None else '-'
+            print(f"   {layer:<20} {stats['hits']:>8} {stats['misses']:>8} {hit_rate:>6} {stats['api_calls']:>6} "
+                  f"{stats['api_errors']:>7} {stats['bytes'] / 1024:>8.1f} {latency:>8}")
+
+    def dump(self, path="data/cache/resolution_metrics.json"):
+        """Сохраняет снимок счетчиков в JSON"""
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения метрик {path}: {e}")
+            return False
+
+
+# Общие на процесс счетчики
+resolution_metrics = ResolutionMetrics()
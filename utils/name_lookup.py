@@ -0,0 +1,260 @@
+import hashlib
+import os
+import threading
+import time
+from utils.russian_animals_db import RussianAnimalsDB
+
+# Базовый словарь переводов для основных таксонов
+BASE_TRANSLATIONS = {
+    # Типы (Phylum)
+    "Chordata": "Хордовые",
+    "Arthropoda": "Членистоногие",
+    "Mollusca": "Моллюски",
+    "Annelida": "Кольчатые черви",
+    "Cnidaria": "Стрекающие",
+    "Echinodermata": "Иглокожие",
+
+    # Классы (Class)
+    "Mammalia": "Млекопитающие",
+    "Aves": "Птицы",
+    "Reptilia": "Пресмыкающиеся",
+    "Amphibia": "Земноводные",
+    "Actinopterygii": "Костные рыбы",
+    "Chondrichthyes": "Хрящевые рыбы",
+    "Agnatha": "Бесчелюстные",
+    "Insecta": "Насекомые",
+    "Arachnida": "Паукообразные",
+    "Myriapoda": "Многоножки",
+    "Crustacea": "Ракообразные",
+    "Gastropoda": "Брюхоногие",
+    "Bivalvia": "Двустворчатые",
+    "Cephalopoda": "Головоногие",
+    "Anthozoa": "Коралловые полипы",
+    "Hydrozoa": "Гидроидные",
+    "Demospongiae": "Обыкновенные губки",
+    "Branchiopoda": "Жаброногие",
+    "Crocodylia": "Крокодилы",
+    "Squamata": "Чешуйчатые",
+    "Testudines": "Черепахи",
+
+    # Уберем дублирование
+    "Амфибии": "Земноводные",
+    "Рептилии": "Пресмыкающиеся",
+
+    # Отряды (Order) - Птицы
+    "Passeriformes": "Воробьинообразные",
+    "Falconiformes": "Соколообразные",
+    "Strigiformes": "Совообразные",
+    "Anseriformes": "Гусеобразные",
+    "Galliformes": "Курообразные",
+    "Charadriiformes": "Ржанкообразные",
+    "Columbiformes": "Голубеобразные",
+    "Piciformes": "Дятлообразные",
+    "Coraciiformes": "Ракшеобразные",
+
+    # Отряды (Order) - Млекопитающие
+    "Carnivora": "Хищные",
+    "Rodentia": "Грызуны",
+    "Lagomorpha": "Зайцеобразные",
+    "Artiodactyla": "Парнокопытные",
+    "Chiroptera": "Рукокрылые",
+    "Eulipotyphla": "Насекомоядные",
+
+    # Семейства (Family) - примеры
+    "Passeridae": "Воробьиные",
+    "Paridae": "Синицевые",
+    "Corvidae": "Врановые",
+    "Accipitridae": "Ястребиные",
+    "Falconidae": "Соколиные",
+    "Anatidae": "Утиные",
+    "Phasianidae": "Фазановые",
+    "Scolopacidae": "Бекасовые",
+    "Laridae": "Чайковые",
+    "Strigidae": "Настоящие совы",
+    "Mustelidae": "Куньи",
+    "Canidae": "Псовые",
+    "Felidae": "Кошачьи",
+    "Ursidae": "Медвежьи",
+    "Cervidae": "Оленевые",
+    "Leporidae": "Заячьи",
+    "Sciuridae": "Беличьи",
+    "Muridae": "Мышиные",
+
+    # Русские названия животных
+    "Vulpes vulpes": "Обыкновенная лисица",
+    "Lepus timidus": "Заяц-беляк",
+    "Alces alces": "Лось",
+    "Sciurus vulgaris": "Обыкновенная белка",
+    "Ursus arctos": "Бурый медведь",
+    "Canis lupus": "Волк",
+    "Lynx lynx": "Рысь",
+    "Martes zibellina": "Соболь",
+    "Parus major": "Большая синица",
+    "Garrulus glandarius": "Сойка",
+    "Pica pica": "Сорока",
+    "Dendrocopos major": "Большой пёстрый дятел",
+    "Regulus regulus": "Королёк",
+    "Strix uralensis": "Длиннохвостая неясыть",
+    "Milvus migrans": "Чёрный коршун",
+    "Dryocopus martius": "Желна",
+    "Bombycilla garrulus": "Свиристель",
+    "Hyla arborea": "Обыкновенная квакша",
+    "Rana temporaria": "Травяная лягушка",
+    "Emberiza pallasi": "Овсянка Палласа",
+    "Motacilla alba": "Белая трясогузка",
+    "Fringilla coelebs": "Зяблик",
+    "Podiceps cristatus": "Большая поганка",
+    "Chroicocephalus ridibundus": "Озёрная чайка",
+    "Ovis nivicola": "Снежный баран",
+    "Rangifer tarandus": "Северный олень",
+    "Capreolus pygargus": "Сибирская косуля",
+    "Lepus mandshuricus": "Маньчжурский заяц",
+    "Urocitellus undulatus": "Длиннохвостый суслик",
+    "Mustela sibirica": "Сибирская колонка",
+    "Panthera tigris altaica": "Амурский тигр",
+    "Eutamias sibiricus": "Азиатский бурундук",
+    "Meles leucurus": "Азиатский барсук",
+    "Ondatra zibethicus": "Ондатра",
+    "Ursus thibetanus ussuricus": "Гималайский медведь",
+    "Pteromys volans": "Обыкновенная летяга",
+    "Ochotona hyperborea": "Северная пищуха",
+    "Myopus schisticolor": "Лесной лемминг",
+    "Sorex caecutiens": "Средняя бурозубка",
+    "Lynx lynx stroganovi": "Амурская рысь",
+    "Alexandromys maximowiczii": "Полёвка Максимовича",
+    "Craseomys rufocanus": "Красно-серая полёвка",
+    "Clethrionomys rutilus": "Красная полёвка",
+    "Apodemus peninsulae": "Корейская мышь",
+    "Sorex isodon": "Равнозубая бурозубка",
+    "Myodes rutilus": "Красная полёвка",
+    "Myodes rufocanus": "Красно-серая полёвка",
+    "Tamias sibiricus": "Азиатский бурундук",
+    "Alticola lemminus": "Лемминговая полёвка",
+    "Microtus mongolicus": "Монгольская полёвка",
+    "Microtus maximowiczii": "Полёвка Максимовича",
+    "Plecotus ognevi": "Сибирский ушан",
+    "Phalacrocorax carbo": "Большой баклан"
+}
+
+
+# Приоритет источников: более поздний перекрывает более ранний.
+# Изменяемые кэши (переводы из API, родословные по speciesKey) в таблицу не входят -
+# к ним переводчик обращается только если в таблице названия нет.
+SOURCES = ['base', 'local_db']
+
+
+class NameLookup:
+    """Общая таблица русских названий: базовый словарь + локальная база, ключ - каноническое имя"""
+
+    # Как часто (в секундах) проверять, не изменился ли файл локальной базы
+    CHECK_INTERVAL = 5.0
+
+    def __init__(self, db_path="data/russian_animals.json"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = None
+        self._table = {}
+        self._animals_db = None
+        self.version = None
+        self._refresh()
+
+    @staticmethod
+    def make_key(name):
+        """Ключ таблицы - тот же, что у индекса локальной базы: каноническое имя без учета регистра"""
+        return RussianAnimalsDB.make_key(name)
+
+    def _file_mtime(self):
+        """Время изменения файла локальной базы (None - если файла нет)"""
+        try:
+            return os.stat(self.db_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self, force=False):
+        """Пересобирает таблицу, если файл локальной базы изменился (файл проверяется не чаще CHECK_INTERVAL)"""
+        now = time.monotonic()
+        if (not force and self._animals_db is not None and self._checked_at is not None
+                and now - self._checked_at < self.CHECK_INTERVAL):
+            return
+        self._checked_at = now
+
+        mtime = self._file_mtime()
+        if self._animals_db is not None and mtime == self._mtime:
+            return
+
+        with self._lock:
+            if self._animals_db is not None and mtime == self._mtime:
+                return
+
+            animals_db = RussianAnimalsDB(self.db_path)
+            # Слой локальной базы - ее собственный индекс названий (одна таблица, а не копия)
+            sources = {
+                'base': ((self.make_key(scientific_name), name_ru)
+                         for scientific_name, name_ru in BASE_TRANSLATIONS.items()),
+                'local_db': ((key, animal.get('common_name')) for key, animal in animals_db.by_name.items())
+            }
+
+            table = {}
+            for source in SOURCES:
+                for key, name_ru in sources[source]:
+                    if key and name_ru:
+                        table[key] = (name_ru, source)
+
+            digest = hashlib.md5(repr(sorted(table.items())).encode('utf-8')).hexdigest()[:12]
+
+            self._table = table
+            self._animals_db = animals_db
+            self._mtime = self._file_mtime()
+            self.version = digest
+
+    @property
+    def db_version(self):
+        """Версия файла локальной базы (меняется при каждой его перезаписи)"""
+        self._refresh()
+        return self._mtime
+
+    def reload(self):
+        """Сразу перечитывает локальную базу, если файл изменился (не дожидаясь CHECK_INTERVAL)"""
+        self._refresh(force=True)
+
+    @property
+    def animals_db(self):
+        """Актуальная локальная база животных"""
+        self._refresh()
+        return self._animals_db
+
+    def lookup(self, name):
+        """Русское название и его источник: (название, источник) или None"""
+        self._refresh()
+        return self._table.get(self.make_key(name))
+
+    def get(self, name):
+        """Русское название таксона (None - если его нет в таблице)"""
+        entry = self.lookup(name)
+        return entry[0] if entry else None
+
+    def get_common_name(self, scientific_name):
+        """Русское название вида (только для видовых имен, без авторства)"""
+        key = self.make_key(scientific_name)
+        if ' ' not in key:
+            return None
+        self._refresh()
+        entry = self._table.get(key)
+        return entry[0] if entry else None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._table)
+
+
+_shared_lookups = {}
+_shared_lock = threading.Lock()
+
+
+def get_name_lookup(db_path="data/russian_animals.json"):
+    """Общая на процесс таблица названий (одна на файл локальной базы)"""
+    with _shared_lock:
+        if db_path not in _shared_lookups:
+            _shared_lookups[db_path] = NameLookup(db_path)
+        return _shared_lookups[db_path]
@@ -0,0 +1,243 @@
+import json
+import os
+import re
+from collections import Counter
+
+
+class NameSearchIndex:
+    """Триграммный индекс русских и латинских названий видов по всем регионам"""
+
+    # Поля вида, по которым идет поиск
+    NAME_FIELDS = ['common_name', 'species_ru', 'canonical_name']
+
+    # Значения-заглушки, которые не индексируются
+    EMPTY_VALUES = {'', 'Не указано', 'Unknown'}
+
+    NON_WORD_RE = re.compile(r"[^0-9a-zа-я]+")
+
+    def __init__(self, index_path="data/cache/name_search_index.json"):
+        self.index_path = index_path
+        # regions: normalized_name -> {'name_ru', 'version', 'species': {name_key: count}}
+        # taxa: name_key -> названия вида
+        self.regions = {}
+        self.taxa = {}
+        self._load()
+        self._build_postings()
+
+    def _load(self):
+        """Загружает сохраненный индекс"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.regions = data.get('regions', {})
+            self.taxa = data.get('taxa', {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Индекс поиска поврежден, будет построен заново: {e}")
+
+    def save(self):
+        """Сохраняет индекс атомарно (временный файл + os.replace)"""
+        tmp_path = self.index_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'regions': self.regions, 'taxa': self.taxa}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения индекса поиска {self.index_path}: {e}")
+            return False
+
+    # Триграммы
+
+    @classmethod
+    def normalize(cls, text):
+        """Приводит название к виду для поиска: нижний регистр, ё -> е, только буквы и цифры"""
+        if not text:
+            return ''
+        text = text.casefold().replace('ё', 'е')
+        return cls.NON_WORD_RE.sub(' ', text).strip()
+
+    @classmethod
+    def trigrams(cls, text):
+        """Триграммы слов названия (с отступами на границах слов)"""
+        grams = set()
+        for word in cls.normalize(text).split():
+            padded = f"  {word} "
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return grams
+
+    def _taxon_names(self, taxon):
+        """Различные непустые названия вида"""
+        names = []
+        for field in self.NAME_FIELDS:
+            value = taxon.get(field)
+            if value and value not in self.EMPTY_VALUES and value not in names:
+                names.append(value)
+        return names
+
+    def _build_postings(self):
+        """Строит списки триграмм по всем видам и счетчики видов по регионам"""
+        self._postings = {}
+        self._taxon_grams = {}
+        self._taxon_regions = {}
+
+        for taxon_key in self.taxa:
+            self._index_taxon(taxon_key)
+
+        for normalized_name, region in self.regions.items():
+            for taxon_key, count in region['species'].items():
+                self._taxon_regions.setdefault(taxon_key, {})[normalized_name] = count
+
+    def _index_taxon(self, taxon_key):
+        """Добавляет триграммы вида в списки"""
+        grams_by_name = [(name, self.trigrams(name)) for name in self._taxon_names(self.taxa[taxon_key])]
+        self._taxon_grams[taxon_key] = grams_by_name
+        for _, grams in grams_by_name:
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(taxon_key)
+
+    def _unindex_taxon(self, taxon_key):
+        """Убирает триграммы вида из списков"""
+        for _, grams in self._taxon_grams.pop(taxon_key, []):
+            for gram in grams:
+                keys = self._postings.get(gram)
+                if keys is not None:
+                    keys.discard(taxon_key)
+                    if not keys:
+                        del self._postings[gram]
+
+    # Инкрементальное обновление
+
+    def region_version(self, normalized_name):
+        """Версия данных региона, по которой он проиндексирован"""
+        region = self.regions.get(normalized_name)
+        return region.get('version') if region else None
+
+    def update_region(self, normalized_name, region_name_ru, species_index, version=None, save=True):
+        """Переиндексирует один регион по его индексу видов"""
+        old_species = self.regions.get(normalized_name, {}).get('species', {})
+        new_species = {taxon_key: entry['count'] for taxon_key, entry in species_index.items()}
+
+        self.regions[normalized_name] = {
+            'name_ru': region_name_ru,
+            'version': version,
+            'species': new_species
+        }
+
+        for taxon_key in old_species.keys() - new_species.keys():
+            self._remove_taxon_region(taxon_key, normalized_name)
+
+        for taxon_key, entry in species_index.items():
+            self._taxon_regions.setdefault(taxon_key, {})[normalized_name] = new_species[taxon_key]
+
+            names = self._entry_names(entry)
+            taxon = self.taxa.get(taxon_key)
+            if taxon is None:
+                self.taxa[taxon_key] = names
+                self._index_taxon(taxon_key)
+            else:
+                # Не затираем известное русское название заглушкой из другого региона
+                updated = {**taxon, **{field: value for field, value in names.items()
+                                       if value and value not in self.EMPTY_VALUES}}
+                if updated != taxon:
+                    self._unindex_taxon(taxon_key)
+                    self.taxa[taxon_key] = updated
+                    self._index_taxon(taxon_key)
+
+        if save:
+            self.save()
+
+    def remove_region(self, normalized_name, save=True):
+        """Убирает регион из индекса"""
+        region = self.regions.pop(normalized_name, None)
+        if region:
+            for taxon_key in region['species']:
+                self._remove_taxon_region(taxon_key, normalized_name)
+            if save:
+                self.save()
+
+    def _remove_taxon_region(self, taxon_key, normalized_name):
+        """Убирает регион у вида; вид, которого больше нигде нет, удаляется из индекса"""
+        taxon_regions = self._taxon_regions.get(taxon_key, {})
+        taxon_regions.pop(normalized_name, None)
+        if not taxon_regions:
+            self._taxon_regions.pop(taxon_key, None)
+            self._unindex_taxon(taxon_key)
+            self.taxa.pop(taxon_key, None)
+
+    @staticmethod
+    def _entry_names(entry):
+        """Названия вида из записи индекса видов региона"""
+        record = entry.get('record') or {}
+        return {
+            'scientific_name': entry.get('scientific_name'),
+            'canonical_name': entry.get('canonical_name'),
+            'common_name': entry.get('common_name'),
+            'species_ru': record.get('species_ru'),
+            'class_ru': entry.get('class_ru')
+        }
+
+    # Поиск
+
+    def search(self, query, limit=10, min_score=0.3):
+        """Ищет виды по части названия или названию с опечатками; результаты - по убыванию сходства"""
+        normalized_query = self.normalize(query)
+        query_grams = self.trigrams(query)
+        if not query_grams:
+            return []
+
+        # Кандидаты - виды с хотя бы одной общей триграммой
+        hits = Counter()
+        for gram in query_grams:
+            for taxon_key in self._postings.get(gram, ()):
+                hits[taxon_key] += 1
+
+        min_hits = max(1, int(len(query_grams) * min_score))
+        results = []
+        for taxon_key, hit_count in hits.items():
+            if hit_count < min_hits:
+                continue
+
+            score, matched_name = self._score(normalized_query, query_grams, taxon_key)
+            if score < min_score:
+                continue
+
+            regions = self._taxon_regions.get(taxon_key, {})
+            taxon = self.taxa[taxon_key]
+            results.append({
+                'name_key': taxon_key,
+                'score': round(score, 3),
+                'matched_name': matched_name,
+                'scientific_name': taxon.get('canonical_name') or taxon.get('scientific_name'),
+                'common_name': taxon.get('common_name'),
+                'species_ru': taxon.get('species_ru'),
+                'class_ru': taxon.get('class_ru'),
+                'total_count': sum(regions.values()),
+                'regions': sorted(((self.regions[name]['name_ru'], count) for name, count in regions.items()),
+                                  key=lambda item: -item[1])
+            })
+
+        results.sort(key=lambda item: (-item['score'], -item['total_count']))
+        return results[:limit]
+
+    def _score(self, normalized_query, query_grams, taxon_key):
+        """Сходство запроса с лучшим из названий вида"""
+        best_score, best_name = 0.0, None
+        for name, grams in self._taxon_grams.get(taxon_key, []):
+            common = len(query_grams & grams)
+            if not common:
+                continue
+
+            # Доля триграмм запроса в названии важнее, чем длина названия
+            score = 0.8 * common / len(query_grams) + 0.2 * common / len(grams)
+            normalized_name = self.normalize(name)
+            if normalized_name == normalized_query:
+                score += 1.0
+            elif normalized_query in normalized_name:
+                score += 0.5
+
+            if score > best_score:
+                best_score, best_name = score, name
+        return best_score, best_name
@@ -0,0 +1,355 @@
+import json
+import math
+import os
+import shutil
+import numpy as np
+from sklearn.neighbors import BallTree
+from utils.coordinate_quality import is_clean
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class OccurrenceSpatialIndex:
+    """Пространственный индекс находок всех регионов: BallTree (haversine) на регион или тайлы фиксированной сетки.
+
+    С tile_size (в градусах) каждый регион делится на тайлы: строки тайла (номер записи в регионе,
+    координаты, вид, класс) хранятся отдельно, и запросы читают только тайлы, пересекающие область поиска.
+    Сами записи в индексе не копируются - они читаются из файлов регионов.
+    """
+
+    # Формат индекса региона (4 - тайлы без копий записей; только точки, прошедшие проверку координат)
+    FORMAT = 4
+
+    def __init__(self, index_dir="data/cache/spatial", tile_size=None):
+        self.index_dir = index_dir
+        self.tile_size = tile_size
+        self.manifest_path = os.path.join(index_dir, "index.json")
+        # regions: normalized_name -> {'name_ru', 'version', 'format', 'tile_size', 'count', 'bbox',
+        #                              'tiles': {ключ тайла: {'count', 'bbox'}}}
+        self.regions = {}
+        # Кэши по куску индекса: (normalized_name, ключ тайла или None для региона целиком)
+        self._arrays = {}
+        self._trees = {}
+        self._chunk_table = None
+        self._load_manifest()
+
+    def _load_manifest(self):
+        """Загружает список проиндексированных регионов"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.regions = json.load(f).get('regions', {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Пространственный индекс поврежден, будет построен заново: {e}")
+
+    def save(self):
+        """Сохраняет список регионов и тайлов (массивы координат сохраняются при обновлении региона)"""
+        tmp_path = self.manifest_path + '.tmp'
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'regions': self.regions}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения пространственного индекса: {e}")
+            return False
+
+    def _arrays_path(self, normalized_name, tile=None):
+        if tile is None:
+            return os.path.join(self.index_dir, f"{normalized_name}.npz")
+        return os.path.join(self.index_dir, normalized_name, f"{tile}.npz")
+
+    # Инкрементальное обновление
+
+    def region_version(self, normalized_name):
+        """Версия данных региона, по которой он проиндексирован (None - индекс нужно перестроить)"""
+        region = self.regions.get(normalized_name)
+        if not region or region.get('format') != self.FORMAT or region.get('tile_size') != self.tile_size:
+            return None
+        stored_path = self._arrays_path(normalized_name) if self.tile_size is None \
+            else os.path.join(self.index_dir, normalized_name)
+        if not os.path.exists(stored_path):
+            return None
+        return region.get('version')
+
+    def update_region(self, normalized_name, region_name_ru, animals, version=None, save=True):
+        """Переиндексирует один регион: координаты (в радианах), номер записи, вид и класс"""
+        latitudes, longitudes, positions, name_keys, classes = [], [], [], [], []
+        for position, animal in enumerate(animals):
+            # Индексируются только точки, прошедшие проверку координат
+            if not is_clean(animal):
+                continue
+            latitude, longitude = animal['decimalLatitude'], animal['decimalLongitude']
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            positions.append(position)
+            name_keys.append(animal.get('name_key') or '')
+            classes.append(animal.get('class_ru') or animal.get('class') or '')
+
+        arrays = {
+            'coordinates': np.radians(np.column_stack([latitudes, longitudes])) if positions else np.empty((0, 2)),
+            'positions': np.array(positions, dtype=np.int64),
+            'name_keys': np.array(name_keys, dtype=str),
+            'classes': np.array(classes, dtype=str)
+        }
+
+        self._drop_region_files(normalized_name)
+        os.makedirs(self.index_dir, exist_ok=True)
+        region = {
+            'name_ru': region_name_ru,
+            'version': version,
+            'format': self.FORMAT,
+            'tile_size': self.tile_size,
+            'count': len(positions),
+            'bbox': [min(latitudes), min(longitudes), max(latitudes), max(longitudes)] if positions else None
+        }
+
+        if self.tile_size is None:
+            np.savez(self._arrays_path(normalized_name), **arrays)
+            self._arrays[(normalized_name, None)] = arrays
+        else:
+            region['tiles'] = self._write_tiles(normalized_name, arrays)
+
+        self.regions[normalized_name] = region
+        self._chunk_table = None
+
+        if save:
+            self.save()
+
+    def _write_tiles(self, normalized_name, arrays):
+        """Раскладывает точки региона по тайлам; возвращает описание тайлов для списка"""
+        os.makedirs(os.path.join(self.index_dir, normalized_name), exist_ok=True)
+        degrees = np.degrees(arrays['coordinates'])
+        tiles, tile_index = np.unique(np.floor(degrees / self.tile_size).astype(np.int64), axis=0,
+                                      return_inverse=True)
+        tile_index = tile_index.ravel()
+
+        # Точки, сгруппированные по тайлам: границы групп в отсортированном порядке
+        order = np.argsort(tile_index, kind='stable')
+        bounds = np.searchsorted(tile_index[order], np.arange(len(tiles) + 1))
+
+        manifest = {}
+        for number, (row, column) in enumerate(tiles.tolist()):
+            selected = order[bounds[number]:bounds[number + 1]]
+            tile = f"{row}_{column}"
+            tile_arrays = {key: values[selected] for key, values in arrays.items()}
+            np.savez(self._arrays_path(normalized_name, tile), **tile_arrays)
+
+            tile_degrees = degrees[selected]
+            manifest[tile] = {
+                'count': len(selected),
+                'bbox': [float(tile_degrees[:, 0].min()), float(tile_degrees[:, 1].min()),
+                         float(tile_degrees[:, 0].max()), float(tile_degrees[:, 1].max())]
+            }
+            self._arrays[(normalized_name, tile)] = tile_arrays
+        return manifest
+
+    def _drop_region_files(self, normalized_name):
+        """Удаляет сохраненные массивы региона и сбрасывает его кэши"""
+        for cache in (self._arrays, self._trees):
+            for key in [key for key in cache if key[0] == normalized_name]:
+                del cache[key]
+        if os.path.exists(self._arrays_path(normalized_name)):
+            os.remove(self._arrays_path(normalized_name))
+        shutil.rmtree(os.path.join(self.index_dir, normalized_name), ignore_errors=True)
+
+    def remove_region(self, normalized_name, save=True):
+        """Убирает регион из индекса"""
+        self.regions.pop(normalized_name, None)
+        self._drop_region_files(normalized_name)
+        self._chunk_table = None
+        if save:
+            self.save()
+
+    def _get_arrays(self, normalized_name, tile=None):
+        """Массивы региона или тайла (загружаются с диска при первом обращении)"""
+        arrays = self._arrays.get((normalized_name, tile))
+        if arrays is None:
+            with np.load(self._arrays_path(normalized_name, tile)) as data:
+                arrays = self._arrays[(normalized_name, tile)] = {key: data[key] for key in data.files}
+        return arrays
+
+    def _get_tree(self, normalized_name):
+        """BallTree региона, хранящегося без тайлов (строится при первом запросе)"""
+        tree = self._trees.get((normalized_name, None))
+        if tree is None:
+            tree = self._trees[(normalized_name, None)] = BallTree(self._get_arrays(normalized_name)['coordinates'],
+                                                                   metric='haversine')
+        return tree
+
+    # Куски индекса: регион целиком или его тайлы
+
+    def _chunks_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Куски индекса (normalized_name, тайл), чей прямоугольник пересекает заданный"""
+        chunks = []
+        for normalized_name, region in self.regions.items():
+            bbox = region['bbox']
+            if not region['count'] or bbox[0] > max_lat or bbox[2] < min_lat or bbox[1] > max_lon or bbox[3] < min_lon:
+                continue
+            if region.get('tile_size') is None:
+                chunks.append((normalized_name, None))
+                continue
+
+            # Тайлы перебираются по диапазону ключей (или по списку тайлов, если он короче)
+            tile_size, tiles = region['tile_size'], region['tiles']
+            rows = range(math.floor(max(min_lat, bbox[0]) / tile_size),
+                         math.floor(min(max_lat, bbox[2]) / tile_size) + 1)
+            columns = range(math.floor(max(min_lon, bbox[1]) / tile_size),
+                            math.floor(min(max_lon, bbox[3]) / tile_size) + 1)
+            if len(rows) * len(columns) <= len(tiles):
+                candidates = (f"{row}_{column}" for row in rows for column in columns)
+            else:
+                candidates = iter(tiles)
+            for tile in candidates:
+                tile_bbox = tiles.get(tile, {}).get('bbox')
+                if tile_bbox and tile_bbox[0] <= max_lat and tile_bbox[2] >= min_lat \
+                        and tile_bbox[1] <= max_lon and tile_bbox[3] >= min_lon:
+                    chunks.append((normalized_name, tile))
+        return chunks
+
+    def _all_chunks(self):
+        """Все куски индекса и их прямоугольники (массив n x 4) - для поиска ближайших"""
+        if self._chunk_table is None:
+            chunks, bboxes = [], []
+            for normalized_name, region in self.regions.items():
+                if not region['count']:
+                    continue
+                if region.get('tile_size') is None:
+                    chunks.append((normalized_name, None))
+                    bboxes.append(region['bbox'])
+                else:
+                    for tile, tile_info in region['tiles'].items():
+                        chunks.append((normalized_name, tile))
+                        bboxes.append(tile_info['bbox'])
+            self._chunk_table = (chunks, np.array(bboxes, dtype=float).reshape(-1, 4))
+        return self._chunk_table
+
+    # Запросы
+
+    @staticmethod
+    def _distance_to_bbox_km(latitude, longitude, bboxes):
+        """Нижняя оценка расстояния от точки до прямоугольников (км); bboxes - массив n x 4"""
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        nearest_lat = np.clip(latitude, bboxes[:, 0], bboxes[:, 2])
+        nearest_lon = np.clip(longitude, bboxes[:, 1], bboxes[:, 3])
+        return haversine_km(latitude, longitude, nearest_lat, nearest_lon)
+
+    @staticmethod
+    def _search_windows(latitude, longitude, radius_km):
+        """Прямоугольники, покрывающие круг поиска (с переходом через 180-й меридиан)"""
+        delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(min(abs(latitude) + delta_lat, 90.0)))
+        delta_lon = 180.0 if cos_lat < 1e-6 else min(delta_lat / cos_lat, 180.0)
+        min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+
+        windows = [(min_lat, longitude - delta_lon, max_lat, longitude + delta_lon)]
+        if longitude - delta_lon < -180:
+            windows.append((min_lat, longitude - delta_lon + 360, max_lat, 180.0))
+        if longitude + delta_lon > 180:
+            windows.append((min_lat, -180.0, max_lat, longitude + delta_lon - 360))
+        return windows
+
+    def _filter_mask(self, arrays, species_keys=None, classes=None):
+        """Маска по видам (ключам канонических имен) и классам (None - без фильтра)"""
+        mask = None
+        if species_keys:
+            mask = np.isin(arrays['name_keys'], list(species_keys))
+        if classes:
+            class_mask = np.isin(arrays['classes'], list(classes))
+            mask = class_mask if mask is None else mask & class_mask
+        return mask
+
+    @staticmethod
+    def _chunk_distances(arrays, latitude, longitude):
+        """Расстояния от точки до всех находок куска (км)"""
+        coordinates = np.degrees(arrays['coordinates'])
+        return haversine_km(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+
+    def query_radius(self, latitude, longitude, radius_km, species_keys=None, classes=None):
+        """Находки в радиусе: [(normalized_name, номер записи, расстояние км, тайл)] по возрастанию расстояния"""
+        chunks = []
+        for window in self._search_windows(latitude, longitude, radius_km):
+            chunks.extend(chunk for chunk in self._chunks_in_bbox(*window) if chunk not in chunks)
+
+        point = np.radians([[latitude, longitude]])
+        results = []
+        for normalized_name, tile in chunks:
+            arrays = self._get_arrays(normalized_name, tile)
+            if tile is None:
+                indexes, distances = self._get_tree(normalized_name).query_radius(
+                    point, r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+                indexes, distances = indexes[0], distances[0] * EARTH_RADIUS_KM
+            else:
+                # В тайле немного точек - прямой векторный расчет быстрее построения дерева
+                distances = self._chunk_distances(arrays, latitude, longitude)
+                indexes = np.flatnonzero(distances <= radius_km)
+                distances = distances[indexes]
+
+            mask = self._filter_mask(arrays, species_keys, classes)
+            if mask is not None:
+                keep = mask[indexes]
+                indexes, distances = indexes[keep], distances[keep]
+
+            results.extend((normalized_name, position, distance, tile)
+                           for position, distance in zip(arrays['positions'][indexes].tolist(), distances.tolist()))
+
+        results.sort(key=lambda item: item[2])
+        return results
+
+    def query_nearest(self, latitude, longitude, k=10, species_keys=None, classes=None):
+        """k ближайших находок: [(normalized_name, номер записи, расстояние км, тайл)]"""
+        chunks, bboxes = self._all_chunks()
+        if not chunks:
+            return []
+        point = np.radians([[latitude, longitude]])
+        bound_distances = self._distance_to_bbox_km(latitude, longitude, bboxes)
+
+        # Куски - от ближайшего прямоугольника; дальние пропускаем, когда k найденных уже ближе
+        candidates = []
+        for number in np.argsort(bound_distances).tolist():
+            if len(candidates) >= k and bound_distances[number] > candidates[k - 1][2]:
+                break
+
+            normalized_name, tile = chunks[number]
+            arrays = self._get_arrays(normalized_name, tile)
+            mask = self._filter_mask(arrays, species_keys, classes)
+            if mask is None and tile is None:
+                distances, indexes = self._get_tree(normalized_name).query(point, k=min(k, len(arrays['positions'])))
+                indexes, distances = indexes[0], distances[0] * EARTH_RADIUS_KM
+            else:
+                # Тайл или фильтр - прямой векторный расчет по (отфильтрованным) точкам
+                indexes = np.flatnonzero(mask) if mask is not None else np.arange(len(arrays['positions']))
+                distances = self._chunk_distances(arrays, latitude, longitude)[indexes]
+                order = np.argsort(distances)[:k]
+                indexes, distances = indexes[order], distances[order]
+
+            candidates.extend((normalized_name, position, distance, tile)
+                              for position, distance in zip(arrays['positions'][indexes].tolist(), distances.tolist()))
+            candidates.sort(key=lambda item: item[2])
+            candidates = candidates[:k]
+
+        return candidates
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon, species_keys=None, classes=None):
+        """Находки внутри прямоугольника: [(normalized_name, номер записи, None, тайл)]"""
+        results = []
+        for normalized_name, tile in self._chunks_in_bbox(min_lat, min_lon, max_lat, max_lon):
+            arrays = self._get_arrays(normalized_name, tile)
+            coordinates = np.degrees(arrays['coordinates'])
+            mask = ((coordinates[:, 0] >= min_lat) & (coordinates[:, 0] <= max_lat) &
+                    (coordinates[:, 1] >= min_lon) & (coordinates[:, 1] <= max_lon))
+            filter_mask = self._filter_mask(arrays, species_keys, classes)
+            if filter_mask is not None:
+                mask &= filter_mask
+
+            results.extend((normalized_name, position, None, tile) for position in arrays['positions'][mask].tolist())
+        return results
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу (км); работает и с массивами numpy"""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
@@ -0,0 +1,327 @@
+import json
+import math
+import os
+import numpy as np
+
+
+def _segment_hits_rect(x1, y1, x2, y2, min_x, min_y, max_x, max_y):
+    """Пересекает ли отрезок прямоугольник (отсечение Лианга-Барски)"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+class _Ring:
+    """Контур полигона с индексом ребер по горизонтальным полосам (для быстрого ray casting)"""
+
+    def __init__(self, coordinates, bands=64):
+        points = [(float(x), float(y)) for x, y, *_ in coordinates]
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+        self.min_y = self.bbox[1]
+        self.band_count = max(1, min(bands, len(points) // 4))
+        self.band_height = (self.bbox[3] - self.min_y) / self.band_count or 1.0
+
+        # Каждое ребро попадает во все полосы, которые оно пересекает по y
+        self.bands = [[] for _ in range(self.band_count)]
+        for i, (x1, y1) in enumerate(points):
+            x2, y2 = points[(i + 1) % len(points)]
+            if y1 == y2:
+                continue
+            first = self._band(min(y1, y2))
+            last = self._band(max(y1, y2))
+            edge = (x1, y1, x2, y2)
+            for band in range(first, last + 1):
+                self.bands[band].append(edge)
+
+    def _band(self, y):
+        return min(self.band_count - 1, max(0, int((y - self.min_y) / self.band_height)))
+
+    def contains(self, x, y):
+        """Точка внутри контура (ray casting только по ребрам своей полосы)"""
+        min_x, min_y, max_x, max_y = self.bbox
+        if x < min_x or x > max_x or y < min_y or y > max_y:
+            return False
+
+        inside = False
+        for x1, y1, x2, y2 in self.bands[self._band(y)]:
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+
+    def contains_many(self, xs, ys, chunk_size=65536):
+        """Векторная версия contains: маска точек внутри контура"""
+        inside = np.zeros(len(xs), dtype=bool)
+        band_indexes = np.clip(((ys - self.min_y) / self.band_height).astype(np.int64), 0, self.band_count - 1)
+
+        for band in np.unique(band_indexes):
+            edges = self._band_array(band)
+            if not len(edges):
+                continue
+            x1, y1, x2, y2 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+            points = np.flatnonzero(band_indexes == band)
+
+            # Точки полосы x ребра полосы - одной матрицей (по частям, чтобы не раздувать память)
+            step = max(1, chunk_size // len(edges))
+            for start in range(0, len(points), step):
+                chunk = points[start:start + step]
+                px, py = xs[chunk, None], ys[chunk, None]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+                inside[chunk] = (crosses.sum(axis=1) % 2) == 1
+
+        return inside
+
+    def _band_array(self, band):
+        """Ребра полосы массивом numpy (строится один раз)"""
+        if not hasattr(self, '_band_arrays'):
+            self._band_arrays = {}
+        edges = self._band_arrays.get(band)
+        if edges is None:
+            edges = self._band_arrays[band] = np.array(self.bands[band], dtype=float).reshape(-1, 4)
+        return edges
+
+    def intersects_rect(self, min_x, min_y, max_x, max_y):
+        """Пересекает ли контур прямоугольник (хотя бы одно ребро задевает его)"""
+        bbox = self.bbox
+        if max_x < bbox[0] or min_x > bbox[2] or max_y < bbox[1] or min_y > bbox[3]:
+            return False
+
+        seen = set()
+        for band in range(self._band(min_y), self._band(max_y) + 1):
+            for edge in self.bands[band]:
+                if edge in seen:
+                    continue
+                seen.add(edge)
+                if _segment_hits_rect(*edge, min_x, min_y, max_x, max_y):
+                    return True
+        return False
+
+
+class _Part:
+    """Часть (полигон) границы региона: внешний контур и дыры"""
+
+    def __init__(self, region_index, polygon, bands):
+        self.region_index = region_index
+        self.exterior = _Ring(polygon[0], bands)
+        self.holes = [_Ring(ring, bands) for ring in polygon[1:]]
+        self.bbox = self.exterior.bbox
+
+    def contains(self, x, y):
+        if not self.exterior.contains(x, y):
+            return False
+        return not any(hole.contains(x, y) for hole in self.holes)
+
+    def contains_many(self, xs, ys):
+        """Векторная версия contains"""
+        inside = self.exterior.contains_many(xs, ys)
+        for hole in self.holes:
+            candidates = np.flatnonzero(inside)
+            if len(candidates):
+                inside[candidates] &= ~hole.contains_many(xs[candidates], ys[candidates])
+        return inside
+
+    def covers_rect(self, min_x, min_y, max_x, max_y):
+        """Лежит ли прямоугольник целиком внутри полигона"""
+        # Если ни одно ребро не задевает прямоугольник, он целиком внутри или целиком снаружи контура
+        center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+        if self.exterior.intersects_rect(min_x, min_y, max_x, max_y) or not self.exterior.contains(center_x, center_y):
+            return False
+        return not any(hole.intersects_rect(min_x, min_y, max_x, max_y) or hole.contains(center_x, center_y)
+                       for hole in self.holes)
+
+
+class OfflineGeocoder:
+    """Офлайн-определение региона по координатам: полигоны границ субъектов РФ в STR-дереве"""
+
+    # Свойства GeoJSON, в которых ищется название региона (по порядку)
+    NAME_PROPERTIES = ['name_ru', 'name:ru', 'name', 'NAME_1', 'region']
+    NAME_EN_PROPERTIES = ['name_en', 'name:en', 'NAME_EN']
+
+    def __init__(self, boundaries_path="config/regions_boundaries.geojson", russian_to_english=None,
+                 node_capacity=16, bands=64):
+        self.boundaries_path = boundaries_path
+        self.russian_to_english = russian_to_english or {}
+        self.english_to_russian = {en: ru for ru, en in self.russian_to_english.items()}
+        self.node_capacity = node_capacity
+        self.bands = bands
+
+        self.regions = []  # [(region_name_ru, region_name_en)]
+        self.parts = []
+        self.root = None
+        self._loaded = False
+
+    @property
+    def available(self):
+        """Есть ли файл границ регионов"""
+        return os.path.exists(self.boundaries_path)
+
+    def load(self):
+        """Загружает границы и строит дерево при первом обращении; True - если границы загружены"""
+        if self._loaded:
+            return self.root is not None
+        self._loaded = True
+
+        if not self.available:
+            return False
+
+        try:
+            with open(self.boundaries_path, 'r', encoding='utf-8') as f:
+                geojson = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"❌ Ошибка загрузки границ регионов {self.boundaries_path}: {e}")
+            return False
+
+        for feature in geojson.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+
+            region = self._region_names(feature.get('properties') or {})
+            if region is None:
+                continue
+
+            region_index = len(self.regions)
+            self.regions.append(region)
+            for polygon in polygons:
+                if polygon and len(polygon[0]) >= 3:
+                    self.parts.append(_Part(region_index, polygon, self.bands))
+
+        self.root = self._build_tree(self.parts) if self.parts else None
+        print(f"🗺️ Загружены границы {len(self.regions)} регионов ({len(self.parts)} полигонов)")
+        return self.root is not None
+
+    def _region_names(self, properties):
+        """Русское и английское название региона из свойств объекта (ключи russian_to_english)"""
+        name_ru = next((properties[key] for key in self.NAME_PROPERTIES if properties.get(key)), None)
+        name_en = next((properties[key] for key in self.NAME_EN_PROPERTIES if properties.get(key)), None)
+
+        if name_ru in self.russian_to_english:
+            return name_ru, self.russian_to_english[name_ru]
+        if name_en in self.english_to_russian:
+            return self.english_to_russian[name_en], name_en
+        if name_ru in self.english_to_russian:
+            return self.english_to_russian[name_ru], name_ru
+        if name_ru:
+            return name_ru, name_en or name_ru
+        return None
+
+    # STR-дерево (Sort-Tile-Recursive): упаковка прямоугольников снизу вверх
+
+    def _build_tree(self, items):
+        """Строит дерево; узел - (bbox, дети, лист ли)"""
+        nodes = [(item.bbox, item, True) for item in items]
+        while len(nodes) > 1 or nodes[0][2]:
+            nodes = self._pack_level(nodes)
+        return nodes[0]
+
+    def _pack_level(self, nodes):
+        """Упаковывает уровень: вертикальные срезы по x, внутри среза - группы по y"""
+        capacity = self.node_capacity
+        node_count = math.ceil(len(nodes) / capacity)
+        slice_count = math.ceil(math.sqrt(node_count))
+        slice_size = slice_count * capacity
+
+        nodes = sorted(nodes, key=lambda node: node[0][0] + node[0][2])
+        packed = []
+        for start in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(nodes[start:start + slice_size], key=lambda node: node[0][1] + node[0][3])
+            for group_start in range(0, len(vertical_slice), capacity):
+                children = vertical_slice[group_start:group_start + capacity]
+                bbox = (min(child[0][0] for child in children), min(child[0][1] for child in children),
+                        max(child[0][2] for child in children), max(child[0][3] for child in children))
+                packed.append((bbox, children, False))
+        return packed
+
+    def _query(self, x, y):
+        """Полигоны, чей прямоугольник содержит точку"""
+        candidates = []
+        stack = [self.root]
+        while stack:
+            bbox, children, _ = stack.pop()
+            if x < bbox[0] or x > bbox[2] or y < bbox[1] or y > bbox[3]:
+                continue
+            for child in children:
+                child_bbox, payload, is_leaf = child
+                if is_leaf:
+                    if child_bbox[0] <= x <= child_bbox[2] and child_bbox[1] <= y <= child_bbox[3]:
+                        candidates.append(payload)
+                else:
+                    stack.append(child)
+        return candidates
+
+    @property
+    def version(self):
+        """Версия файла границ (меняется при его замене)"""
+        try:
+            return f"boundaries:{os.stat(self.boundaries_path).st_mtime_ns}"
+        except OSError:
+            return None
+
+    def region_covering(self, min_lat, min_lon, max_lat, max_lon):
+        """Регион, целиком содержащий прямоугольник (None - если прямоугольник задевает границу)"""
+        if not self.load():
+            return None
+
+        center_lat, center_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        for part in self._query(center_lon, center_lat):
+            if part.covers_rect(min_lon, min_lat, max_lon, max_lat):
+                return self.regions[part.region_index]
+        return None
+
+    def locate_many(self, latitudes, longitudes):
+        """Векторное определение регионов: индексы в self.regions (-1 - точка вне всех регионов)"""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        result = np.full(len(latitudes), -1, dtype=np.int64)
+        if not self.load():
+            return result
+
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        # Чукотка за 180-м меридианом: повторяем поиск для отрицательных долгот со сдвигом на 360
+        passes = [longitudes, np.where(longitudes < 0, longitudes + 360, np.nan)]
+
+        for xs in passes:
+            for part in self.parts:
+                min_x, min_y, max_x, max_y = part.bbox
+                with np.errstate(invalid='ignore'):
+                    candidates = np.flatnonzero(valid & (result < 0) & (xs >= min_x) & (xs <= max_x) &
+                                                (latitudes >= min_y) & (latitudes <= max_y))
+                if len(candidates):
+                    inside = part.contains_many(xs[candidates], latitudes[candidates])
+                    result[candidates[inside]] = part.region_index
+
+        return result
+
+    def locate(self, latitude, longitude):
+        """Регион по координатам: (region_name_ru, region_name_en) или None"""
+        if not self.load():
+            return None
+
+        # Чукотка пересекает 180-й меридиан: в части файлов границ долготы записаны как 180+
+        for x in (longitude, longitude + 360) if longitude < 0 else (longitude,):
+            for part in self._query(x, latitude):
+                if part.contains(x, latitude):
+                    return self.regions[part.region_index]
+        return None
@@ -0,0 +1,334 @@
+import threading
+
+# Субъекты РФ: русское название -> английское (оно же задает идентификатор и имя файла данных)
+REGIONS = {
+    'Республика Адыгея': 'Adygea',
+    'Республика Алтай': 'Altai',
+    'Алтайский край': 'Altai Krai',
+    'Амурская область': 'Amur',
+    'Архангельская область': 'Arkhangelsk',
+    'Астраханская область': 'Astrakhan',
+    'Республика Башкортостан': 'Bashkortostan',
+    'Белгородская область': 'Belgorod',
+    'Брянская область': 'Bryansk',
+    'Республика Бурятия': 'Buryatia',
+    'Чеченская Республика': 'Chechnya',
+    'Челябинская область': 'Chelyabinsk',
+    'Чукотский автономный округ': 'Chukotka',
+    'Республика Крым': 'Crimea',
+    'Республика Дагестан': 'Dagestan',
+    'Республика Ингушетия': 'Ingushetia',
+    'Иркутская область': 'Irkutsk',
+    'Ивановская область': 'Ivanovo',
+    'Еврейская автономная область': 'Jewish',
+    'Кабардино-Балкарская Республика': 'Kabardino-Balkaria',
+    'Калининградская область': 'Kaliningrad',
+    'Республика Калмыкия': 'Kalmykia',
+    'Калужская область': 'Kaluga',
+    'Камчатский край': 'Kamchatka',
+    'Карачаево-Черкесская Республика': 'Karachay-Cherkessia',
+    'Республика Карелия': 'Karelia',
+    'Кемеровская область': 'Kemerovo',
+    'Хабаровский край': 'Khabarovsk',
+    'Республика Хакасия': 'Khakassia',
+    'Ханты-Мансийский автономный округ — Югра': 'Khanty-Mansi',
+    'Кировская область': 'Kirov',
+    'Коми Республика': 'Komi',
+    'Костромская область': 'Kostroma',
+    'Краснодарский край': 'Krasnodar',
+    'Красноярский край': 'Krasnoyarsk',
+    'Курганская область': 'Kurgan',
+    'Курская область': 'Kursk',
+    'Ленинградская область': 'Leningrad',
+    'Липецкая область': 'Lipetsk',
+    'Магаданская область': 'Magadan',
+    'Республика Марий Эл': 'Mari El',
+    'Республика Мордовия': 'Mordovia',
+    'Московская область': 'Moscow',
+    'Москва': 'Moscow City',
+    'Мурманская область': 'Murmansk',
+    'Ненецкий автономный округ': 'Nenets',
+    'Нижегородская область': 'Nizhny Novgorod',
+    'Новгородская область': 'Novgorod',
+    'Новосибирская область': 'Novosibirsk',
+    'Омская область': 'Omsk',
+    'Оренбургская область': 'Orenburg',
+    'Орловская область': 'Oryol',
+    'Пензенская область': 'Penza',
+    'Пермский край': 'Perm',
+    'Приморский край': 'Primorsky',
+    'Псковская область': 'Pskov',
+    'Ростовская область': 'Rostov',
+    'Рязанская область': 'Ryazan',
+    'Санкт-Петербург': 'Saint Petersburg',
+    'Республика Саха (Якутия)': 'Sakha',
+    'Сахалинская область': 'Sakhalin',
+    'Самарская область': 'Samara',
+    'Саратовская область': 'Saratov',
+    'Республика Северная Осетия — Алания': 'North Ossetia',
+    'Смоленская область': 'Smolensk',
+    'Ставропольский край': 'Stavropol',
+    'Свердловская область': 'Sverdlovsk',
+    'Тамбовская область': 'Tambov',
+    'Республика Татарстан': 'Tatarstan',
+    'Томская область': 'Tomsk',
+    'Тульская область': 'Tula',
+    'Республика Тыва': 'Tuva',
+    'Тверская область': 'Tver',
+    'Тюменская область': 'Tyumen',
+    'Удмуртская Республика': 'Udmurtia',
+    'Ульяновская область': 'Ulyanovsk',
+    'Владимирская область': 'Vladimir',
+    'Волгоградская область': 'Volgograd',
+    'Вологодская область': 'Vologda',
+    'Воронежская область': 'Voronezh',
+    'Ямало-Ненецкий автономный округ': 'Yamalo-Nenets',
+    'Ярославская область': 'Yaroslavl',
+    'Забайкальский край': 'Zabaykalsky',
+    'Донецкая Народная Республика': 'Donetsk',
+    'Луганская Народная Республика': 'Luhansk',
+    'Херсонская область': 'Kherson',
+    'Запорожская область': 'Zaporozhye',
+    'Севастополь': 'Sevastopol',
+}
+
+# Названия для параметра stateProvince в GBIF, если они отличаются от английского.
+# Каждое должно однозначно указывать на свой регион ('Moscow' - это Московская область, город - 'Moskva')
+GBIF_NAMES = {
+    'Zabaykalsky': 'Zabaykalsky Krai',
+    'Krasnodar': 'Krasnodar Krai',
+    'Moscow City': 'Moskva',
+}
+
+# Дополнительные написания: краткие и неофициальные формы, встречающиеся в GBIF и у пользователей
+EXTRA_ALIASES = {
+    'Zabaykalsky': ['Забайкальский', 'Забайкалье', 'Zabaykalsky Krai', 'Zabaikalsky Krai', 'Transbaikal', 'Chita'],
+    'Crimea': ['Крым', 'Республика Крым'],
+    'Moscow City': ['Москва', 'Moskva', 'Moscow Federal City'],
+    'Moscow': ['Московская'],
+    'Leningrad': ['Ленинградская'],
+    'Krasnodar': ['Краснодарский край', 'Краснодарская', 'Krasnodar Krai'],
+    'Novosibirsk': ['Новосибирская'],
+    'Amur': ['Амурская'],
+    'Bryansk': ['Брянская'],
+    'Tatarstan': ['Татарстан'],
+    'Sakhalin': ['Сахалин'],
+    'Saint Petersburg': ['Санкт-Петербург', 'Петербург', 'St. Petersburg', 'St Petersburg', 'Sankt-Peterburg',
+                         'Sankt Petersburg'],
+    'Sevastopol': ['Sevastopol City'],
+    'Sakha': ['Якутия', 'Саха', 'Yakutia', 'Sakha (Yakutia)', 'Sakha Republic'],
+    'Khanty-Mansi': ['Ханты-Мансийский автономный округ', 'Югра', 'Yugra', 'Khanty-Mansiy'],
+    'North Ossetia': ['Северная Осетия', 'Алания', 'North Ossetia-Alania', 'Alania'],
+    'Chechnya': ['Чечня', 'Chechen Republic'],
+    'Kabardino-Balkaria': ['Кабардино-Балкария', 'Kabardino-Balkar Republic'],
+    'Karachay-Cherkessia': ['Карачаево-Черкесия', 'Karachay-Cherkess Republic'],
+    'Udmurtia': ['Удмуртия', 'Udmurt Republic'],
+    'Komi': ['Коми', 'Komi Republic'],
+    'Jewish': ['Еврейская АО', 'Jewish Autonomous Oblast', 'Yevrey'],
+    'Altai': ['Горный Алтай', 'Altay', 'Altai Republic', 'Altay Republic'],
+    'Altai Krai': ['Altay Krai', 'Altayskiy Kray'],
+    'Kemerovo': ['Кузбасс', 'Kuzbass'],
+    'Tuva': ['Тува', 'Tyva'],
+    'Mari El': ['Марий Эл'],
+    'Nizhny Novgorod': ['Нижегородская', 'Nizhniy Novgorod', 'Nizhegorod'],
+    'Donetsk': ['ДНР'],
+    'Luhansk': ['ЛНР', 'Lugansk'],
+    'Zaporozhye': ['Zaporizhzhia'],
+}
+
+# Центры регионов по умолчанию (широта, долгота) - пока нет границ или собранных данных
+DEFAULT_CENTROIDS = {
+    'Amur': (53.0, 127.0),
+    'Krasnodar': (45.0355, 38.9755),
+    'Altai': (50.0, 86.0),
+    'Altai Krai': (52.0, 83.0),
+    'Buryatia': (52.0, 107.0),
+    'Khabarovsk': (48.5, 135.0),
+    'Primorsky': (43.0, 132.0),
+    'Sakhalin': (50.0, 143.0),
+    'Kamchatka': (56.0, 159.0),
+    'Magadan': (60.0, 151.0),
+}
+
+# Формы по типу субъекта: слова, убираемые для краткой формы, и английские/латинские написания
+REGION_TYPES = [
+    # (признак в русском названии, слова для удаления, английские формы, латинские формы)
+    ('автономный округ', ['автономный округ'], ['{} Autonomous Okrug', '{} Okrug'], ['{} avtonomnyy okrug']),
+    ('автономная область', ['автономная область'], ['{} Autonomous Oblast'], ['{} avtonomnaya oblast']),
+    ('Народная Республика', ['Народная Республика'], ['{} People\'s Republic', '{} Republic'], []),
+    ('Республика', ['Республика'], ['Republic of {}', '{} Republic'], ['Respublika {}', '{} Respublika']),
+    ('край', ['край'], ['{} Krai', '{} Kray', '{} Territory'], ['{} kray', '{} krai']),
+    ('область', ['область'], ['{} Oblast', '{} Region'], ['{} oblast']),
+]
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+
+def normalize_region_id(name):
+    """Идентификатор региона - как имя файла: только латиница и цифры в нижнем регистре"""
+    return "".join(c for c in name if c.isalnum()).lower()
+
+
+def alias_key(name):
+    """Ключ сравнения названий: без регистра, пробелов, знаков препинания и различий е/ё"""
+    return "".join(c for c in name.casefold().replace('ё', 'е') if c.isalnum())
+
+
+def transliterate(text):
+    """Латинская запись русского названия (как в данных GBIF: Amurskaya, Krasnodarskiy)"""
+    return ''.join(TRANSLIT.get(c, TRANSLIT.get(c.lower(), c).capitalize() if c.isupper() else c) for c in text)
+
+
+class RegionRegistry:
+    """Справочник регионов: идентификаторы, все варианты названий, файлы данных, центры и границы"""
+
+    def __init__(self, regions=None, gbif_names=None, extra_aliases=None, centroids=None):
+        regions = REGIONS if regions is None else regions
+        gbif_names = GBIF_NAMES if gbif_names is None else gbif_names
+        extra_aliases = EXTRA_ALIASES if extra_aliases is None else extra_aliases
+        centroids = DEFAULT_CENTROIDS if centroids is None else centroids
+
+        # regions: id -> {'id', 'name_ru', 'name_en', 'gbif_name', 'data_file', 'centroid', 'bbox', 'aliases'}
+        self.regions = {}
+        self._aliases = {}
+        self._generated = {}
+        self._ambiguous = set()
+
+        for name_ru, name_en in regions.items():
+            self.add_region(name_ru, name_en, aliases=extra_aliases.get(name_en, ()),
+                            gbif_name=gbif_names.get(name_en), centroid=centroids.get(name_en))
+
+        # Сгенерированные формы добавляются последними и только если однозначны
+        for key, region_id in self._generated.items():
+            if key not in self._aliases and key not in self._ambiguous:
+                self._aliases[key] = region_id
+                self.regions[region_id]['aliases'].append(key)
+
+        self._check_gbif_names()
+
+    def _check_gbif_names(self):
+        """Написание GBIF каждого региона должно разрешаться обратно в этот же регион"""
+        for region_id, region in self.regions.items():
+            resolved = self.resolve(region['gbif_name'])
+            if resolved != region_id:
+                raise ValueError(f"Название GBIF '{region['gbif_name']}' региона {region_id} "
+                                 f"разрешается в {resolved}")
+
+    def add_region(self, name_ru, name_en, aliases=(), gbif_name=None, centroid=None):
+        """Добавляет регион со всеми написаниями названия"""
+        region_id = normalize_region_id(name_en)
+        self.regions[region_id] = {
+            'id': region_id,
+            'name_ru': name_ru,
+            'name_en': name_en,
+            'gbif_name': gbif_name or name_en,
+            'data_file': f"{region_id}.json",
+            'centroid': centroid,
+            'bbox': None,
+            'aliases': []
+        }
+        for alias in [region_id, name_ru, name_en, *aliases]:
+            if alias:
+                self.add_alias(region_id, alias)
+        if gbif_name:
+            self.add_alias(region_id, gbif_name)
+        for alias in self._generated_forms(name_ru, name_en):
+            key = alias_key(alias)
+            if self._generated.get(key, region_id) != region_id:
+                self._ambiguous.add(key)
+            self._generated[key] = region_id
+        return self.regions[region_id]
+
+    def add_alias(self, region_id, alias):
+        """Добавляет написание названия (явные написания важнее сгенерированных)"""
+        key = alias_key(alias)
+        if self._aliases.get(key, region_id) != region_id:
+            raise ValueError(f"Название '{alias}' уже относится к региону {self._aliases[key]}")
+        if key not in self._aliases:
+            self._aliases[key] = region_id
+            self.regions[region_id]['aliases'].append(key)
+
+    @staticmethod
+    def _generated_forms(name_ru, name_en):
+        """Краткие формы и типовые английские и латинские написания по типу субъекта"""
+        for marker, words, english_forms, latin_forms in REGION_TYPES:
+            if marker not in name_ru:
+                continue
+            short_ru = name_ru
+            for word in words:
+                short_ru = short_ru.replace(word, '')
+            short_ru = short_ru.split('—')[0].strip()
+            forms = [short_ru, transliterate(short_ru)]
+            forms += [form.format(name_en) for form in english_forms]
+            forms += [form.format(transliterate(short_ru)) for form in latin_forms]
+            return [form for form in forms if form]
+        return [transliterate(name_ru)]
+
+    # Поиск
+
+    def resolve(self, name):
+        """Идентификатор региона по любому написанию названия (None - если регион неизвестен)"""
+        if not name:
+            return None
+        return self._aliases.get(alias_key(name))
+
+    def get(self, name):
+        """Описание региона по любому написанию названия"""
+        return self.regions.get(self.resolve(name))
+
+    def name_ru(self, name):
+        region = self.get(name)
+        return region['name_ru'] if region else None
+
+    def name_en(self, name):
+        region = self.get(name)
+        return region['name_en'] if region else None
+
+    def gbif_name(self, name):
+        """Название региона для параметра stateProvince в GBIF"""
+        region = self.get(name)
+        return region['gbif_name'] if region else None
+
+    def set_geometry(self, name, centroid=None, bbox=None):
+        """Запоминает центр и/или прямоугольник региона (мин. широта, мин. долгота, макс. широта, макс. долгота)"""
+        region = self.get(name)
+        if region is None:
+            return
+        if bbox is not None:
+            region['bbox'] = list(bbox)
+        if centroid is not None:
+            region['centroid'] = tuple(centroid)
+        elif region['centroid'] is None and region['bbox'] is not None:
+            min_lat, min_lon, max_lat, max_lon = region['bbox']
+            region['centroid'] = ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+
+    def russian_to_english(self):
+        """Словарь русское название -> английское для всех регионов"""
+        return {region['name_ru']: region['name_en'] for region in self.regions.values()}
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def __iter__(self):
+        return iter(self.regions.values())
+
+    def __len__(self):
+        return len(self.regions)
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def get_region_registry():
+    """Общий на процесс справочник регионов"""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = RegionRegistry()
+        return _shared_registry
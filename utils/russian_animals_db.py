@@ -1,11 +1,54 @@
 import json
 import os
+from utils.scientific_names import canonical_name
+from utils.region_registry import get_region_registry, alias_key
 
 
 class RussianAnimalsDB:
+    # Ключевые слова регионов (зоны обитания в базе); любое написание названия региона
+    # сопоставляется через справочник регионов
+    REGION_KEYWORDS = {
+        'Забайкальский край': ['Сибирь', 'Дальний Восток', 'все'],
+        'Амурская': ['Дальний Восток', 'все'],
+        'Краснодарский край': ['Европейская часть', 'все'],
+        'Москва': ['Европейская часть', 'все'],
+        'Крым': ['Европейская часть', 'все'],
+        'Татарстан': ['Европейская часть', 'все']
+    }
+
     def __init__(self, db_path="data/russian_animals.json"):
         self.db_path = db_path
         self.animals_db = self._load_database()
+        self._build_indexes()
+        self.region_registry = get_region_registry()
+        self.keywords_by_region = {self._region_key(name): keywords for name, keywords in self.REGION_KEYWORDS.items()}
+
+    def _region_key(self, region_name):
+        """Ключ региона: идентификатор из справочника (для неизвестных названий - нормализованное название)"""
+        return self.region_registry.resolve(region_name) or alias_key(region_name or '')
+
+    @staticmethod
+    def make_key(name):
+        """Ключ индекса названий: каноническое имя без учета регистра"""
+        return canonical_name(name).casefold() if name else ''
+
+    def _build_indexes(self):
+        """Строит индексы: каноническое имя -> запись, зона обитания -> номера записей"""
+        self.entries = []
+        self.by_name = {}
+        self.by_region = {}
+
+        for category, species_list in self.animals_db.items():
+            for animal in species_list:
+                position = len(self.entries)
+                self.entries.append((category, animal))
+
+                key = self.make_key(animal.get('scientific_name'))
+                if key and key not in self.by_name:
+                    self.by_name[key] = animal
+
+                for region in animal.get('regions', []):
+                    self.by_region.setdefault(region, []).append(position)
 
     def _load_database(self):
         """Загружает базу данных русских животных"""
@@ -83,62 +126,81 @@ class RussianAnimalsDB:
     def get_animals_by_region(self, region_name_ru):
         """Получает животных для региона из базы данных"""
         region_keywords = self._get_region_keywords(region_name_ru)
-        animals = []
 
-        for category, species_list in self.animals_db.items():
-            for animal in species_list:
-                if self._is_animal_in_region(animal, region_keywords):
-                    animals.append({
-                        'scientific_name': animal['scientific_name'],
-                        'common_name': animal['common_name'],
-                        'class_ru': category.capitalize(),
-                        'phylum_ru': 'Хордовые',
-                        'source': 'local_db',
-                        'region': region_name_ru
-                    })
+        # Объединяем записи всех зон региона, сохраняя порядок базы
+        positions = sorted(set(position for keyword in region_keywords
+                               for position in self.by_region.get(keyword, [])))
+
+        animals = []
+        for position in positions:
+            category, animal = self.entries[position]
+            animals.append({
+                'scientific_name': animal['scientific_name'],
+                'common_name': animal['common_name'],
+                'class_ru': category.capitalize(),
+                'phylum_ru': 'Хордовые',
+                'source': 'local_db',
+                'region': region_name_ru
+            })
 
         return animals
 
     def _get_region_keywords(self, region_name_ru):
         """Определяет ключевые слова для региона"""
-        region_mapping = {
-            'Забайкальский край': ['Сибирь', 'Дальний Восток', 'все'],
-            'Амурская': ['Дальний Восток', 'все'],
-            'Краснодарский край': ['Европейская часть', 'все'],
-            'Москва': ['Европейская часть', 'все'],
-            'Крым': ['Европейская часть', 'все'],
-            'Татарстан': ['Европейская часть', 'все']
-        }
-
-        return region_mapping.get(region_name_ru, ['все'])
-
-    def _is_animal_in_region(self, animal, region_keywords):
-        """Проверяет, водится ли животное в регионе"""
-        return any(keyword in animal['regions'] for keyword in region_keywords)
+        return self.keywords_by_region.get(self._region_key(region_name_ru), ['все'])
 
     def get_common_name(self, scientific_name):
-        """Получает русское название по научному"""
-        for category, species_list in self.animals_db.items():
-            for animal in species_list:
-                if animal['scientific_name'].lower() == scientific_name.lower():
-                    return animal['common_name']
-        return None
+        """Получает русское название по научному (сравнение по каноническому имени, без авторства)"""
+        animal = self.by_name.get(self.make_key(scientific_name))
+        return animal['common_name'] if animal else None
 
     def enhance_gbif_data(self, gbif_animals):
-        """Улучшает данные из GBIF русскими названиями"""
-        enhanced_animals = []
+        """Улучшает данные из GBIF русскими названиями (список словарей или DataFrame)"""
+        if hasattr(gbif_animals, 'columns'):
+            return self._enhance_frame(gbif_animals)
 
+        # Каждое различное научное название ищем в индексе один раз
+        common_names = {}
         for animal in gbif_animals:
-            enhanced_animal = animal.copy()
             scientific_name = animal.get('scientific_name')
+            if scientific_name and scientific_name not in common_names and self._needs_name(animal.get('common_name')):
+                common_names[scientific_name] = self.get_common_name(scientific_name)
 
-            # Если нет русского названия, ищем в базе
-            if scientific_name and (not animal.get('common_name') or animal.get('common_name') == 'Не указано'):
-                common_name = self.get_common_name(scientific_name)
-                if common_name:
-                    enhanced_animal['common_name'] = common_name
-                    enhanced_animal['name_source'] = 'local_db'
+        enhanced_animals = []
+        for animal in gbif_animals:
+            enhanced_animal = animal.copy()
+            common_name = common_names.get(animal.get('scientific_name'))
+
+            # Если нет русского названия, берем из базы
+            if common_name and self._needs_name(animal.get('common_name')):
+                enhanced_animal['common_name'] = common_name
+                enhanced_animal['name_source'] = 'local_db'
 
             enhanced_animals.append(enhanced_animal)
 
-        return enhanced_animals
\ No newline at end of file
+        return enhanced_animals
+
+    @staticmethod
+    def _needs_name(common_name):
+        """Нужно ли искать русское название для записи"""
+        return not common_name or common_name == 'Не указано'
+
+    def _enhance_frame(self, df):
+        """Векторная версия enhance_gbif_data для DataFrame"""
+        enhanced = df.copy()
+        if 'scientific_name' not in enhanced.columns:
+            return enhanced
+
+        current = enhanced['common_name'] if 'common_name' in enhanced.columns else None
+        missing = enhanced['scientific_name'].notna()
+        if current is not None:
+            missing &= current.isna() | (current == '') | (current == 'Не указано')
+
+        # Джойн по различным научным названиям
+        names = enhanced.loc[missing, 'scientific_name']
+        mapping = {name: self.get_common_name(name) for name in names.unique()}
+        found = names.map(mapping).dropna()
+
+        enhanced.loc[found.index, 'common_name'] = found
+        enhanced.loc[found.index, 'name_source'] = 'local_db'
+        return enhanced
\ No newline at end of file
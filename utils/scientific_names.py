@@ -0,0 +1,138 @@
+import hashlib
+import re
+from functools import lru_cache
+
+# Маркеры внутривидовых рангов (в каноническое имя не входят)
+INFRASPECIFIC_MARKERS = {'subsp.', 'ssp.', 'subsp', 'ssp', 'var.', 'var', 'f.', 'forma', 'morph', 'ab.', 'nat.'}
+
+# Маркеры неопределенности: после sp./spp. эпитета нет, после cf./aff. он идет следующим.
+# Неуверенное определение - отдельное каноническое имя ("Parus cf. major"), а не подтвержденный вид
+UNRESOLVED_MARKERS = {'sp.', 'spp.', 'sp', 'spp', 'indet.', 'indet'}
+UNCERTAINTY_MARKERS = {'cf.': 'cf.', 'cf': 'cf.', 'aff.': 'aff.', 'aff': 'aff.', 'nr.': 'nr.', 'nr': 'nr.',
+                       '?': '?'}
+
+# Знак гибрида: формула "Anas platyrhynchos × Anas acuta" - отдельное каноническое имя.
+# Строчная x - знак гибрида только перед родом ("Anas platyrhynchos x Anas acuta"):
+# "Canis lupus x familiaris" - не формула
+HYBRID_SIGNS = {'×', 'X'}
+
+# Версия правил разбора: при ее смене ключи видов в сохраненных данных пересчитываются
+NAME_PARSER_VERSION = 4
+
+# Частицы в фамилиях авторов, которые пишутся со строчной буквы
+AUTHOR_PARTICLES = {'de', 'da', 'del', 'della', 'der', 'den', 'di', 'du', 'la', 'le', 'van', 'von', 'zu',
+                    'ex', 'in', 'et', 'and', 'auct.', 'auct', 'non', 'sensu', 'emend.', 'nom.'}
+
+# Заглушки вместо названия (регистр не важен) - у таких записей нет вида и ключа
+PLACEHOLDER_NAMES = {'не указано', 'неизвестно', 'нет названия', 'unknown', 'n/a', 'none', 'nan'}
+
+# Научные названия пишутся только латиницей
+EPITHET_RE = re.compile(r"^[a-z][a-z\-]+$")
+GENUS_RE = re.compile(r"^[A-Z][a-z\-]+$")
+
+
+def _is_hybrid_sign(tokens, position):
+    """Является ли токен знаком гибрида (строчная x - только перед названием рода)"""
+    token = tokens[position]
+    if token in HYBRID_SIGNS:
+        return True
+    return token == 'x' and position + 1 < len(tokens) and GENUS_RE.match(tokens[position + 1]) is not None
+
+
+@lru_cache(maxsize=65536)
+def canonical_name(scientific_name):
+    """Выделяет каноническое имя (род + эпитет [+ подвид]) без авторства и года"""
+    if not scientific_name or not isinstance(scientific_name, str):
+        return ''
+
+    tokens = scientific_name.replace('×', ' × ').split()
+    if ' '.join(tokens).casefold() in PLACEHOLDER_NAMES:
+        return ''
+
+    # Гибрид: каждая часть формулы разбирается отдельно, знак сохраняется
+    if any(_is_hybrid_sign(tokens, position) for position in range(1, len(tokens) - 1)) or \
+            (tokens[:1] in (['×'], ['x']) and _is_hybrid_sign(tokens, 0)):
+        sides, side = [], []
+        for position, token in enumerate(tokens):
+            if _is_hybrid_sign(tokens, position):
+                sides.append(side)
+                side = []
+            else:
+                side.append(token)
+        sides.append(side)
+        genus = sides[0][0] if sides[0] else ''
+        names = []
+        for side in sides:
+            if side and genus and EPITHET_RE.match(side[0]):
+                # Нотовид "Mentha × piperita": эпитет разбирается вместе с родом первой части
+                names.append(canonical_name(f"{genus} {' '.join(side)}")[len(genus) + 1:])
+            else:
+                names.append(canonical_name(' '.join(side)))
+        return ' × '.join(names).strip()
+
+    if not tokens or not GENUS_RE.match(tokens[0]):
+        # Не похоже на биноминальное имя - оставляем как есть, без лишних пробелов
+        return ' '.join(tokens)
+
+    parts = [tokens[0]]
+    position = 1
+    uncertainty = None  # (маркер, позиция в parts)
+
+    # Подрод в скобках: "Sorex (Otisorex) minutissimus"
+    if position + 1 < len(tokens) and re.match(r"^\([A-Z][a-z\-]+\)$", tokens[position]) \
+            and EPITHET_RE.match(tokens[position + 1]):
+        position += 1
+
+    while position < len(tokens) and len(parts) < 3:
+        token = tokens[position]
+
+        if token in UNRESOLVED_MARKERS:
+            break
+        if token.lower() in UNCERTAINTY_MARKERS:
+            uncertainty = uncertainty or (UNCERTAINTY_MARKERS[token.lower()], len(parts))
+            position += 1
+            continue
+        if len(parts) == 2 and token in INFRASPECIFIC_MARKERS:
+            position += 1
+            continue
+        if token in AUTHOR_PARTICLES or not EPITHET_RE.match(token):
+            # Дальше начинается авторство: "(Linnaeus, 1758)", "Pallas, 1811", "de Vis"
+            break
+
+        parts.append(token)
+        position += 1
+
+    # Маркер сразу после подвида: "Parus major major cf."
+    if not uncertainty and position < len(tokens) and tokens[position].lower() in UNCERTAINTY_MARKERS:
+        uncertainty = (UNCERTAINTY_MARKERS[tokens[position].lower()], len(parts))
+
+    if uncertainty:
+        marker, marker_position = uncertainty
+        if marker_position == len(parts) and len(parts) > 1:
+            # Маркер в конце ("Parus major cf.") относится к последнему эпитету - как "Parus cf. major"
+            marker_position -= 1
+        parts.insert(marker_position, marker)
+    return ' '.join(parts)
+
+
+def name_key(canonical):
+    """Компактный хэш-ключ канонического имени (16 hex-символов)"""
+    if not canonical:
+        return None
+    return hashlib.blake2b(canonical.lower().encode('utf-8'), digest_size=8).hexdigest()
+
+
+@lru_cache(maxsize=65536)
+def scientific_name_key(scientific_name):
+    """Ключ вида по исходному научному названию"""
+    return name_key(canonical_name(scientific_name))
+
+
+def add_name_keys(animal):
+    """Добавляет в запись колонки canonical_name и name_key (если их еще нет)"""
+    # Записи, сохраненные прежними правилами разбора (заглушки, гибриды, cf./aff.), пересчитываются
+    if 'name_key' not in animal or animal.get('canonical_name') != canonical_name(animal.get('scientific_name')):
+        scientific_name = animal.get('scientific_name')
+        animal['canonical_name'] = canonical_name(scientific_name)
+        animal['name_key'] = scientific_name_key(scientific_name)
+    return animal
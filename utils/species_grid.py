@@ -0,0 +1,340 @@
+import json
+import math
+import os
+import numpy as np
+from utils.scientific_names import scientific_name_key
+from utils.coordinate_quality import is_clean
+
+SQRT3 = math.sqrt(3)
+
+
+class SpeciesGrid:
+    """Агрегаты находок по ячейкам сетки нескольких разрешений: записи, виды, индекс Шеннона, классы"""
+
+    # Размеры ячеек в градусах - от крупных к мелким
+    RESOLUTIONS = (2.0, 1.0, 0.5, 0.2, 0.1, 0.05)
+    SHAPES = ('square', 'hex')
+
+    def __init__(self, grid_dir="data/cache/grid", resolutions=None, shape='square'):
+        if shape not in self.SHAPES:
+            raise ValueError(f"Неизвестная форма ячеек: {shape}")
+        self.grid_dir = grid_dir
+        self.resolutions = tuple(sorted(resolutions or self.RESOLUTIONS, reverse=True))
+        self.shape = shape
+        self.manifest_path = os.path.join(grid_dir, "index.json")
+        # regions: normalized_name -> {'name_ru', 'version', 'grid', 'count', 'bbox'}
+        self.regions = {}
+        self._arrays = {}
+        self._load_manifest()
+
+    @property
+    def grid_version(self):
+        """Параметры сетки: при их смене регионы переагрегируются
+        (q - только проверенные координаты, s - записи без названия вида не считаются видом)"""
+        return f"qs:{self.shape}:{','.join(str(resolution) for resolution in self.resolutions)}"
+
+    def _load_manifest(self):
+        """Загружает список агрегированных регионов"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.regions = json.load(f).get('regions', {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Сетка биоразнообразия повреждена, будет построена заново: {e}")
+
+    def save(self):
+        """Сохраняет список регионов (агрегаты сохраняются при обновлении региона)"""
+        tmp_path = self.manifest_path + '.tmp'
+        try:
+            os.makedirs(self.grid_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'regions': self.regions}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения сетки биоразнообразия: {e}")
+            return False
+
+    def _arrays_path(self, normalized_name):
+        return os.path.join(self.grid_dir, f"{normalized_name}.npz")
+
+    # Геометрия ячеек
+
+    def cell_ids(self, latitudes, longitudes, resolution):
+        """Номера ячеек точек (массив n x 2): строка/столбец для квадратов, осевые координаты для шестиугольников"""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if self.shape == 'square':
+            return np.column_stack([np.floor(latitudes / resolution),
+                                    np.floor(longitudes / resolution)]).astype(np.int64)
+
+        # Шестиугольники с вершиной вверх шириной resolution (в плоскости долгота/широта)
+        size = resolution / SQRT3
+        q = (SQRT3 / 3 * longitudes - latitudes / 3) / size
+        r = (2 / 3 * latitudes) / size
+        # Округление в кубических координатах (x + y + z = 0)
+        x, z = q, r
+        y = -x - z
+        rx, ry, rz = np.round(x), np.round(y), np.round(z)
+        dx, dy, dz = np.abs(rx - x), np.abs(ry - y), np.abs(rz - z)
+        fix_x = (dx > dy) & (dx > dz)
+        fix_z = ~fix_x & (dz >= dy)
+        rx = np.where(fix_x, -ry - rz, rx)
+        rz = np.where(fix_z, -rx - ry, rz)
+        return np.column_stack([rx, rz]).astype(np.int64)
+
+    def cell_centers(self, cells, resolution):
+        """Центры ячеек: (широты, долготы)"""
+        cells = np.asarray(cells, dtype=float).reshape(-1, 2)
+        if self.shape == 'square':
+            return (cells[:, 0] + 0.5) * resolution, (cells[:, 1] + 0.5) * resolution
+        size = resolution / SQRT3
+        return size * 1.5 * cells[:, 1], size * SQRT3 * (cells[:, 0] + cells[:, 1] / 2)
+
+    def cell_polygon(self, cell, resolution):
+        """Контур ячейки: [[широта, долгота], ...]"""
+        if self.shape == 'square':
+            min_lat, min_lon = cell[0] * resolution, cell[1] * resolution
+            max_lat, max_lon = min_lat + resolution, min_lon + resolution
+            return [[min_lat, min_lon], [min_lat, max_lon], [max_lat, max_lon], [max_lat, min_lon]]
+
+        latitudes, longitudes = self.cell_centers([cell], resolution)
+        size = resolution / SQRT3
+        return [[float(latitudes[0] + size * math.sin(math.radians(30 + 60 * corner))),
+                 float(longitudes[0] + size * math.cos(math.radians(30 + 60 * corner)))]
+                for corner in range(6)]
+
+    def resolution_for_zoom(self, zoom):
+        """Разрешение для масштаба веб-карты: ячейка примерно в 1/8 тайла, но не мельче имеющихся"""
+        target = 360.0 / (2 ** zoom) / 8
+        suitable = [resolution for resolution in self.resolutions if resolution >= target]
+        return suitable[-1] if suitable else self.resolutions[0]
+
+    # Агрегация
+
+    @staticmethod
+    def _aggregate(cell_index, species_codes, class_codes, n_cells, n_classes, weights=None):
+        """Агрегаты ячеек по записям (или по уже сгруппированным парам с весами weights).
+
+        Возвращает записи, число видов, индекс Шеннона и число записей по классам на ячейку,
+        а также пары ячейка-вид с числом записей (для объединения регионов). Записи без вида
+        (код -1) входят в число записей и классов, но не в виды и индекс Шеннона.
+        """
+        weights = np.ones(len(cell_index)) if weights is None else np.asarray(weights, dtype=float)
+        records = np.bincount(cell_index, weights=weights, minlength=n_cells)
+        class_counts = np.bincount(cell_index * n_classes + class_codes, weights=weights,
+                                   minlength=n_cells * n_classes).reshape(n_cells, n_classes)
+
+        named = species_codes >= 0
+        cell_index, species_codes, weights = cell_index[named], species_codes[named], weights[named]
+        named_records = np.bincount(cell_index, weights=weights, minlength=n_cells)
+
+        n_species = int(species_codes.max()) + 1 if len(species_codes) else 1
+        pairs, inverse = np.unique(cell_index * n_species + species_codes, return_inverse=True)
+        pair_counts = np.bincount(inverse.ravel(), weights=weights)
+        pair_cells = pairs // n_species
+
+        species = np.bincount(pair_cells, minlength=n_cells)
+        proportions = pair_counts / named_records[pair_cells]
+        shannon = -np.bincount(pair_cells, weights=proportions * np.log(proportions), minlength=n_cells)
+
+        return {
+            'records': records.astype(np.int64),
+            'species': species.astype(np.int64),
+            'shannon': np.abs(shannon),
+            'class_counts': class_counts.astype(np.int64),
+            'pair_cells': pair_cells,
+            'pair_species': pairs % n_species,
+            'pair_counts': pair_counts.astype(np.int64)
+        }
+
+    def region_version(self, normalized_name):
+        """Версия данных региона, по которой построены его агрегаты"""
+        region = self.regions.get(normalized_name)
+        if not region or region.get('grid') != self.grid_version \
+                or not os.path.exists(self._arrays_path(normalized_name)):
+            return None
+        return region.get('version')
+
+    def update_region(self, normalized_name, region_name_ru, animals, version=None, save=True):
+        """Переагрегирует один регион на всех разрешениях"""
+        latitudes, longitudes, species, classes = [], [], [], []
+        for animal in animals:
+            # Индексируются только точки, прошедшие проверку координат
+            if not is_clean(animal):
+                continue
+            latitude, longitude = animal['decimalLatitude'], animal['decimalLongitude']
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+            species.append(animal.get('name_key') or scientific_name_key(animal.get('scientific_name')) or '')
+            classes.append(animal.get('class') or '')
+
+        species_vocab, species_codes = np.unique(np.array(species, dtype=str), return_inverse=True)
+        class_vocab, class_codes = np.unique(np.array(classes, dtype=str), return_inverse=True)
+        species_codes, class_codes = species_codes.ravel(), class_codes.ravel()
+        # Пустое название - не вид (как пропуски в признаках BiodiversityML): код -1
+        if len(species_vocab) and species_vocab[0] == '':
+            species_vocab, species_codes = species_vocab[1:], species_codes - 1
+
+        arrays = {'species_vocab': species_vocab, 'class_vocab': class_vocab}
+        for level, resolution in enumerate(self.resolutions):
+            if latitudes:
+                cells, cell_index = np.unique(self.cell_ids(latitudes, longitudes, resolution), axis=0,
+                                              return_inverse=True)
+                cell_index = cell_index.ravel()
+            else:
+                cells, cell_index = np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+            aggregates = self._aggregate(cell_index, species_codes, class_codes, len(cells), len(class_vocab))
+            arrays[f'r{level}_cells'] = cells
+            for key, values in aggregates.items():
+                arrays[f'r{level}_{key}'] = values
+
+        os.makedirs(self.grid_dir, exist_ok=True)
+        np.savez_compressed(self._arrays_path(normalized_name), **arrays)
+
+        self.regions[normalized_name] = {
+            'name_ru': region_name_ru,
+            'version': version,
+            'grid': self.grid_version,
+            'count': len(latitudes),
+            'bbox': [min(latitudes), min(longitudes), max(latitudes), max(longitudes)] if latitudes else None
+        }
+        self._arrays[normalized_name] = arrays
+
+        if save:
+            self.save()
+
+    def remove_region(self, normalized_name, save=True):
+        """Убирает регион из сетки"""
+        self.regions.pop(normalized_name, None)
+        self._arrays.pop(normalized_name, None)
+        if os.path.exists(self._arrays_path(normalized_name)):
+            os.remove(self._arrays_path(normalized_name))
+        if save:
+            self.save()
+
+    def _get_arrays(self, normalized_name):
+        """Агрегаты региона (загружаются с диска при первом обращении)"""
+        arrays = self._arrays.get(normalized_name)
+        if arrays is None:
+            with np.load(self._arrays_path(normalized_name)) as data:
+                arrays = self._arrays[normalized_name] = {key: data[key] for key in data.files}
+        return arrays
+
+    # Запросы
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon, zoom=None, resolution=None):
+        """Ячейки с центром внутри прямоугольника на разрешении для zoom (или заданном resolution).
+
+        Ячейки на стыке регионов объединяются: записи и классы суммируются, виды и индекс Шеннона
+        пересчитываются по объединенным видам.
+        """
+        if resolution is None:
+            resolution = self.resolution_for_zoom(zoom) if zoom is not None else self.resolutions[0]
+        if resolution not in self.resolutions:
+            raise ValueError(f"Разрешение {resolution} не построено, доступны: {self.resolutions}")
+        level = self.resolutions.index(resolution)
+
+        # Ячейки регионов, попавшие в прямоугольник
+        parts = []
+        for normalized_name, region in self.regions.items():
+            bbox = region['bbox']
+            if not region['count'] or bbox[0] > max_lat + resolution or bbox[2] < min_lat - resolution \
+                    or bbox[1] > max_lon + resolution or bbox[3] < min_lon - resolution:
+                continue
+            arrays = self._get_arrays(normalized_name)
+            cells = arrays[f'r{level}_cells']
+            latitudes, longitudes = self.cell_centers(cells, resolution)
+            selected = np.flatnonzero((latitudes >= min_lat) & (latitudes <= max_lat) &
+                                      (longitudes >= min_lon) & (longitudes <= max_lon))
+            if len(selected):
+                parts.append((normalized_name, arrays, selected))
+
+        if not parts:
+            return []
+
+        all_cells = np.concatenate([arrays[f'r{level}_cells'][selected] for _, arrays, selected in parts])
+        unique_cells, owners = np.unique(all_cells, axis=0, return_counts=True)
+        shared = {tuple(cell) for cell in unique_cells[owners > 1].tolist()}
+
+        results = []
+        merged = {'cells': [], 'species': [], 'classes': [], 'counts': [], 'class_cells': [], 'class_counts': [],
+                  'records': []}
+        for normalized_name, arrays, selected in parts:
+            cells = arrays[f'r{level}_cells']
+            class_vocab = arrays['class_vocab']
+            for cell_number in selected.tolist():
+                cell = tuple(cells[cell_number].tolist())
+                if cell in shared:
+                    continue
+                results.append(self._cell_record(cell, resolution,
+                                                 int(arrays[f'r{level}_records'][cell_number]),
+                                                 int(arrays[f'r{level}_species'][cell_number]),
+                                                 float(arrays[f'r{level}_shannon'][cell_number]),
+                                                 dict(zip(class_vocab.tolist(),
+                                                          arrays[f'r{level}_class_counts'][cell_number].tolist())),
+                                                 [normalized_name]))
+
+            if shared:
+                # Пары ячейка-вид и классы общих ячеек - для пересчета
+                is_shared = np.array([tuple(cell) in shared for cell in cells[selected].tolist()])
+                shared_numbers = selected[is_shared]
+                pair_mask = np.isin(arrays[f'r{level}_pair_cells'], shared_numbers)
+                pair_cells = arrays[f'r{level}_pair_cells'][pair_mask]
+                merged['cells'].extend(map(tuple, cells[pair_cells].tolist()))
+                merged['species'].extend(arrays['species_vocab'][arrays[f'r{level}_pair_species'][pair_mask]].tolist())
+                merged['counts'].extend(arrays[f'r{level}_pair_counts'][pair_mask].tolist())
+                for cell_number in shared_numbers.tolist():
+                    merged['class_cells'].append((tuple(cells[cell_number].tolist()), normalized_name))
+                    merged['records'].append(int(arrays[f'r{level}_records'][cell_number]))
+                    merged['class_counts'].append(dict(zip(class_vocab.tolist(),
+                                                           arrays[f'r{level}_class_counts'][cell_number].tolist())))
+
+        if shared:
+            results.extend(self._merge_shared(merged, resolution))
+
+        results.sort(key=lambda cell: (-cell['lat'], cell['lon']))
+        return results
+
+    def _merge_shared(self, merged, resolution):
+        """Объединяет агрегаты ячеек, общих для нескольких регионов"""
+        cell_keys = sorted(set(merged['cells']))
+        cell_numbers = {cell: number for number, cell in enumerate(cell_keys)}
+        species_vocab, species_codes = np.unique(np.array(merged['species'], dtype=str), return_inverse=True)
+
+        aggregates = self._aggregate(np.array([cell_numbers[cell] for cell in merged['cells']], dtype=np.int64),
+                                     species_codes.ravel(), np.zeros(len(merged['cells']), dtype=np.int64),
+                                     len(cell_keys), 1, weights=merged['counts'])
+
+        # Число записей - по регионам (в парах ячейка-вид нет записей без названия вида)
+        records = {cell: 0 for cell in cell_keys}
+        classes = {cell: {} for cell in cell_keys}
+        regions = {cell: [] for cell in cell_keys}
+        for (cell, normalized_name), class_counts, cell_records in zip(merged['class_cells'], merged['class_counts'],
+                                                                       merged['records']):
+            regions[cell].append(normalized_name)
+            records[cell] += cell_records
+            for class_name, count in class_counts.items():
+                classes[cell][class_name] = classes[cell].get(class_name, 0) + count
+
+        return [self._cell_record(cell, resolution, records[cell],
+                                  int(aggregates['species'][number]), float(aggregates['shannon'][number]),
+                                  classes[cell], regions[cell])
+                for number, cell in enumerate(cell_keys)]
+
+    def _cell_record(self, cell, resolution, records, species, shannon, class_counts, regions):
+        """Описание ячейки для карт и аналитики"""
+        latitudes, longitudes = self.cell_centers([cell], resolution)
+        return {
+            'cell': cell,
+            'resolution': resolution,
+            'lat': float(latitudes[0]),
+            'lon': float(longitudes[0]),
+            'records': records,
+            'species': species,
+            'shannon': round(shannon, 4),
+            'classes': {class_name: count for class_name, count in class_counts.items() if count},
+            'regions': regions
+        }
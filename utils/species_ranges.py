@@ -0,0 +1,364 @@
+import hashlib
+import json
+import os
+import numpy as np
+from scipy.spatial import ConvexHull, Delaunay, QhullError
+from utils.coordinate_quality import is_clean
+from utils.write_behind import WriteBehindJSONStore
+
+KM_PER_DEGREE = 111.32
+
+
+def _unwrap_longitudes(longitudes):
+    """Долготы без разрыва на 180-м меридиане (восток Чукотки -> 180…191)"""
+    longitudes = np.asarray(longitudes, dtype=float)
+    if len(longitudes) and longitudes.min() < -90 and longitudes.max() > 90:
+        return np.where(longitudes < 0, longitudes + 360, longitudes)
+    return longitudes
+
+
+def _project(latitudes, longitudes):
+    """Равновеликая синусоидальная проекция в км (площади и расстояния для оболочек)"""
+    latitudes = np.asarray(latitudes, dtype=float)
+    x = np.asarray(longitudes, dtype=float) * np.cos(np.radians(latitudes)) * KM_PER_DEGREE
+    return np.column_stack([x, latitudes * KM_PER_DEGREE])
+
+
+def _ring_area(xy):
+    """Площадь кольца по формуле шнурков (со знаком: против часовой стрелки - положительная)"""
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def convex_hull(latitudes, longitudes):
+    """Вершины выпуклой оболочки точек против часовой стрелки, массив n x 2 [широта, долгота]"""
+    points = np.unique(np.column_stack([latitudes, longitudes]), axis=0)
+    if len(points) < 3:
+        return points
+    try:
+        # В проекции лон/лат: обход против часовой стрелки
+        return points[ConvexHull(points[:, ::-1]).vertices]
+    except QhullError:
+        # Все точки на одной линии - оболочка вырождается в отрезок между крайними точками
+        return points[[0, -1]]
+
+
+def alpha_shape(latitudes, longitudes, alpha_km):
+    """Альфа-оболочка: треугольники Делоне с радиусом описанной окружности не больше alpha_km.
+
+    Возвращает (список многоугольников [внешнее кольцо, дырки...] в [широта, долгота], площадь в км²);
+    точки, не вошедшие ни в один треугольник, - отдельные многоугольники из одной точки,
+    для вырожденных наборов точек - выпуклая оболочка.
+    """
+    points = np.unique(np.column_stack([latitudes, longitudes]), axis=0)
+    xy = _project(points[:, 0], points[:, 1])
+    try:
+        triangles = Delaunay(xy).simplices
+    except (QhullError, ValueError):
+        hull = convex_hull(points[:, 0], points[:, 1])
+        return [[hull.tolist()]], 0.0
+
+    a, b, c = xy[triangles[:, 0]], xy[triangles[:, 1]], xy[triangles[:, 2]]
+    cross = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    sides = (np.linalg.norm(b - c, axis=1) * np.linalg.norm(a - c, axis=1) * np.linalg.norm(a - b, axis=1))
+    with np.errstate(divide='ignore'):
+        circumradius = sides / (2 * np.abs(cross))
+    kept = triangles[circumradius <= alpha_km]
+    # Все треугольники против часовой стрелки - тогда внешние кольца тоже против, дырки - по часовой
+    flip = cross[circumradius <= alpha_km] < 0
+    kept[flip] = kept[flip][:, [0, 2, 1]]
+    isolated = np.setdiff1d(np.arange(len(points)), kept.ravel())
+
+    # Граничные ребра - те, у которых нет обратного ребра соседнего треугольника
+    edges = np.concatenate([kept[:, [0, 1]], kept[:, [1, 2]], kept[:, [2, 0]]])
+    edge_set = set(map(tuple, edges.tolist()))
+    following = {}
+    for start, end in edge_set:
+        if (end, start) not in edge_set:
+            following.setdefault(start, []).append(end)
+
+    rings = []
+    while following:
+        start = next(iter(following))
+        ring, vertex = [start], start
+        while True:
+            ends = following[vertex]
+            vertex_next = ends.pop()
+            if not ends:
+                del following[vertex]
+            if vertex_next == start:
+                break
+            ring.append(vertex_next)
+            vertex = vertex_next
+        rings.append(ring)
+
+    outers, holes = [], []
+    for ring in rings:
+        (outers if _ring_area(xy[ring]) > 0 else holes).append(ring)
+
+    polygons = [[ring] for ring in outers]
+    for hole in holes:
+        # Дырка относится к внешнему кольцу, внутри которого лежит ее первая вершина
+        for polygon in polygons:
+            if _point_in_ring(xy[hole[0]], xy[polygon[0]]):
+                polygon.append(hole)
+                break
+
+    polygons += [[[vertex]] for vertex in isolated.tolist()]
+    area = float(np.abs(cross[circumradius <= alpha_km]).sum() / 2)
+    return [[points[ring].tolist() for ring in polygon] for polygon in polygons], area
+
+
+def _point_in_ring(point, ring_xy):
+    """Точка внутри кольца (четность пересечений луча вправо)"""
+    x, y = point
+    x1, y1 = ring_xy[:, 0], ring_xy[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = ((y1 > y) != (y2 > y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return bool(np.count_nonzero(crosses & (x < x_cross)) % 2)
+
+
+class SpeciesRangeIndex:
+    """Ареалы видов по сохраненным находкам: выпуклые оболочки по регионам и альфа-оболочки по запросу.
+
+    Регион пересчитывается только при изменении его данных; ареал вида собирается из оболочек регионов
+    (выпуклая оболочка объединения = оболочка вершин оболочек) и кэшируется по виду и версии данных.
+    """
+
+    # Размер ячейки прореживания точек для альфа-оболочек (градусы) и радиус альфа-оболочки по умолчанию (км)
+    THIN_RESOLUTION = 0.05
+    ALPHA_KM = 150.0
+    METHODS = ('convex', 'alpha')
+
+    def __init__(self, index_dir="data/cache/ranges", thin_resolution=None):
+        self.index_dir = index_dir
+        self.thin_resolution = thin_resolution or self.THIN_RESOLUTION
+        self.manifest_path = os.path.join(index_dir, "index.json")
+        # regions: normalized_name -> {'name_ru', 'version', 'format', 'species': {name_key: {'canonical_name',
+        #          'count', 'hull': [[широта, долгота], ...]}}}
+        # species: name_key -> [normalized_name, ...] (строится при загрузке)
+        self.regions = {}
+        self.species = {}
+        self._points = {}
+        # Готовые ареалы: "<вид>|<метод>|<регионы>" -> {'version', 'range'}
+        self.cache = WriteBehindJSONStore(os.path.join(index_dir, "ranges_cache.json"))
+        self._load_manifest()
+
+    @property
+    def format_version(self):
+        """Параметры построения: при их смене регионы пересчитываются (q - только проверенные координаты)"""
+        return f"q:{self.thin_resolution}"
+
+    def _load_manifest(self):
+        """Загружает оболочки регионов"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.regions = json.load(f).get('regions', {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Индекс ареалов поврежден, будет построен заново: {e}")
+        for normalized_name, region in self.regions.items():
+            for species_key in region['species']:
+                self.species.setdefault(species_key, []).append(normalized_name)
+
+    def save(self):
+        """Сохраняет оболочки регионов атомарно (точки сохраняются при обновлении региона)"""
+        tmp_path = self.manifest_path + '.tmp'
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'regions': self.regions}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.manifest_path)
+            self.cache.flush()
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения индекса ареалов: {e}")
+            return False
+
+    def _points_path(self, normalized_name):
+        return os.path.join(self.index_dir, f"{normalized_name}.npz")
+
+    def region_version(self, normalized_name):
+        """Версия данных региона, по которой построены его оболочки"""
+        region = self.regions.get(normalized_name)
+        if not region or region.get('format') != self.format_version \
+                or not os.path.exists(self._points_path(normalized_name)):
+            return None
+        return region.get('version')
+
+    def update_region(self, normalized_name, region_name_ru, animals, version=None, save=True):
+        """Пересчитывает оболочки видов одного региона и его прореженные точки"""
+        latitudes, longitudes, species, names = [], [], [], {}
+        for animal in animals:
+            # Ареал строится только по точкам, прошедшим проверку координат
+            if not animal.get('name_key') or not is_clean(animal):
+                continue
+            latitudes.append(animal['decimalLatitude'])
+            longitudes.append(animal['decimalLongitude'])
+            species.append(animal['name_key'])
+            names.setdefault(animal['name_key'], animal.get('canonical_name'))
+
+        species_vocab, species_codes = np.unique(np.array(species, dtype=str), return_inverse=True)
+        species_codes = species_codes.ravel()
+        latitudes = np.array(latitudes, dtype=float)
+        longitudes = _unwrap_longitudes(longitudes)
+
+        # Прореживание: одна точка вида на ячейку thin_resolution - для альфа-оболочек этого достаточно
+        cells = np.column_stack([species_codes, np.floor(latitudes / self.thin_resolution),
+                                 np.floor(longitudes / self.thin_resolution)]).astype(np.int64)
+        _, first = np.unique(cells, axis=0, return_index=True) if len(cells) else (None, np.empty(0, dtype=np.int64))
+        arrays = {'species_vocab': species_vocab, 'species': species_codes[first],
+                  'latitudes': latitudes[first], 'longitudes': longitudes[first]}
+
+        region_species = {}
+        order = np.argsort(species_codes, kind='stable')
+        bounds = np.searchsorted(species_codes[order], np.arange(len(species_vocab) + 1))
+        for code, species_key in enumerate(species_vocab.tolist()):
+            members = order[bounds[code]:bounds[code + 1]]
+            region_species[species_key] = {
+                'canonical_name': names[species_key],
+                'count': len(members),
+                'hull': np.round(convex_hull(latitudes[members], longitudes[members]), 5).tolist()
+            }
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.savez_compressed(self._points_path(normalized_name), **arrays)
+
+        old_species = set(self.regions.get(normalized_name, {}).get('species', {}))
+        for species_key in old_species - set(region_species):
+            self._remove_species_region(species_key, normalized_name)
+        for species_key in set(region_species) - old_species:
+            self.species.setdefault(species_key, []).append(normalized_name)
+
+        self.regions[normalized_name] = {
+            'name_ru': region_name_ru,
+            'version': version,
+            'format': self.format_version,
+            'species': region_species
+        }
+        self._points[normalized_name] = arrays
+
+        if save:
+            self.save()
+
+    def remove_region(self, normalized_name, save=True):
+        """Убирает регион из индекса ареалов"""
+        region = self.regions.pop(normalized_name, None)
+        self._points.pop(normalized_name, None)
+        if os.path.exists(self._points_path(normalized_name)):
+            os.remove(self._points_path(normalized_name))
+        if region:
+            for species_key in region['species']:
+                self._remove_species_region(species_key, normalized_name)
+            if save:
+                self.save()
+
+    def _remove_species_region(self, species_key, normalized_name):
+        regions = self.species.get(species_key, [])
+        if normalized_name in regions:
+            regions.remove(normalized_name)
+        if not regions:
+            self.species.pop(species_key, None)
+
+    def _get_points(self, normalized_name):
+        """Прореженные точки региона (загружаются с диска при первом обращении)"""
+        arrays = self._points.get(normalized_name)
+        if arrays is None:
+            with np.load(self._points_path(normalized_name)) as data:
+                arrays = self._points[normalized_name] = {key: data[key] for key in data.files}
+        return arrays
+
+    def species_version(self, species_key, regions=None):
+        """Версия данных вида: меняется, когда перезаписан любой регион, где он встречается"""
+        regions = sorted(regions if regions is not None else self.species.get(species_key, []))
+        parts = [f"{name}:{self.regions[name]['version']}" for name in regions if name in self.regions]
+        return hashlib.md5('|'.join([self.format_version] + parts).encode()).hexdigest()
+
+    # Запросы
+
+    def get_range(self, species_key, method='convex', alpha_km=None, regions=None):
+        """Ареал вида: многоугольники [внешнее кольцо, дырки...] в [широта, долгота], площадь, охват, регионы.
+
+        regions - ограничить ареал частью регионов; None, если вида нет в выбранных регионах.
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"Неизвестный метод построения ареала: {method}")
+        alpha_km = alpha_km or self.ALPHA_KM
+        species_regions = [name for name in self.species.get(species_key, [])
+                           if regions is None or name in regions]
+        if not species_regions:
+            return None
+
+        cache_key = '|'.join([species_key, method if method == 'convex' else f"alpha{alpha_km}",
+                              ','.join(sorted(regions)) if regions is not None else '*'])
+        version = self.species_version(species_key, species_regions)
+        cached = self.cache.get(cache_key)
+        if cached and cached['version'] == version:
+            return cached['range']
+
+        entries = [self.regions[name]['species'][species_key] for name in species_regions]
+        if method == 'convex':
+            vertices = np.concatenate([np.array(entry['hull'], dtype=float).reshape(-1, 2) for entry in entries])
+            vertices[:, 1] = _unwrap_longitudes(vertices[:, 1])
+            hull = convex_hull(vertices[:, 0], vertices[:, 1])
+            polygons = [[hull.tolist()]]
+            area = abs(_ring_area(_project(hull[:, 0], hull[:, 1]))) if len(hull) >= 3 else 0.0
+        else:
+            latitudes, longitudes = [], []
+            for name in species_regions:
+                arrays = self._get_points(name)
+                code = int(np.searchsorted(arrays['species_vocab'], species_key))
+                selected = arrays['species'] == code
+                latitudes.append(arrays['latitudes'][selected])
+                longitudes.append(arrays['longitudes'][selected])
+            latitudes, longitudes = np.concatenate(latitudes), _unwrap_longitudes(np.concatenate(longitudes))
+            vertices = np.column_stack([latitudes, longitudes])
+            polygons, area = alpha_shape(latitudes, longitudes, alpha_km)
+
+        species_range = {
+            'species_key': species_key,
+            'canonical_name': entries[0]['canonical_name'],
+            'method': method,
+            'alpha_km': alpha_km if method == 'alpha' else None,
+            'polygons': [[np.round(ring, 5).tolist() for ring in polygon] for polygon in polygons],
+            'area_km2': round(area, 1),
+            'bbox': [float(vertices[:, 0].min()), float(vertices[:, 1].min()),
+                     float(vertices[:, 0].max()), float(vertices[:, 1].max())],
+            'count': sum(entry['count'] for entry in entries),
+            'regions': sorted(species_regions),
+            'version': version
+        }
+        self.cache.set(cache_key, {'version': version, 'range': species_range})
+        return species_range
+
+    def region_ranges(self, species_key, method='convex', alpha_km=None):
+        """Ареал вида отдельно в каждом регионе (для сравнения между регионами), по убыванию площади"""
+        ranges = []
+        for normalized_name in self.species.get(species_key, []):
+            species_range = self.get_range(species_key, method, alpha_km, regions=[normalized_name])
+            ranges.append({'normalized_name': normalized_name,
+                           'region_name_ru': self.regions[normalized_name]['name_ru'], **species_range})
+        ranges.sort(key=lambda species_range: (-species_range['area_km2'], -species_range['count']))
+        return ranges
+
+    def compare_ranges(self, species_keys, method='convex', alpha_km=None):
+        """Сводка ареалов нескольких видов: площадь, крайние точки, число регионов и находок"""
+        rows = []
+        for species_key in species_keys:
+            species_range = self.get_range(species_key, method, alpha_km)
+            if species_range is None:
+                continue
+            min_lat, min_lon, max_lat, max_lon = species_range['bbox']
+            rows.append({
+                'species_key': species_key,
+                'canonical_name': species_range['canonical_name'],
+                'area_km2': species_range['area_km2'],
+                'south': min_lat, 'north': max_lat, 'west': min_lon, 'east': max_lon,
+                'regions': len(species_range['regions']),
+                'count': species_range['count']
+            })
+        rows.sort(key=lambda row: -row['area_km2'])
+        return rows
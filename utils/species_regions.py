@@ -0,0 +1,108 @@
+import json
+import os
+
+
+class SpeciesRegionIndex:
+    """Обратный индекс: вид (ключ канонического имени) -> регионы, где он встречается"""
+
+    def __init__(self, index_path="data/cache/species_regions_index.json"):
+        self.index_path = index_path
+        # regions: normalized_name -> {'name_ru', 'version', 'species': [name_key, ...]}
+        # species: name_key -> {'canonical_name', 'regions': {normalized_name: статистика}}
+        self.regions = {}
+        self.species = {}
+        self._load()
+
+    def _load(self):
+        """Загружает сохраненный индекс"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.regions = data.get('regions', {})
+            self.species = data.get('species', {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Индекс видов по регионам поврежден, будет построен заново: {e}")
+
+    def save(self):
+        """Сохраняет индекс атомарно (временный файл + os.replace)"""
+        tmp_path = self.index_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'regions': self.regions, 'species': self.species}, f,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения индекса видов {self.index_path}: {e}")
+            return False
+
+    def region_version(self, normalized_name):
+        """Версия данных региона, по которой он проиндексирован"""
+        region = self.regions.get(normalized_name)
+        return region.get('version') if region else None
+
+    def update_region(self, normalized_name, region_name_ru, species_index, version=None, save=True):
+        """Переиндексирует один регион по его индексу видов"""
+        old_species = set(self.regions.get(normalized_name, {}).get('species', []))
+
+        self.regions[normalized_name] = {
+            'name_ru': region_name_ru,
+            'version': version,
+            'species': list(species_index)
+        }
+
+        for species_key in old_species - set(species_index):
+            self._remove_species_region(species_key, normalized_name)
+
+        for species_key, entry in species_index.items():
+            species = self.species.setdefault(species_key, {'canonical_name': entry.get('canonical_name'), 'regions': {}})
+            species['regions'][normalized_name] = {
+                'count': entry['count'],
+                'first_year': entry.get('first_year'),
+                'last_year': entry.get('last_year'),
+                'bbox': entry.get('bbox')
+            }
+
+        if save:
+            self.save()
+
+    def remove_region(self, normalized_name, save=True):
+        """Убирает регион из индекса"""
+        region = self.regions.pop(normalized_name, None)
+        if region:
+            for species_key in region['species']:
+                self._remove_species_region(species_key, normalized_name)
+            if save:
+                self.save()
+
+    def _remove_species_region(self, species_key, normalized_name):
+        """Убирает регион у вида; вид, которого больше нигде нет, удаляется"""
+        species = self.species.get(species_key)
+        if species:
+            species['regions'].pop(normalized_name, None)
+            if not species['regions']:
+                del self.species[species_key]
+
+    def get_species_regions(self, species_key):
+        """Регионы вида со статистикой, по убыванию числа находок (пустой список - если вида нет)"""
+        species = self.species.get(species_key)
+        if not species:
+            return []
+
+        regions = []
+        for normalized_name, stats in species['regions'].items():
+            regions.append({
+                'normalized_name': normalized_name,
+                'region_name_ru': self.regions.get(normalized_name, {}).get('name_ru', normalized_name),
+                **stats
+            })
+        regions.sort(key=lambda region: -region['count'])
+        return regions
+
+    def get_canonical_name(self, species_key):
+        """Каноническое имя вида из индекса"""
+        species = self.species.get(species_key)
+        return species.get('canonical_name') if species else None
@@ -0,0 +1,169 @@
+import json
+import re
+import pandas as pd
+
+
+class TaxonomyFilter:
+    """Скомпилированные правила фильтрации таксонов"""
+
+    def __init__(self, rules_path="config/taxonomy_filters.json", max_cached_masks=32):
+        self.rules_path = rules_path
+        self.max_cached_masks = max_cached_masks
+        self._mask_cache = {}
+        self._compile_rules(self._load_rules())
+
+    def _load_rules(self):
+        """Загружает правила фильтрации из JSON файла"""
+        try:
+            with open(self.rules_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"❌ Ошибка загрузки правил фильтрации {self.rules_path}: {e}")
+            return {}
+
+    def _compile_rules(self, rules):
+        """Компилирует правила в множества и регулярные выражения (один раз)"""
+        self.exclude_classes = frozenset(rules.get('exclude_classes', []))
+        self.excluded_names = frozenset(name.lower() for name in rules.get('excluded_names', []))
+        self.uninformative_classes_ru = frozenset(rules.get('uninformative_classes_ru', []))
+
+        self.worm_or_insect_pattern = self._compile_substrings(
+            rules.get('worm_indicators', []) + rules.get('insect_indicators', []))
+        self.uninformative_pattern = self._compile_substrings(rules.get('uninformative_indicators', []))
+        self.uninformative_class_pattern = self._compile_substrings(self.uninformative_classes_ru)
+
+        endings = sorted(set(rules.get('species_endings', [])), key=len, reverse=True)
+        self.species_ending_pattern = re.compile(
+            '(?:' + '|'.join(re.escape(ending) for ending in endings) + ')$') if endings else None
+
+    @staticmethod
+    def _compile_substrings(substrings):
+        """Собирает список подстрок в одно регулярное выражение-автомат"""
+        words = sorted(set(word.lower() for word in substrings if word), key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile('|'.join(re.escape(word) for word in words))
+
+    # Проверки для отдельных записей
+
+    def is_worm_or_insect(self, animal):
+        """Проверяет запись на червей, насекомых и другие неинтересные группы"""
+        if self.worm_or_insect_pattern is None:
+            return False
+
+        for field in ['scientific_name', 'common_name', 'phylum', 'class']:
+            value = (animal.get(field) or '').lower()
+            if self.worm_or_insect_pattern.search(value):
+                return True
+
+        return False
+
+    def is_uninformative(self, animal):
+        """Проверяет, является ли животное неинформативным"""
+        animal_class = (animal.get('class_ru') or '').lower()
+        if self.uninformative_class_pattern and self.uninformative_class_pattern.search(animal_class):
+            return True
+
+        scientific_name = (animal.get('scientific_name') or '').lower()
+        return bool(self.uninformative_pattern and self.uninformative_pattern.search(scientific_name))
+
+    def is_informative_record(self, animal):
+        """Проверяет, является ли запись конкретным видом, а не классом"""
+        scientific_name = (animal.get('scientific_name') or '').lower()
+
+        if not scientific_name or scientific_name in self.excluded_names:
+            return False
+
+        if ' ' in scientific_name:
+            return True
+
+        return bool(self.species_ending_pattern and self.species_ending_pattern.search(scientific_name))
+
+    # Векторные проверки по колонкам DataFrame
+
+    @staticmethod
+    def _lower_column(df, column):
+        """Возвращает колонку в нижнем регистре (пустая строка для пропусков)"""
+        if column not in df.columns:
+            return pd.Series('', index=df.index, dtype=object)
+        return df[column].fillna('').astype(str).str.lower()
+
+    @staticmethod
+    def _class_column(df):
+        """Колонка класса: class_ru, а при его отсутствии - class"""
+        fallback = df['class'] if 'class' in df.columns else pd.Series('Не указано', index=df.index)
+        if 'class_ru' not in df.columns:
+            return fallback.fillna('Не указано')
+        return df['class_ru'].where(df['class_ru'].notna(), fallback).fillna('Не указано')
+
+    def informative_mask(self, df):
+        """Векторная версия is_informative_record"""
+        names = self._lower_column(df, 'scientific_name')
+        mask = (names != '') & ~names.isin(self.excluded_names)
+
+        looks_like_species = names.str.contains(' ', regex=False)
+        if self.species_ending_pattern is not None:
+            looks_like_species |= names.str.contains(self.species_ending_pattern)
+
+        return mask & looks_like_species
+
+    def worm_or_insect_mask(self, df):
+        """Векторная версия is_worm_or_insect"""
+        mask = pd.Series(False, index=df.index)
+        if self.worm_or_insect_pattern is None:
+            return mask
+
+        for field in ['scientific_name', 'common_name', 'phylum', 'class']:
+            mask |= self._lower_column(df, field).str.contains(self.worm_or_insect_pattern)
+        return mask
+
+    def uninformative_mask(self, df):
+        """Векторная версия is_uninformative"""
+        mask = pd.Series(False, index=df.index)
+        if self.uninformative_class_pattern is not None:
+            mask |= self._lower_column(df, 'class_ru').str.contains(self.uninformative_class_pattern)
+        if self.uninformative_pattern is not None:
+            mask |= self._lower_column(df, 'scientific_name').str.contains(self.uninformative_pattern)
+        return mask
+
+    def filter_mask(self, df, min_count=1, exclude_classes=None):
+        """Маска записей, прошедших фильтрацию filter_animals_data"""
+        exclude = self.exclude_classes if exclude_classes is None else frozenset(exclude_classes)
+
+        species = df['scientific_name'] if 'scientific_name' in df.columns else pd.Series(None, index=df.index)
+        has_species = species.notna() & (species != '') & (species != 'Не указано')
+
+        # Количество находок каждого вида (по ключу канонического имени, если он есть)
+        species_key = df['name_key'].fillna(species) if 'name_key' in df.columns else species
+        species_counts = species_key[has_species].value_counts()
+        enough_records = species_key.map(species_counts).fillna(0) >= min_count
+
+        allowed_class = ~self._class_column(df).isin(exclude)
+
+        return has_species & enough_records & allowed_class & self.informative_mask(df)
+
+    def filter_records(self, animals, min_count=1, exclude_classes=None, data_version=None):
+        """Фильтрует список записей, кэшируя маску по версии данных.
+
+        data_version должна меняться при любом изменении записей - в том числе добавленных
+        из других источников (локальной базы); без версии маска не кэшируется.
+        """
+        if not animals:
+            return []
+
+        cache_key = None
+        if data_version is not None:
+            exclude_key = None if exclude_classes is None else frozenset(exclude_classes)
+            cache_key = (data_version, len(animals), min_count, exclude_key)
+            cached_mask = self._mask_cache.get(cache_key)
+            if cached_mask is not None:
+                return [animal for animal, keep in zip(animals, cached_mask) if keep]
+
+        mask = self.filter_mask(pd.DataFrame(animals), min_count, exclude_classes).to_numpy(dtype=bool)
+
+        if cache_key is not None:
+            if len(self._mask_cache) >= self.max_cached_masks:
+                self._mask_cache.clear()
+            self._mask_cache[cache_key] = mask
+
+        return [animal for animal, keep in zip(animals, mask) if keep]
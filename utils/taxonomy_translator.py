@@ -1,202 +1,291 @@
 import requests
-import json
+import pandas as pd
 import os
-from datetime import datetime, timedelta
-from utils.russian_animals_db import RussianAnimalsDB
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from utils.name_lookup import get_name_lookup
+from utils.backbone_index import BackboneIndex
+from utils.lineage_resolver import LineageResolver
+from utils.write_behind import WriteBehindJSONStore
+from utils.metrics import resolution_metrics
 
 
 class TaxonomyTranslator:
-    def __init__(self, cache_dir="data/cache"):
+    # Ранги, переводимые в поля *_ru
+    TAXON_FIELDS = ['phylum', 'class', 'order', 'family', 'genus', 'species']
+
+    # Увеличивается при изменении логики перевода
+    TRANSLATION_SCHEMA = 2
+
+    def __init__(self, cache_dir="data/cache", backbone_path="data/backbone/backbone.sqlite", offline=False):
         self.cache_dir = cache_dir
         self.translations_cache = os.path.join(cache_dir, "taxonomy_translations.json")
-        self.animals_db = RussianAnimalsDB()  # Добавляем базу данных
+        self.names = get_name_lookup()  # Общая таблица названий (базовый словарь + локальная база)
+        self.backbone = BackboneIndex(backbone_path)  # Локальный индекс GBIF Backbone (если импортирован)
+        self.offline = offline  # Без обращений к API
+        self.lineage = LineageResolver(cache_dir, backbone=self.backbone, offline=offline)  # Родословные по speciesKey
         os.makedirs(cache_dir, exist_ok=True)
         self._load_translations()
 
-        # Базовый словарь переводов для основных таксонов
-        self.base_translations = {
-            # Типы (Phylum)
-            "Chordata": "Хордовые",
-            "Arthropoda": "Членистоногие",
-            "Mollusca": "Моллюски",
-            "Annelida": "Кольчатые черви",
-            "Cnidaria": "Стрекающие",
-            "Echinodermata": "Иглокожие",
-
-            # Классы (Class)
-            "Mammalia": "Млекопитающие",
-            "Aves": "Птицы",
-            "Reptilia": "Пресмыкающиеся",
-            "Amphibia": "Земноводные",
-            "Actinopterygii": "Костные рыбы",
-            "Chondrichthyes": "Хрящевые рыбы",
-            "Agnatha": "Бесчелюстные",
-            "Insecta": "Насекомые",
-            "Arachnida": "Паукообразные",
-            "Myriapoda": "Многоножки",
-            "Crustacea": "Ракообразные",
-            "Gastropoda": "Брюхоногие",
-            "Bivalvia": "Двустворчатые",
-            "Cephalopoda": "Головоногие",
-            "Anthozoa": "Коралловые полипы",
-            "Hydrozoa": "Гидроидные",
-            "Demospongiae": "Обыкновенные губки",
-            "Branchiopoda": "Жаброногие",
-            "Crocodylia": "Крокодилы",
-            "Squamata": "Чешуйчатые",
-            "Testudines": "Черепахи",
-            "Amphibia": "Земноводные",
-            "Reptilia": "Пресмыкающиеся",
-            "Actinopterygii": "Костные рыбы",
-            "Chondrichthyes": "Хрящевые рыбы",
-
-            # Уберем дублирование
-            "Амфибии": "Земноводные",
-            "Рептилии": "Пресмыкающиеся",
-
-            # Отряды (Order) - Птицы
-            "Passeriformes": "Воробьинообразные",
-            "Falconiformes": "Соколообразные",
-            "Strigiformes": "Совообразные",
-            "Anseriformes": "Гусеобразные",
-            "Galliformes": "Курообразные",
-            "Charadriiformes": "Ржанкообразные",
-            "Columbiformes": "Голубеобразные",
-            "Piciformes": "Дятлообразные",
-            "Coraciiformes": "Ракшеобразные",
-
-            # Отряды (Order) - Млекопитающие
-            "Carnivora": "Хищные",
-            "Rodentia": "Грызуны",
-            "Lagomorpha": "Зайцеобразные",
-            "Artiodactyla": "Парнокопытные",
-            "Chiroptera": "Рукокрылые",
-            "Eulipotyphla": "Насекомоядные",
-
-            # Семейства (Family) - примеры
-            "Passeridae": "Воробьиные",
-            "Paridae": "Синицевые",
-            "Corvidae": "Врановые",
-            "Accipitridae": "Ястребиные",
-            "Falconidae": "Соколиные",
-            "Anatidae": "Утиные",
-            "Phasianidae": "Фазановые",
-            "Scolopacidae": "Бекасовые",
-            "Laridae": "Чайковые",
-            "Strigidae": "Настоящие совы",
-            "Mustelidae": "Куньи",
-            "Canidae": "Псовые",
-            "Felidae": "Кошачьи",
-            "Ursidae": "Медвежьи",
-            "Cervidae": "Оленевые",
-            "Leporidae": "Заячьи",
-            "Sciuridae": "Беличьи",
-            "Muridae": "Мышиные",
-
-            # Русские названия животных
-            "Vulpes vulpes": "Обыкновенная лисица",
-            "Lepus timidus": "Заяц-беляк",
-            "Alces alces": "Лось",
-            "Capreolus pygargus": "Косуля",
-            "Sciurus vulgaris": "Обыкновенная белка",
-            "Ursus arctos": "Бурый медведь",
-            "Canis lupus": "Волк",
-            "Lynx lynx": "Рысь",
-            "Martes zibellina": "Соболь",
-            "Parus major": "Большая синица",
-            "Garrulus glandarius": "Сойка",
-            "Pica pica": "Сорока",
-            "Dendrocopos major": "Большой пёстрый дятел",
-            "Regulus regulus": "Королёк",
-            "Strix uralensis": "Длиннохвостая неясыть",
-            "Milvus migrans": "Чёрный коршун",
-            "Dryocopus martius": "Желна",
-            "Bombycilla garrulus": "Свиристель",
-            "Hyla arborea": "Обыкновенная квакша",
-            "Rana temporaria": "Травяная лягушка",
-            "Emberiza pallasi": "Овсянка Палласа",
-            "Motacilla alba": "Белая трясогузка",
-            "Fringilla coelebs": "Зяблик",
-            "Podiceps cristatus": "Большая поганка",
-            "Chroicocephalus ridibundus": "Озёрная чайка",
-            "Ovis nivicola": "Снежный баран",
-            "Rangifer tarandus": "Северный олень",
-            "Capreolus pygargus": "Сибирская косуля",
-            "Lepus mandshuricus": "Маньчжурский заяц",
-            "Urocitellus undulatus": "Длиннохвостый суслик",
-            "Mustela sibirica": "Сибирская колонка",
-            "Panthera tigris altaica": "Амурский тигр",
-            "Eutamias sibiricus": "Азиатский бурундук",
-            "Meles leucurus": "Азиатский барсук",
-            "Ondatra zibethicus": "Ондатра",
-            "Ursus thibetanus ussuricus": "Гималайский медведь",
-            "Pteromys volans": "Обыкновенная летяга",
-            "Ochotona hyperborea": "Северная пищуха",
-            "Myopus schisticolor": "Лесной лемминг",
-            "Sorex caecutiens": "Средняя бурозубка",
-            "Lynx lynx stroganovi": "Амурская рысь",
-            "Alexandromys maximowiczii": "Полёвка Максимовича",
-            "Craseomys rufocanus": "Красно-серая полёвка",
-            "Clethrionomys rutilus": "Красная полёвка",
-            "Apodemus peninsulae": "Корейская мышь",
-            "Sorex isodon": "Равнозубая бурозубка",
-            "Myodes rutilus": "Красная полёвка",
-            "Myodes rufocanus": "Красно-серая полёвка",
-            "Tamias sibiricus": "Азиатский бурундук",
-            "Alticola lemminus": "Лемминговая полёвка",
-            "Microtus mongolicus": "Монгольская полёвка",
-            "Microtus maximowiczii": "Полёвка Максимовича",
-            "Plecotus ognevi": "Сибирский ушан",
-            "Phalacrocorax carbo": "Большой баклан"
-        }
+    @property
+    def translation_version(self):
+        """Версия таблицы переводов (меняется при изменении таблицы названий, backbone или схемы)"""
+        table = f"names:{self.names.version}"
+        if self.backbone.available:
+            # Новый импорт backbone тоже меняет переводы
+            table += f"|backbone:{os.path.getmtime(self.backbone.db_path)}"
+        digest = hashlib.md5(table.encode('utf-8')).hexdigest()[:12]
+        return f"{self.TRANSLATION_SCHEMA}-{digest}"
 
     def _load_translations(self):
-        """Загружает кэш переводов"""
-        try:
-            with open(self.translations_cache, 'r', encoding='utf-8') as f:
-                self.translations = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.translations = {}
+        """Загружает кэш переводов (запись на диск - отложенная, пачками)"""
+        self._translations_store = WriteBehindJSONStore(self.translations_cache)
+        self.translations = self._translations_store.data
 
     def _save_translations(self):
-        """Сохраняет кэш переводов"""
-        try:
-            with open(self.translations_cache, 'w', encoding='utf-8') as f:
-                json.dump(self.translations, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"❌ Ошибка сохранения переводов: {e}")
+        """Сохраняет накопленные изменения кэша переводов"""
+        self._translations_store.flush()
 
     def translate_taxon(self, taxon_name, taxon_rank):
         """Переводит таксон на русский язык"""
+        translation = self._lookup_translation(taxon_name, taxon_rank)
+        if translation is not None:
+            return translation
+
+        # Ищем перевод через API
+        translation = self._translate_via_api(taxon_name, taxon_rank)
+        if translation is None:
+            # API не спрашивали или он не ответил - не кэшируем, иначе онлайн-запуск не найдет перевод
+            return taxon_name
+
+        # Сохраняем в кэш (на диск попадет со следующей пачкой)
+        self._cache_translation(taxon_name, taxon_rank, translation)
+
+        return translation
+
+    def _lookup_translation(self, taxon_name, taxon_rank):
+        """Ищет перевод без обращения к API (None - если нужен запрос)"""
         if not taxon_name or taxon_name in ['Не указано', 'Unknown']:
             return 'Не указано'
 
-        # Проверяем базовый словарь
-        if taxon_name in self.base_translations:
-            return self.base_translations[taxon_name]
+        # Проверяем общую таблицу названий
+        started = time.perf_counter()
+        translation = self.names.get(taxon_name)
+        resolution_metrics.record_lookup('names_table', started, translation)
+        if translation:
+            return translation
+
+        # Проверяем локальный индекс backbone
+        if self.backbone.available:
+            started = time.perf_counter()
+            translation = self.backbone.translate(taxon_name, taxon_rank)
+            resolution_metrics.record_lookup('backbone', started, translation)
+            if translation:
+                return translation
 
         # Проверяем кэш
+        started = time.perf_counter()
         cache_key = f"{taxon_rank}_{taxon_name}"
-        if cache_key in self.translations:
-            cached = self.translations[cache_key]
-            # Проверяем не устарел ли кэш (30 дней)
-            if datetime.now().timestamp() - cached.get('timestamp', 0) < 30 * 24 * 3600:
-                return cached['translation']
+        cached = self.translations.get(cache_key)
+        # Проверяем не устарел ли кэш (30 дней)
+        fresh = cached is not None and datetime.now().timestamp() - cached.get('timestamp', 0) < 30 * 24 * 3600
+        resolution_metrics.record_lookup('translation_cache', started, fresh)
+        if fresh:
+            return cached['translation']
 
-        # Ищем перевод через API
-        translation = self._translate_via_api(taxon_name, taxon_rank)
+        return None
 
-        # Сохраняем в кэш
-        self.translations[cache_key] = {
+    def _cache_translation(self, taxon_name, taxon_rank, translation):
+        """Сохраняет перевод в кэш (в памяти)"""
+        self._translations_store.set(f"{taxon_rank}_{taxon_name}", {
             'translation': translation,
             'timestamp': datetime.now().timestamp()
-        }
-        self._save_translations()
+        })
 
-        return translation
+    def _lineage_translation(self, lineage, taxon_rank, taxon_name):
+        """Перевод таксона по родословной вида (None - если родословная его не содержит)"""
+        started = time.perf_counter()
+        translation = self.names.get(taxon_name)
+        resolution_metrics.record_lookup('names_table', started, translation)
+        if translation:
+            return translation
+
+        entry = lineage.get(taxon_rank) if lineage else None
+        if not entry or entry.get('name') != taxon_name or entry.get('name_ru') is None:
+            # Нет родословной или русское название узнать не удалось - переводим по названию
+            resolution_metrics.miss('lineage')
+            return None
+        resolution_metrics.hit('lineage')
+        return entry['name_ru'] or taxon_name
+
+    def _translate_records(self, records, fields, max_workers=8, unresolved=None):
+        """Переводы таксонов каждой записи: по родословной вида, а без нее - по названию
+
+        В unresolved (если передан) добавляются пары (ранг, название), оставшиеся без ответа.
+        """
+        lineages = self.lineage.resolve([animal.get('speciesKey') for animal in records], max_workers=max_workers)
+
+        record_translations = []
+        taxa = set()
+        for animal in records:
+            lineage = lineages.get(self.lineage.to_key(animal.get('speciesKey')))
+            translations = {}
+            for field in fields:
+                value = animal.get(field)
+                if not value:
+                    continue
+                translations[field] = self._lineage_translation(lineage, field, value)
+                if translations[field] is None:
+                    taxa.add((field, value))
+            record_translations.append(translations)
+
+        # Таксоны без родословной переводим по названию, каждый различный - один раз
+        by_name = self.resolve_taxa(taxa, max_workers=max_workers, unresolved=unresolved)
+
+        return [{f'{field}_ru': by_name[(field, animal[field])] if translation is None else translation
+                 for field, translation in translations.items()}
+                for animal, translations in zip(records, record_translations)]
+
+    def resolve_taxa(self, taxa, max_workers=8, unresolved=None):
+        """Переводит набор различных пар (ранг, название): кэш сразу, промахи - параллельно через API
+
+        Таксоны без ответа (офлайн-режим, ошибка API) получают латинское название и добавляются в unresolved.
+        """
+        resolved = {}
+        misses = []
+        for taxon_rank, taxon_name in set(taxa):
+            translation = self._lookup_translation(taxon_name, taxon_rank)
+            if translation is None:
+                misses.append((taxon_rank, taxon_name))
+            else:
+                resolved[(taxon_rank, taxon_name)] = translation
+
+        if misses and self.offline:
+            # Без API промахи остаются латинскими названиями и не кэшируются
+            resolved.update({(taxon_rank, taxon_name): taxon_name for taxon_rank, taxon_name in misses})
+            if unresolved is not None:
+                unresolved.update(misses)
+        elif misses:
+            print(f"🌐 Запрашиваем переводы {len(misses)} таксонов через API...")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self._translate_via_api, taxon_name, taxon_rank): (taxon_rank, taxon_name)
+                           for taxon_rank, taxon_name in misses}
+                for future in as_completed(futures):
+                    taxon_rank, taxon_name = futures[future]
+                    translation = future.result()
+                    if translation is None:
+                        # API не ответил: латинское название без записи в кэш
+                        resolved[(taxon_rank, taxon_name)] = taxon_name
+                        if unresolved is not None:
+                            unresolved.add((taxon_rank, taxon_name))
+                        continue
+                    resolved[(taxon_rank, taxon_name)] = translation
+                    self._cache_translation(taxon_name, taxon_rank, translation)
+
+            # Кэш сохраняется один раз на весь набор
+            self._save_translations()
+
+        return resolved
+
+    def translate_dataset(self, records, max_workers=8, unresolved=None):
+        """Переводит набор записей (список словарей или DataFrame) за один проход по различным таксонам
+
+        В unresolved (если передан) добавляются таксоны, оставшиеся латинскими из-за недоступности API.
+        """
+        is_frame = hasattr(records, 'columns')
+        fields = [field for field in self.TAXON_FIELDS if not is_frame or field in records.columns]
+
+        if is_frame:
+            # Переводим различные сочетания (вид, таксоны) и проецируем обратно по ключу
+            key_columns = [column for column in ['speciesKey'] if column in records.columns] + fields
+            distinct = records[key_columns].drop_duplicates()
+            distinct_records = distinct.astype(object).where(distinct.notna(), None).to_dict('records')
+            translations = pd.DataFrame(self._translate_records(distinct_records, fields, max_workers=max_workers,
+                                                                unresolved=unresolved),
+                                        index=distinct.index)
+
+            translated = records.copy()
+            mapped = records[key_columns].merge(pd.concat([distinct, translations], axis=1),
+                                                on=key_columns, how='left')
+            mapped.index = records.index
+            for field in fields:
+                column = f'{field}_ru'
+                if column not in mapped.columns:
+                    continue
+                values = mapped[column]
+                if column in translated.columns:
+                    values = values.fillna(translated[column])
+                translated[column] = values
+            return translated
+
+        record_unresolved = set()
+        translations = self._translate_records(records, fields, max_workers=max_workers, unresolved=record_unresolved)
+        if unresolved is not None:
+            unresolved.update(record_unresolved)
+        common_names = self._resolve_common_names(records)
+        stamps = self._record_stamps(records)
+        translated_records = []
+        for animal, taxon_translations, stamp in zip(records, translations, stamps):
+            translated = {**animal, **taxon_translations}
+            if not self._has_unresolved(animal, record_unresolved):
+                translated['translation_stamp'] = stamp
+
+            common_name = common_names.get(translated.get('scientific_name'))
+            if common_name and (not translated.get('common_name') or translated.get('common_name') == 'Не указано'):
+                translated['common_name'] = common_name
+                translated['name_source'] = 'local_db'
+
+            translated_records.append(translated)
+
+        return translated_records
+
+    def _record_stamps(self, records):
+        """Отпечатки записей: схема перевода и ответы локальных источников (таблица названий, backbone)
+        для таксонов записи. Отпечаток меняется, только если изменился источник ее собственных таксонов."""
+        answers = {}
+        stamps = []
+        for animal in records:
+            parts = [str(self.TRANSLATION_SCHEMA)]
+            taxa = [(field, animal.get(field)) for field in self.TAXON_FIELDS if animal.get(field)]
+            taxa.append(('common_name', animal.get('scientific_name')))
+            for taxon in taxa:
+                answer = answers.get(taxon)
+                if answer is None:
+                    answer = answers[taxon] = repr(self._source_answer(*taxon))
+                parts.append(f"{taxon[0]}={taxon[1]}:{answer}")
+            stamps.append(hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()[:12])
+        return stamps
+
+    def _source_answer(self, taxon_rank, taxon_name):
+        """Ответ локальных источников для таксона (без кэша переводов и API)"""
+        if taxon_rank == 'common_name':
+            return self.names.get_common_name(taxon_name) if taxon_name else None
+        backbone = self.backbone.translate(taxon_name, taxon_rank) if self.backbone.available else None
+        return self.names.get(taxon_name), backbone
+
+    def _has_unresolved(self, animal, unresolved):
+        """Остался ли какой-то таксон записи без ответа"""
+        return any((field, animal.get(field)) in unresolved for field in self.TAXON_FIELDS)
+
+    def _resolve_common_names(self, records):
+        """Ищет русские названия в локальной базе для различных видов без названия"""
+        common_names = {}
+        for animal in records:
+            scientific_name = animal.get('scientific_name')
+            if scientific_name and scientific_name not in common_names and \
+                    (not animal.get('common_name') or animal.get('common_name') == 'Не указано'):
+                started = time.perf_counter()
+                common_names[scientific_name] = self.names.get_common_name(scientific_name)
+                resolution_metrics.record_lookup('local_db', started, common_names[scientific_name])
+        return common_names
 
     def _translate_via_api(self, taxon_name, taxon_rank):
-        """Переводит таксон через API GBIF и другие источники"""
+        """Переводит таксон через API GBIF и другие источники (None - API не спрашивали или он не ответил)"""
+        if self.offline:
+            return None
+
         # Сначала пробуем GBIF API для получения русских названий
         try:
             # Ищем таксон в GBIF
@@ -205,50 +294,77 @@ class TaxonomyTranslator:
                 'q': taxon_name,
                 'limit': 1
             }
-            response = requests.get(search_url, params=params, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                if data['results']:
-                    species_key = data['results'][0]['key']
-
-                    # Получаем vernacular names
-                    vern_url = f"https://api.gbif.org/v1/species/{species_key}/vernacularNames"
-                    vern_response = requests.get(vern_url, timeout=10)
-                    if vern_response.status_code == 200:
-                        vern_data = vern_response.json()
-                        for vern in vern_data.get('results', []):
-                            if vern.get('language') == 'rus':
-                                return vern.get('vernacularName')
-        except:
-            pass
+            response = resolution_metrics.api_get('api_name_search', search_url, params=params, timeout=10)
+            if response.status_code != 200:
+                resolution_metrics.count('api_name_search', 'api_errors')
+                return None
+            data = response.json()
+            if data['results']:
+                species_key = data['results'][0]['key']
+
+                # Получаем vernacular names
+                vern_url = f"https://api.gbif.org/v1/species/{species_key}/vernacularNames"
+                vern_response = resolution_metrics.api_get('api_name_search', vern_url, timeout=10)
+                if vern_response.status_code != 200:
+                    resolution_metrics.count('api_name_search', 'api_errors')
+                    return None
+                vern_data = vern_response.json()
+                for vern in vern_data.get('results', []):
+                    if vern.get('language') == 'rus':
+                        resolution_metrics.hit('api_name_search')
+                        return vern.get('vernacularName')
+        except requests.RequestException:
+            return None  # Уже учтено в api_errors
+        except (ValueError, KeyError, TypeError) as e:
+            resolution_metrics.error('api_name_search', e)
+            return None
 
         # Если не нашли через GBIF, возвращаем оригинальное название
+        resolution_metrics.miss('api_name_search')
         return taxon_name
 
-    def translate_animal_data(self, animal_data):
-        """Переводит все таксоны в данных о животном с улучшением названий"""
-        translated = animal_data.copy()
-
-        # Переводим основные таксоны
-        taxon_fields = {
-            'phylum': 'phylum',
-            'class': 'class',
-            'order': 'order',
-            'family': 'family',
-            'genus': 'genus',
-            'species': 'species'
-        }
-
-        for field, rank in taxon_fields.items():
-            if field in translated and translated[field]:
-                translated[f'{field}_ru'] = self.translate_taxon(translated[field], rank)
-
-        # Улучшаем русское название через базу данных
-        scientific_name = translated.get('scientific_name')
-        if scientific_name and (not translated.get('common_name') or translated.get('common_name') == 'Не указано'):
-            common_name = self.animals_db.get_common_name(scientific_name)
-            if common_name:
-                translated['common_name'] = common_name
-                translated['name_source'] = 'local_db'
+    def retranslate_changed(self, records):
+        """Пересчитывает переводы только тех записей, у которых изменился источник их таксонов
+
+        Запись с текущим отпечатком (translation_stamp) не переводится заново. Возвращает (записи,
+        число измененных записей, число таксонов без ответа). Сохраненный русский перевод не заменяется
+        латинским названием.
+        """
+        stamps = self._record_stamps(records)
+        stale = [position for position, (animal, stamp) in enumerate(zip(records, stamps))
+                 if animal.get('translation_stamp') != stamp]
+        stale_records = [records[position] for position in stale]
+
+        # Каждый различный вид и таксон устаревших записей переводится один раз
+        unresolved = set()
+        translations = self._translate_records(stale_records, self.TAXON_FIELDS, unresolved=unresolved)
+        common_names = self._resolve_common_names(stale_records)
+
+        updated_records = list(records)
+        changed_count = 0
+        for position, animal, taxon_translations in zip(stale, stale_records, translations):
+            changes = {}
+            for field in self.TAXON_FIELDS:
+                column = f'{field}_ru'
+                translation = taxon_translations.get(column)
+                if translation is None or animal.get(column) == translation:
+                    continue
+                if translation == animal.get(field) and animal.get(column) not in (None, '', 'Не указано'):
+                    # Латинское название - не перевод: сохраненный русский остается
+                    continue
+                changes[column] = translation
+
+            common_name = common_names.get(animal.get('scientific_name'))
+            if common_name and (not animal.get('common_name') or animal.get('common_name') == 'Не указано'):
+                changes['common_name'] = common_name
+                changes['name_source'] = 'local_db'
+
+            # Запись с таксонами без ответа остается устаревшей - следующий запуск повторит ее перевод
+            if not self._has_unresolved(animal, unresolved):
+                changes['translation_stamp'] = stamps[position]
+
+            if changes:
+                updated_records[position] = {**animal, **changes}
+                changed_count += 1
 
-        return translated
\ No newline at end of file
+        return updated_records, changed_count, len(unresolved)
@@ -0,0 +1,180 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Изменения накапливаются в памяти и дописываются в журнал (path + '.log') пачкой:
+# по интервалу, по размеру пачки или при завершении интерпретатора. Когда журнал
+# разрастается, снимок перезаписывается атомарно (временный файл + os.replace).
+# При сбое теряется не больше последней несохраненной пачки.
+# Один файл могут вести несколько хранилищ (разные объекты, процессы пула, запуски CLI):
+# запись журнала и сжатие идут под файловой блокировкой (path + '.lock'), а сжатие
+# перечитывает снимок и журнал с диска, чтобы не потерять чужие записи.
+class WriteBehindJSONStore:
+    """Словарь с отложенной записью на диск: JSON-снимок + журнал изменений"""
+
+    def __init__(self, path, flush_interval=5.0, max_batch=200, compact_after=5000):
+        self.path = path
+        self.log_path = path + '.log'
+        self.lock_path = path + '.lock'
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.compact_after = compact_after
+
+        self._lock = threading.RLock()
+        self._dirty = {}
+        self._timer = None
+        self._log_entries = 0
+
+        self.data = self._load()
+        atexit.register(self.close)
+
+    @contextmanager
+    def _file_lock(self):
+        """Межпроцессная блокировка файла хранилища"""
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        with open(self.lock_path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load(self):
+        """Загружает снимок и применяет к нему журнал"""
+        data = {}
+        self._log_entries = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Поврежден файл {self.path}: {e}")
+
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная строка при сбое - пропускаем
+                        continue
+                    data[entry['k']] = entry['v']
+                    self._log_entries += 1
+        except FileNotFoundError:
+            pass
+
+        return data
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __len__(self):
+        return len(self.data)
+
+    def set(self, key, value):
+        """Записывает значение в память и планирует сохранение"""
+        with self._lock:
+            self.data[key] = value
+            self._dirty[key] = value
+
+            if len(self._dirty) >= self.max_batch:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def flush(self):
+        """Дописывает накопленные изменения в журнал"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._dirty:
+                return
+
+            try:
+                with self._file_lock():
+                    with open(self.log_path, 'a', encoding='utf-8') as f:
+                        for key, value in self._dirty.items():
+                            f.write(json.dumps({'k': key, 'v': value}, ensure_ascii=False) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                    self._log_entries += len(self._dirty)
+                    self._dirty = {}
+
+                    if self._log_entries >= self.compact_after:
+                        self._compact_locked()
+            except Exception as e:
+                print(f"❌ Ошибка записи журнала {self.log_path}: {e}")
+
+    def compact(self):
+        """Сохраняет изменения, атомарно перезаписывает снимок и очищает журнал"""
+        with self._lock:
+            self.flush()
+            try:
+                with self._file_lock():
+                    self._compact_locked()
+            except Exception as e:
+                print(f"❌ Ошибка блокировки {self.lock_path}: {e}")
+
+    def _compact_locked(self):
+        """Сжатие под файловой блокировкой: все несохраненные изменения уже в журнале"""
+        with self._lock:
+            # Снимок и журнал на диске содержат и наши, и чужие записи - сжимаем их, а не свою копию
+            merged = dict(self.data)
+            merged.update(self._load())
+            self.data.update(merged)
+            tmp_path = f"{self.path}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+
+                # Журнал уже отражен в снимке; повторное применение безопасно, поэтому очищаем после замены
+                if os.path.exists(self.log_path):
+                    os.remove(self.log_path)
+                self._log_entries = 0
+            except Exception as e:
+                print(f"❌ Ошибка сохранения {self.path}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def close(self):
+        """Сохраняет все изменения (вызывается при завершении интерпретатора)"""
+        with self._lock:
+            self.flush()
+            if self._log_entries:
+                self.compact()